@@ -1,5 +1,4 @@
-# Adicionar cabeçalho de licença ao arquivo principal
-HEADER='"
+"""
 OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
 
 Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
@@ -15,26 +14,23 @@ distributed under the License is distributed on an "AS IS" BASIS,
 WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
-"
-
-# Adicionar ao início do arquivo
-echo "$HEADER" | cat - src/OMNI.py > temp && mv temp src/OMNI.py
-
+"""
 
 import os
-import re
-import shutil
-import subprocess
 import time
-import numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
 from PIL import Image, ImageTk
 import threading
-import sys
-import glob
 import json
+import queue
+from array import array
+import logging
+from logging.handlers import RotatingFileHandler
+from omni_engine import (CalculationState, SweepEngine, ORDER_MODES, CHAIN_MODES, EXTRAPOLATION_MODES, FIELD_STATUSES, LAUNCHERS,
+                         SAMPLING_MODES, OBSERVABLES, FieldSet, build_warm_start_parents)
+from omni_batch import BATCH_BACKENDS
 try:
     from tkinter import font
     import sv_ttk  # Para temas modernos
@@ -42,38 +38,179 @@ except ImportError:
     sv_ttk = None
     print("sv_ttk não disponível para temas modernos")
     
-class CalculationState:
-    def __init__(self):
-        self.fdf_path = None
-        self.psf_files = []
-        self.fields = []
-        self.base_dir_name = "electric_field_calculations"
-        self.siesta_python_path = None
-        self.last_completed_index = -1
-        self.is_running = False
-        self.paused_for_fdf = False
-        self.last_dir = None
-        
-    def to_dict(self):
-        return {
-            "fdf_path": self.fdf_path,
-            "psf_files": self.psf_files,
-            "fields": self.fields,
-            "base_dir_name": self.base_dir_name,
-            "siesta_python_path": self.siesta_python_path,
-            "last_completed_index": self.last_completed_index
-        }
+LOG_FILE = "omni.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+LOG_MAX_LINES = 5000
+LOG_FLUSH_MS = 200
+FIELD_STATUS_REFRESH_MS = 500
+
+FIELD_STATUS_LABELS = {"pending": "Pendente", "running": "Executando", "done": "Concluído", "failed": "Falhou"}
+
+class FieldArray:
+    """Campos (x, y, z) guardados num array compacto de doubles, com um status por campo."""
+    def __init__(self, fields=()):
+        self.values = array('d')
+        self.status = bytearray()
+        self.extend(fields)
+
+    def __len__(self):
+        return len(self.status)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return list(self.values[3 * index:3 * index + 3])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, field):
+        self.values.extend(float(v) for v in field)
+        self.status.append(0)
+
+    def extend(self, fields):
+        for field in fields:
+            self.append(field)
+
+    def extend_array(self, fields):
+        """Acrescenta campos a partir de um FieldSet (em blocos) ou de uma lista."""
+        if not isinstance(fields, FieldSet):
+            self.extend(fields)
+            return
+        for chunk in fields.chunks():
+            self.values.frombytes(chunk.astype('float64').tobytes())
+            self.status.extend(bytes(len(chunk)))
+
+    def pop(self, index):
+        field = self[index]
+        del self.values[3 * index:3 * index + 3]
+        del self.status[index]
+        return field
+
+    def clear(self):
+        self.values = array('d')
+        self.status = bytearray()
+
+    def set_status(self, index, status):
+        if 0 <= index < len(self):
+            self.status[index] = FIELD_STATUSES.index(status)
+
+    def get_status(self, index):
+        return FIELD_STATUSES[self.status[index]]
+
+    def tolist(self):
+        return [list(self.values[i:i + 3]) for i in range(0, len(self.values), 3)]
 
-    @staticmethod
-    def from_dict(data):
-        state = CalculationState()
-        state.fdf_path = data.get("fdf_path")
-        state.psf_files = data.get("psf_files", [])
-        state.fields = data.get("fields", [])
-        state.base_dir_name = data.get("base_dir_name", "electric_field_calculations")
-        state.siesta_python_path = data.get("siesta_python_path")
-        state.last_completed_index = data.get("last_completed_index", -1)
-        return state
+class VirtualFieldTable:
+    """Treeview que materializa apenas as linhas visíveis de um ``FieldArray``.
+
+    A rolagem só troca os valores das linhas existentes; inserções e remoções
+    atualizam apenas as linhas da janela visível que mudaram.
+    """
+    columns = ("#", "X", "Y", "Z", "Status")
+
+    def __init__(self, parent, fields, height=10):
+        self.fields = fields
+        self.offset = 0
+        self.visible_rows = height
+        self.rows = []
+        self.rendered = []
+        self.selected = None
+
+        self.tree = ttk.Treeview(parent, columns=self.columns, show='headings', height=height,
+                                 selectmode='browse')
+        for col in self.columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=100, anchor='center')
+        self.scrollbar = ttk.Scrollbar(parent, orient='vertical', command=self.yview)
+
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<MouseWheel>', lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-1))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(1))
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+
+    def on_configure(self, event):
+        rowheight = int(ttk.Style().lookup('Treeview', 'rowheight') or 25)
+        rows = max(1, event.height // rowheight - 1)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.refresh()
+
+    def yview(self, *args):
+        total = len(self.fields)
+        if args[0] == 'moveto':
+            self.offset = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.offset += int(args[1]) * step
+        self.refresh()
+
+    def scroll(self, rows):
+        self.offset += rows * 3
+        self.refresh()
+        return "break"
+
+    def see(self, index):
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.visible_rows:
+            self.offset = index - self.visible_rows + 1
+        self.refresh()
+
+    def move_selection(self, step):
+        if self.selected is not None and len(self.fields):
+            self.selected = min(max(self.selected + step, 0), len(self.fields) - 1)
+            self.see(self.selected)
+        return "break"
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] in self.rows:
+            self.selected = self.offset + self.rows.index(selection[0])
+
+    def selected_index(self):
+        return self.selected if self.selected is not None and self.selected < len(self.fields) else None
+
+    def refresh(self):
+        total = len(self.fields)
+        self.offset = min(max(self.offset, 0), max(total - self.visible_rows, 0))
+        count = min(self.visible_rows, total - self.offset)
+
+        while len(self.rows) < count:
+            self.rows.append(self.tree.insert("", "end"))
+            self.rendered.append(None)
+        while len(self.rows) > count:
+            self.tree.delete(self.rows.pop())
+            self.rendered.pop()
+
+        for row, iid in enumerate(self.rows):
+            index = self.offset + row
+            x, y, z = self.fields[index]
+            values = (index + 1, x, y, z, FIELD_STATUS_LABELS[self.fields.get_status(index)])
+            if self.rendered[row] != values:
+                self.tree.item(iid, values=values)
+                self.rendered[row] = values
+
+        if self.selected is not None and self.offset <= self.selected < self.offset + count:
+            iid = self.rows[self.selected - self.offset]
+            if self.tree.selection() != (iid,):
+                self.tree.selection_set(iid)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+
+        if total:
+            self.scrollbar.set(self.offset / total, (self.offset + count) / total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
 class SiestaElectricFieldGUI:
     def __init__(self, root):
@@ -85,26 +222,62 @@ class SiestaElectricFieldGUI:
  
         # Configurar tema moderno (ADICIONE ESTA LINHA)
         self.setup_theme()
+        # Log: qualquer thread enfileira; a thread da interface descarrega em lotes
+        self.log_queue = queue.Queue()
+        # Diálogos pedidos pelas threads de trabalho; também executados em flush_log_queue.
+        self.ui_calls = queue.Queue()
+        # Campos do refinamento adaptativo, vindos da thread de execução.
+        self.added_fields_queue = queue.Queue()
+        self.file_logger = self.setup_file_logger(Path.cwd() / LOG_FILE)
+        
         # Variáveis de controle
-        self.state_file = Path.cwd() / "calculation_state.json"
+        self.engine = SweepEngine(Path.cwd(), log=self.log)
+        self.engine.ask_new_fdf = self.ask_new_fdf
+        self.engine.progress = self.update_prepare_progress
+        self.engine.field_status = self.set_field_status
+        self.engine.fields_added = self.added_fields_queue.put
+        self.prepare_progress = (0, 0)
+        self.prepare_thread = None
+        self.prepare_result = None
+        self.state_file = self.engine.state_file
         self.autostart_file = Path.cwd() / "autostart.cfg"
-        self.state = CalculationState()
         self.fdf_path = tk.StringVar()
         self.psf_files = []
-        self.fields = []
+        self.fields = FieldArray()
+        self.field_status_dirty = False
         self.base_dir_name = tk.StringVar(value="electric_field_calculations")
         self.siesta_python_path = tk.StringVar()
-        self.completed_file = "concluido.txt"
+        self.total_cores = tk.IntVar(value=1)
+        self.cores_per_job = tk.IntVar(value=1)
+        self.launcher = tk.StringVar(value=LAUNCHERS["plain"])
+        self.omp_threads = tk.IntVar(value=1)
+        self.pin_cpus = tk.BooleanVar(value=True)
+        self.scratch_dir = tk.StringVar()
+        self.batch_backend = tk.StringVar(value=BATCH_BACKENDS["local"])
+        self.chain_mode = tk.StringVar(value=CHAIN_MODES["blocks"])
+        self.field_order = tk.StringVar(value=ORDER_MODES["cartesian"])
+        self.reuse_dm = tk.BooleanVar(value=False)
+        self.result_cache = tk.BooleanVar(value=True)
+        self.extrapolation = tk.StringVar(value=EXTRAPOLATION_MODES["none"])
+        self.sampling_mode = tk.StringVar(value=SAMPLING_MODES["grid"])
+        self.sampling_magnitudes = tk.StringVar(value="0.1")
+        self.sampling_count = tk.IntVar(value=20)
+        self.sampling_seed = tk.IntVar(value=0)
+        self.field_set = None
+        self.adaptive_enabled = tk.BooleanVar(value=False)
+        self.adaptive_observable = tk.StringVar(value=OBSERVABLES["energy"])
+        self.adaptive_tolerance = tk.DoubleVar(value=0.01)
+        self.adaptive_min_step = tk.DoubleVar(value=0.001)
+        self.adaptive_max_rounds = tk.IntVar(value=4)
         self.current_dir = Path.cwd()
-        self.is_running = False
-        self.paused_for_fdf = False
-        self.last_dir = None
         
         # Configurar interface e tentar carregar o estado
         self.setup_ui()
         self.qrcode_tk = None  # Variável para a imagem do QR code
         self.check_for_siesta_py()
         self.root.after(100, self.load_state_on_start)
+        self.root.after(LOG_FLUSH_MS, self.flush_log_queue)
+        self.root.after(FIELD_STATUS_REFRESH_MS, self.refresh_field_status)
         
     def configure_styles(self):
         """Configura estilos manuais se sv_ttk não estiver disponível"""
@@ -411,9 +584,31 @@ class SiestaElectricFieldGUI:
         ttk.Entry(field_input_frame, textvariable=self.z_step, width=10).grid(row=3, column=3, padx=5, pady=8)
         ttk.Checkbutton(field_input_frame, variable=self.z_active).grid(row=3, column=4, padx=5, pady=8)
         
+        # Ordem de execução dos campos
+        ttk.Label(field_input_frame, text="Ordem:").grid(row=4, column=0, padx=5, pady=8)
+        ttk.Combobox(field_input_frame, textvariable=self.field_order, values=list(ORDER_MODES.values()),
+                     state='readonly', width=36).grid(row=4, column=1, columnspan=4, sticky='w', padx=5, pady=8)
+        
+        # Amostragem: grade usa início/fim/passo; esfera e círculo usam os módulos;
+        # hipercubo latino usa início/fim dos eixos ativos como limites
+        ttk.Label(field_input_frame, text="Amostragem:").grid(row=5, column=0, padx=5, pady=8)
+        ttk.Combobox(field_input_frame, textvariable=self.sampling_mode, values=list(SAMPLING_MODES.values()),
+                     state='readonly', width=36).grid(row=5, column=1, columnspan=4, sticky='w', padx=5, pady=8)
+        
+        sampling_frame = ttk.Frame(field_input_frame)
+        sampling_frame.grid(row=6, column=0, columnspan=5, sticky='w', padx=5, pady=4)
+        ttk.Label(sampling_frame, text="Módulos (V/Ang):").pack(side='left', padx=5)
+        ttk.Entry(sampling_frame, textvariable=self.sampling_magnitudes, width=18).pack(side='left', padx=5)
+        ttk.Label(sampling_frame, text="Pontos:").pack(side='left', padx=5)
+        ttk.Spinbox(sampling_frame, from_=1, to=1000000, textvariable=self.sampling_count,
+                    width=8).pack(side='left', padx=5)
+        ttk.Label(sampling_frame, text="Semente:").pack(side='left', padx=5)
+        ttk.Spinbox(sampling_frame, from_=0, to=999999, textvariable=self.sampling_seed,
+                    width=8).pack(side='left', padx=5)
+        
         # Botão para gerar campos
         ttk.Button(field_input_frame, text="Gerar Campos", command=self.generate_fields,
-                  style='Accent.TButton').grid(row=4, column=0, columnspan=5, pady=10)
+                  style='Accent.TButton').grid(row=7, column=0, columnspan=5, pady=10)
         
         # Lista de campos gerados
         field_list_frame = ttk.LabelFrame(parent, text="Campos Gerados", padding="10")
@@ -428,19 +623,12 @@ class SiestaElectricFieldGUI:
                         fieldbackground=self.colors['light'])
         style.map('Treeview', background=[('selected', self.colors['secondary'])])
         
-        columns = ("#", "X", "Y", "Z")
-        self.field_tree = ttk.Treeview(field_list_frame, columns=columns, show='headings', height=10)
-        
-        for col in columns:
-            self.field_tree.heading(col, text=col)
-            self.field_tree.column(col, width=100, anchor='center')
-        
-        # Adicionar scrollbar
-        tree_scrollbar = ttk.Scrollbar(field_list_frame, orient='vertical', command=self.field_tree.yview)
-        self.field_tree.configure(yscrollcommand=tree_scrollbar.set)
+        # Tabela virtual: só as linhas visíveis existem no Treeview
+        self.field_table = VirtualFieldTable(field_list_frame, self.fields, height=10)
+        self.field_tree = self.field_table.tree
         
         self.field_tree.pack(side='left', fill='both', expand=True, padx=(0, 5), pady=5)
-        tree_scrollbar.pack(side='right', fill='y', pady=5)
+        self.field_table.scrollbar.pack(side='right', fill='y', pady=5)
         
         # Botões para manipular campos
         field_btn_frame = ttk.Frame(field_list_frame)
@@ -471,6 +659,61 @@ class SiestaElectricFieldGUI:
                                                 borderwidth=0, highlightthickness=0)
         self.log_text.pack(fill='both', expand=True, padx=2, pady=2)
         
+        # Orçamento de núcleos para execução concorrente
+        resources_frame = ttk.LabelFrame(parent, text="Recursos", padding="10")
+        resources_frame.pack(fill='x', padx=5, pady=5)
+        
+        ttk.Label(resources_frame, text="Núcleos totais:").pack(side='left', padx=5)
+        ttk.Spinbox(resources_frame, from_=1, to=4096, textvariable=self.total_cores,
+                    width=6).pack(side='left', padx=5)
+        ttk.Label(resources_frame, text="Núcleos por cálculo:").pack(side='left', padx=5)
+        ttk.Spinbox(resources_frame, from_=1, to=4096, textvariable=self.cores_per_job,
+                    width=6).pack(side='left', padx=5)
+        ttk.Label(resources_frame, text="Lançador:").pack(side='left', padx=5)
+        ttk.Combobox(resources_frame, textvariable=self.launcher, values=list(LAUNCHERS.values()),
+                     state='readonly', width=22).pack(side='left', padx=5)
+        ttk.Label(resources_frame, text="Threads OpenMP (híbrido):").pack(side='left', padx=5)
+        ttk.Spinbox(resources_frame, from_=1, to=256, textvariable=self.omp_threads,
+                    width=4).pack(side='left', padx=5)
+        ttk.Checkbutton(resources_frame, text="Fixar núcleos por cálculo",
+                        variable=self.pin_cpus).pack(side='left', padx=10)
+        ttk.Label(resources_frame, text="Scratch local:").pack(side='left', padx=5)
+        ttk.Entry(resources_frame, textvariable=self.scratch_dir, width=18).pack(side='left', padx=5)
+        ttk.Label(resources_frame, text="Execução:").pack(side='left', padx=5)
+        ttk.Combobox(resources_frame, textvariable=self.batch_backend, values=list(BATCH_BACKENDS.values()),
+                     state='readonly', width=24).pack(side='left', padx=5)
+        ttk.Checkbutton(resources_frame, text="Reaproveitar cálculos idênticos (cache de resultados)",
+                        variable=self.result_cache).pack(side='left', padx=10)
+        
+        # Como cada campo herda o resultado do campo anterior
+        warm_start_frame = ttk.LabelFrame(parent, text="Continuação entre campos", padding="10")
+        warm_start_frame.pack(fill='x', padx=5, pady=5)
+        
+        ttk.Label(warm_start_frame, text="Encadeamento:").pack(side='left', padx=5)
+        ttk.Combobox(warm_start_frame, textvariable=self.chain_mode, values=list(CHAIN_MODES.values()),
+                     state='readonly', width=32).pack(side='left', padx=5)
+        ttk.Checkbutton(warm_start_frame, text="Reutilizar matriz densidade (.DM) do campo anterior",
+                        variable=self.reuse_dm).pack(side='left', padx=10)
+        ttk.Label(warm_start_frame, text="Extrapolação da geometria:").pack(side='left', padx=5)
+        ttk.Combobox(warm_start_frame, textvariable=self.extrapolation, values=list(EXTRAPOLATION_MODES.values()),
+                     state='readonly', width=22).pack(side='left', padx=5)
+        
+        # Refinamento adaptativo: novos campos onde a resposta não é linear
+        adaptive_frame = ttk.LabelFrame(parent, text="Refinamento adaptativo", padding="10")
+        adaptive_frame.pack(fill='x', padx=5, pady=5)
+        
+        ttk.Checkbutton(adaptive_frame, text="Ativar", variable=self.adaptive_enabled).pack(side='left', padx=5)
+        ttk.Label(adaptive_frame, text="Observável:").pack(side='left', padx=5)
+        ttk.Combobox(adaptive_frame, textvariable=self.adaptive_observable, values=list(OBSERVABLES.values()),
+                     state='readonly', width=24).pack(side='left', padx=5)
+        ttk.Label(adaptive_frame, text="Tolerância:").pack(side='left', padx=5)
+        ttk.Entry(adaptive_frame, textvariable=self.adaptive_tolerance, width=8).pack(side='left', padx=5)
+        ttk.Label(adaptive_frame, text="Passo mínimo (V/Ang):").pack(side='left', padx=5)
+        ttk.Entry(adaptive_frame, textvariable=self.adaptive_min_step, width=8).pack(side='left', padx=5)
+        ttk.Label(adaptive_frame, text="Rodadas:").pack(side='left', padx=5)
+        ttk.Spinbox(adaptive_frame, from_=1, to=20, textvariable=self.adaptive_max_rounds,
+                    width=4).pack(side='left', padx=5)
+        
         # Botões de execução com estilo moderno
         btn_frame = ttk.Frame(parent)
         btn_frame.pack(pady=10)
@@ -482,6 +725,15 @@ class SiestaElectricFieldGUI:
         ttk.Button(btn_frame, text="Parar Execução", command=self.stop_execution,
                   style='Warning.TButton').pack(side='left', padx=5)
         ttk.Button(btn_frame, text="Tornar Inicial", command=self.set_autostart).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="Coletar Resultados", command=self.harvest_results).pack(side='left', padx=5)
+        
+        # Progresso da preparação das pastas (atualizado pela thread da interface)
+        progress_frame = ttk.Frame(parent)
+        progress_frame.pack(fill='x', padx=5)
+        self.prepare_progressbar = ttk.Progressbar(progress_frame, mode='determinate')
+        self.prepare_progressbar.pack(side='left', fill='x', expand=True, padx=5)
+        self.prepare_progress_label = ttk.Label(progress_frame, text="", width=18)
+        self.prepare_progress_label.pack(side='left', padx=5)
 
     def load_state_on_start(self):
         if self.autostart_file.exists() or self.state_file.exists():
@@ -492,11 +744,10 @@ class SiestaElectricFieldGUI:
 
             if self.state_file.exists():
                 try:
-                    with open(self.state_file, 'r') as f:
-                        data = json.load(f)
-                        self.state = CalculationState.from_dict(data)
+                    self.engine.load_state()
+                    state = self.engine.state
                     
-                    if self.state.last_completed_index < len(self.state.fields) - 1:
+                    if any(not state.is_completed(i) for i in range(len(state.fields))):
                         if self.autostart_file.exists() or messagebox.askyesno("Retomar Cálculo", "Um cálculo anterior foi interrompido. Deseja continuar de onde parou?"):
                             self.log("Estado de cálculo restaurado. Iniciando a partir do último ponto salvo.")
                             self.restore_gui_from_state()
@@ -505,30 +756,85 @@ class SiestaElectricFieldGUI:
                                 self.run_calculations()
                         else:
                             self.log("Cálculo anterior não será retomado. Iniciando um novo.")
-                            self.state = CalculationState()
-                            self.state_file.unlink()
+                            self.engine.clear_state()
+                            self.engine.state = CalculationState()
                 except (IOError, json.JSONDecodeError) as e:
                     messagebox.showerror("Erro", f"Falha ao carregar o estado do cálculo: {e}")
 
+    def sync_engine(self):
+        """Copia a configuração da interface para o estado do motor."""
+        state = self.engine.state
+        state.fdf_path = self.fdf_path.get()
+        state.siesta_python_path = self.siesta_python_path.get()
+        state.psf_files = self.psf_files
+        state.fields = self.field_set if self.field_set is not None else self.fields.tolist()
+        state.base_dir_name = self.base_dir_name.get()
+        state.total_cores = self.total_cores.get()
+        state.cores_per_job = self.cores_per_job.get()
+        state.launcher = self.get_launcher()
+        state.omp_threads = self.omp_threads.get()
+        state.pin_cpus = self.pin_cpus.get()
+        state.scratch_dir = self.scratch_dir.get().strip() or None
+        backend = self.get_batch_backend()
+        # Preserva as demais opções e o job já submetido, se o backend não mudou.
+        if backend == "local":
+            state.batch = None
+        elif not state.batch or state.batch.get("backend") != backend:
+            state.batch = {"backend": backend}
+        state.chain_mode = self.get_chain_mode()
+        state.field_order = self.get_field_order()
+        state.reuse_dm = self.reuse_dm.get()
+        state.result_cache = self.result_cache.get()
+        state.extrapolation = self.get_extrapolation_mode()
+        if self.adaptive_enabled.get():
+            # Mantém a rodada atual para que uma varredura retomada continue o refinamento.
+            previous = state.adaptive or {}
+            state.adaptive = {
+                "observable": self.get_adaptive_observable(),
+                "tolerance": self.adaptive_tolerance.get(),
+                "min_step": self.adaptive_min_step.get(),
+                "max_rounds": self.adaptive_max_rounds.get(),
+                "round": previous.get("round", 0)
+            }
+        else:
+            state.adaptive = None
+
     def save_state(self):
-        try:
-            self.state.fdf_path = self.fdf_path.get()
-            self.state.siesta_python_path = self.siesta_python_path.get()
-            self.state.psf_files = self.psf_files
-            self.state.fields = self.fields
-            self.state.base_dir_name = self.base_dir_name.get()
-            
-            with open(self.state_file, 'w') as f:
-                json.dump(self.state.to_dict(), f, indent=4)
-        except Exception as e:
-            self.log(f"Erro ao salvar o estado: {e}")
+        self.sync_engine()
+        self.engine.save_state()
 
     def restore_gui_from_state(self):
-        self.fdf_path.set(self.state.fdf_path or "")
-        self.siesta_python_path.set(self.state.siesta_python_path or "")
-        self.psf_files = self.state.psf_files
-        self.fields = self.state.fields
-        self.base_dir_name.set(self.state.base_dir_name)
+        state = self.engine.state
+        self.fdf_path.set(state.fdf_path or "")
+        self.siesta_python_path.set(state.siesta_python_path or "")
+        self.psf_files = state.psf_files
+        self.fields.clear()
+        self.fields.extend_array(state.fields)
+        self.field_set = state.fields if isinstance(state.fields, FieldSet) else None
+        if self.field_set is not None:
+            self.sampling_mode.set(SAMPLING_MODES[self.field_set.spec["sampling"]])
+        for i in range(len(self.fields)):
+            if state.is_completed(i):
+                self.fields.set_status(i, "done")
+        self.base_dir_name.set(state.base_dir_name)
+        self.total_cores.set(state.total_cores)
+        self.cores_per_job.set(state.cores_per_job)
+        self.launcher.set(LAUNCHERS.get(state.launcher, LAUNCHERS["plain"]))
+        self.omp_threads.set(state.omp_threads)
+        self.pin_cpus.set(state.pin_cpus)
+        self.scratch_dir.set(state.scratch_dir or "")
+        self.batch_backend.set(BATCH_BACKENDS.get((state.batch or {}).get("backend", "local"), BATCH_BACKENDS["local"]))
+        self.chain_mode.set(CHAIN_MODES.get(state.chain_mode, CHAIN_MODES["blocks"]))
+        self.field_order.set(ORDER_MODES.get(state.field_order, ORDER_MODES["cartesian"]))
+        self.reuse_dm.set(state.reuse_dm)
+        self.result_cache.set(state.result_cache)
+        self.extrapolation.set(EXTRAPOLATION_MODES.get(state.extrapolation, EXTRAPOLATION_MODES["none"]))
+        self.adaptive_enabled.set(bool(state.adaptive))
+        if state.adaptive:
+            self.adaptive_observable.set(OBSERVABLES.get(state.adaptive.get("observable"), OBSERVABLES["energy"]))
+            self.adaptive_tolerance.set(state.adaptive.get("tolerance", 0.01))
+            self.adaptive_min_step.set(state.adaptive.get("min_step", 0.001))
+            self.adaptive_max_rounds.set(state.adaptive.get("max_rounds", 4))
         self.update_psf_listbox()
         self.update_field_tree()
 
@@ -590,60 +896,84 @@ class SiestaElectricFieldGUI:
             self.psf_listbox.insert(tk.END, item)
             
     def generate_fields(self):
-        x_values = [0.0]
-        y_values = [0.0]
-        z_values = [0.0]
-        
+        axes = {}
         if self.x_active.get():
-            x_values = self.generate_axis_values(self.x_start.get(), self.x_end.get(), self.x_step.get())
+            axes["x"] = (self.x_start.get(), self.x_end.get(), self.x_step.get())
         
         if self.y_active.get():
-            y_values = self.generate_axis_values(self.y_start.get(), self.y_end.get(), self.y_step.get())
+            axes["y"] = (self.y_start.get(), self.y_end.get(), self.y_step.get())
         
         if self.z_active.get():
-            z_values = self.generate_axis_values(self.z_start.get(), self.z_end.get(), self.z_step.get())
+            axes["z"] = (self.z_start.get(), self.z_end.get(), self.z_step.get())
+        
+        order = self.get_field_order()
+        sampling = self.get_sampling_mode()
+        spec = {"sampling": sampling, "order": order}
+        try:
+            if sampling == "grid":
+                spec["axes"] = axes
+            elif sampling in ("sphere", "polar"):
+                spec["magnitudes"] = [float(v) for v in self.sampling_magnitudes.get().replace(',', ' ').split()]
+                spec["count"] = self.sampling_count.get()
+                if sampling == "polar":
+                    if len(axes) != 2:
+                        raise ValueError("Ative exatamente dois eixos para definir o plano do círculo.")
+                    spec["plane"] = "".join(sorted(axes))
+            else:
+                spec["bounds"] = {axis: (start, end) for axis, (start, end, step) in axes.items()}
+                spec["count"] = self.sampling_count.get()
+                spec["seed"] = self.sampling_seed.get()
+            field_set = FieldSet(spec)
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("Erro", f"Parâmetros de amostragem inválidos: {e}")
+            return
         
-        self.fields = []
-        for x in x_values:
-            for y in y_values:
-                for z in z_values:
-                    self.fields.append([x, y, z])
+        self.fields.clear()
+        self.fields.extend_array(field_set)
+        self.field_set = field_set
+        self.engine.state.adaptive = None
         
         self.update_field_tree()
-        self.log(f"Gerados {len(self.fields)} campos elétricos.")
+        self.log(f"Gerados {len(self.fields)} campos elétricos ({SAMPLING_MODES[sampling]}; ordem: {ORDER_MODES[order]}).")
+        self.sync_engine()
+        self.engine.log_hop_summary(build_warm_start_parents(field_set, "serial"))
         
-    def generate_axis_values(self, start, end, step):
-        if start == end:
-            return [start]
-        
-        if step == 0:
-            return [start]
-            
-        if start < end:
-            values = np.arange(start, end + step/2, step)
-        else:
-            values = np.arange(start, end - step/2, -step)
-            
-        return [round(v, 6) for v in values]
-    
     def update_field_tree(self):
-        for item in self.field_tree.get_children():
-            self.field_tree.delete(item)
-            
-        for i, field in enumerate(self.fields):
-            self.field_tree.insert("", "end", values=(i+1, field[0], field[1], field[2]))
+        self.field_table.refresh()
             
     def remove_field(self):
-        selection = self.field_tree.selection()
-        if selection:
-            index = self.field_tree.index(selection[0])
-            if 0 <= index < len(self.fields):
-                self.fields.pop(index)
-                self.update_field_tree()
+        index = self.field_table.selected_index()
+        if index is not None:
+            self.fields.pop(index)
+            self.field_set = None
+            if index >= len(self.fields):
+                self.field_table.selected = len(self.fields) - 1 if len(self.fields) else None
+            self.update_field_tree()
                 
     def clear_fields(self):
-        self.fields = []
+        self.fields.clear()
+        self.field_set = None
+        self.field_table.selected = None
         self.update_field_tree()
+    
+    def set_field_status(self, index, status):
+        # Chamado pelas threads do agendador; a tabela é redesenhada em refresh_field_status.
+        self.fields.set_status(index, status)
+        self.field_status_dirty = True
+    
+    def refresh_field_status(self):
+        # Campos acrescentados pelo refinamento adaptativo (vindos da thread de execução)
+        try:
+            while True:
+                self.fields.extend(self.added_fields_queue.get_nowait())
+                self.field_set = None
+                self.field_status_dirty = True
+        except queue.Empty:
+            pass
+        if self.field_status_dirty:
+            self.field_status_dirty = False
+            self.update_field_tree()
+        self.root.after(FIELD_STATUS_REFRESH_MS, self.refresh_field_status)
         
     def add_manual_field(self):
         manual_window = tk.Toplevel(self.root)
@@ -664,7 +994,8 @@ class SiestaElectricFieldGUI:
         
         def add_field():
             self.fields.append([x_val.get(), y_val.get(), z_val.get()])
-            self.update_field_tree()
+            self.field_set = None
+            self.field_table.see(len(self.fields) - 1)
             manual_window.destroy()
             
         ttk.Button(manual_window, text="Adicionar", command=add_field).grid(row=3, column=0, columnspan=2, pady=10)
@@ -687,104 +1018,97 @@ class SiestaElectricFieldGUI:
             
         messagebox.showinfo("Pré-visualização", preview)
         
+    def setup_file_logger(self, log_path):
+        logger = logging.getLogger("omni")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            try:
+                handler = RotatingFileHandler(log_path, maxBytes=LOG_FILE_MAX_BYTES,
+                                              backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+            except OSError:
+                return logger
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            logger.addHandler(handler)
+        return logger
+    
     def log(self, message):
-        self.log_text.insert(tk.END, f"{time.strftime('%H:%M:%S')} - {message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        # Seguro para qualquer thread: o widget só é tocado em flush_log_queue.
+        self.log_queue.put(f"{time.strftime('%H:%M:%S')} - {message}\n")
+        self.file_logger.info(message)
+    
+    def flush_log_queue(self):
+        lines = []
+        try:
+            while len(lines) < LOG_MAX_LINES:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if lines:
+            self.log_text.insert(tk.END, "".join(lines))
+            # Buffer circular: mantém apenas as últimas LOG_MAX_LINES linhas no widget.
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+        
+        while True:
+            try:
+                function, args, reply = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            result = function(*args)
+            if reply is not None:
+                reply.put(result)
+        self.root.after(LOG_FLUSH_MS, self.flush_log_queue)
+    
+    def post_to_ui(self, function, *args):
+        # Para as threads de trabalho: o Tk só é tocado pela thread da interface.
+        self.ui_calls.put((function, args, None))
+    
+    def call_in_ui(self, function, *args):
+        """Executa ``function`` na thread da interface e espera o resultado."""
+        reply = queue.Queue(maxsize=1)
+        self.ui_calls.put((function, args, reply))
+        return reply.get()
         
     def prepare_files(self):
-        if not self.fdf_path.get():
-            messagebox.showerror("Erro", "Selecione um arquivo FDF.")
+        if self.prepare_thread and self.prepare_thread.is_alive():
             return
-            
-        if not self.fields:
-            messagebox.showerror("Erro", "Gere pelo menos um campo elétrico.")
-            return
-            
+        self.sync_engine()
+        self.prepare_progress = (0, 0)
+        self.prepare_result = None
+        self.prepare_thread = threading.Thread(target=self.prepare_files_thread, daemon=True)
+        self.prepare_thread.start()
+        self.root.after(100, self.poll_prepare_progress)
+    
+    def prepare_files_thread(self):
         try:
-            base_dir = self.current_dir / self.base_dir_name.get()
-            base_dir.mkdir(exist_ok=True)
-            
-            field_dirs = []
-            for i, field in enumerate(self.fields):
-                field_name = f"E_{field[0]:.4f}_{field[1]:.4f}_{field[2]:.4f}".replace('.', 'p').replace('-', 'm')
-                field_dir = base_dir / field_name
-                field_dir.mkdir(exist_ok=True)
-                field_dirs.append(field_dir)
-                
-                self.prepare_field_files(field_dir, field, i == 0)
-                
-            self.log(f"Preparados {len(self.fields)} diretórios com arquivos de campo elétrico.")
-            messagebox.showinfo("Sucesso", f"Arquivos preparados em {base_dir}")
-            
+            self.prepare_result = self.engine.prepare_files()
         except Exception as e:
-            self.log(f"Erro ao preparar arquivos: {str(e)}")
-            messagebox.showerror("Erro", f"Falha ao preparar arquivos: {str(e)}")
-            
-    def prepare_field_files(self, field_dir, field_values, is_first_field):
-        if is_first_field:
-            with open(self.fdf_path.get(), 'r', encoding='utf-8') as f:
-                content = f.readlines()
-            
-            content = self.update_electric_field_block(content, field_values)
-            
-            new_fdf_path = field_dir / Path(self.fdf_path.get()).name
-            with open(new_fdf_path, 'w', encoding='utf-8') as f:
-                f.writelines(content)
-        
-        for psf_path in self.psf_files:
-            shutil.copy2(psf_path, field_dir)
-            
-        if self.siesta_python_path.get():
-            shutil.copy2(self.siesta_python_path.get(), field_dir)
-            
-    def update_electric_field_block(self, content, field_values):
-        block_start, block_end, commented = self.find_electric_field_block(content)
-        
-        new_block = [
-            "%block ExternalElectricField\n",
-            f"{field_values[0]:.6f} {field_values[1]:.6f} {field_values[2]:.6f} V/Ang\n",
-            "%endblock ExternalElectricField\n"
-        ]
-        
-        if commented and block_start != -1:
-            for i in range(block_start, block_end + 1):
-                content[i] = content[i].replace('#', '').replace('!', '')
-        
-        if block_start != -1 and block_end != -1:
-            del content[block_start:block_end + 1]
-            content[block_start:block_start] = new_block
-        else:
-            insert_pos = 0
-            for i, line in enumerate(content):
-                if not line.strip().startswith(('#', '!')) and line.strip():
-                    insert_pos = i
-                    break
-            
-            header = "# -- ELECTRIC FIELD --\n"
-            content.insert(insert_pos, header)
-            content[insert_pos + 1:insert_pos + 1] = new_block
-        
-        return content
+            self.prepare_result = e
     
-    def find_electric_field_block(self, content):
-        block_start = -1
-        block_end = -1
-        commented = False
-        
-        for i, line in enumerate(content):
-            if "ExternalElectricField" in line:
-                if line.strip().startswith(('#', '!')):
-                    commented = True
-                block_start = i
-                
-                for j in range(i + 1, len(content)):
-                    if "%endblock ExternalElectricField" in content[j]:
-                        block_end = j
-                        break
-                break
+    def update_prepare_progress(self, done, total):
+        # Chamado pela thread de preparação; a interface lê o valor em poll_prepare_progress.
+        self.prepare_progress = (done, total)
+    
+    def poll_prepare_progress(self):
+        done, total = self.prepare_progress
+        self.prepare_progressbar.configure(maximum=max(total, 1), value=done)
+        self.prepare_progress_label.configure(text=f"{done}/{total} pastas" if total else "")
+        if self.prepare_thread.is_alive():
+            self.root.after(100, self.poll_prepare_progress)
+            return
         
-        return block_start, block_end, commented
+        result = self.prepare_result
+        if isinstance(result, ValueError):
+            messagebox.showerror("Erro", str(result))
+        elif isinstance(result, Exception):
+            self.log(f"Erro ao preparar arquivos: {str(result)}")
+            messagebox.showerror("Erro", f"Falha ao preparar arquivos: {str(result)}")
+        else:
+            messagebox.showinfo("Sucesso", f"Arquivos preparados em {result}")
     
     def run_calculations(self):
         if not self.fields:
@@ -794,271 +1118,70 @@ class SiestaElectricFieldGUI:
         if not self.siesta_python_path.get():
             messagebox.showerror("Erro", "Selecione o caminho para siesta.py.")
             return
-            
-        self.is_running = True
-        self.save_state()
+        
+        self.sync_engine()
         thread = threading.Thread(target=self.run_calculations_thread)
         thread.daemon = True
         thread.start()
         
+    def harvest_results(self):
+        self.sync_engine()
+        threading.Thread(target=self.engine.harvest_results, daemon=True).start()
+        
     def stop_execution(self):
-        self.is_running = False
-        self.log("Parando execução...")
+        self.engine.stop()
         
     def run_calculations_thread(self):
-        base_dir = self.current_dir / self.base_dir_name.get()
-        previous_dir = self.last_dir
-        start_index = self.state.last_completed_index + 1
-        
-        for i in range(start_index, len(self.fields)):
-            if not self.is_running:
-                break
-                
-            field = self.fields[i]
-            field_name = f"E_{field[0]:.4f}_{field[1]:.4f}_{field[2]:.4f}".replace('.', 'p').replace('-', 'm')
-            field_dir = base_dir / field_name
-            
-            self.log(f"Executando cálculo {i+1}/{len(self.fields)}: {field_name}")
-            
-            try:
-                if i > 0 and previous_dir:
-                    result = self.create_fdf_from_previous(field_dir, previous_dir, field)
-                    if not result:
-                        continue
-                
-                siesta_script = field_dir / Path(self.siesta_python_path.get()).name
-                
-                if not siesta_script.exists():
-                    self.log(f"Erro: siesta.py não encontrado em {field_dir}")
-                    continue
-                
-                process = subprocess.Popen(
-                    [sys.executable, str(siesta_script)],
-                    cwd=field_dir,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                stdout, stderr = process.communicate()
-                
-                if process.returncode == 0:
-                    self.log(f"Cálculo {i+1} concluído com sucesso.")
-                    completion_file = field_dir / self.completed_file
-                    if completion_file.exists():
-                        self.log(f"Arquivo de conclusão encontrado: {completion_file}")
-                    else:
-                        self.log(f"Aviso: Arquivo de conclusão não encontrado em {field_dir}")
-                    self.state.last_completed_index = i
-                    self.save_state()
-                else:
-                    self.log(f"Erro no cálculo {i+1}: {stderr}")
-                    
-                previous_dir = field_dir
-                self.last_dir = previous_dir
-                
-            except Exception as e:
-                self.log(f"Exceção no cálculo {i+1}: {str(e)}")
-                
-        self.is_running = False
-        self.log("Todos os cálculos foram concluídos.")
-        messagebox.showinfo("Concluído", "Todos os cálculos foram finalizados.")
-        self.state_file.unlink()
-        self.state.last_completed_index = -1
-    
-    def create_fdf_from_previous(self, current_dir, previous_dir, field_values):
         try:
-            out_files = list(previous_dir.glob("*.out"))
-            if not out_files:
-                self.log(f"Nenhum arquivo .out encontrado em {previous_dir}")
-                return False
-                
-            latest_out = max(out_files, key=os.path.getctime)
-            
-            fdf_files = list(previous_dir.glob("*.fdf"))
-            if not fdf_files:
-                self.log(f"Nenhum arquivo .fdf encontrado em {previous_dir}")
-                return False
-                
-            latest_fdf = fdf_files[0]
-            
-            vetores, coordenadas, status = self.extrair_dados_otimizacao_final(latest_out, latest_fdf)
-            
-            if not vetores or not coordenadas:
-                self.log(f"Dados de otimização não encontrados em {latest_out}")
-                return False
-            
-            if status == "unrelaxed":
-                self.is_running = False
-                self.paused_for_fdf = True
-                self.log("Aviso: O cálculo anterior não relaxou. Pausando a execução.")
-                
-                new_fdf_path = filedialog.askopenfilename(
-                    title="O cálculo anterior não convergiu. Selecione o novo arquivo FDF para continuar",
-                    filetypes=[("FDF files", "*.fdf"), ("All files", "*.*")]
-                )
-                
-                if new_fdf_path:
-                    shutil.copy2(new_fdf_path, current_dir)
-                    self.fdf_path.set(new_fdf_path)
-                    self.paused_for_fdf = False
-                    self.is_running = True
-                    return True
-                else:
-                    self.log("Seleção de novo FDF cancelada. Execução parada.")
-                    return False
-            
-            vetores_formatados = "\n".join([f"    {linha.strip()}" for linha in vetores])
-            coordenadas_formatadas = "\n".join([f"    {linha.strip()}" for linha in coordenadas])
-            
-            conteudo_vetores = f"""%block LatticeVectors
-{vetores_formatados}
-%endblock LatticeVectors"""
-            
-            conteudo_coordenadas = f"""%block AtomicCoordinatesAndAtomicSpecies
-{coordenadas_formatadas}
-%endblock AtomicCoordinatesAndAtomicSpecies"""
-
-            conteudo_campo = f"""%block ExternalElectricField
-    {field_values[0]:.6f} {field_values[1]:.6f} {field_values[2]:.6f} V/Ang
-%endblock ExternalElectricField"""
-
-            with open(latest_fdf, 'r', encoding='utf-8') as f:
-                linhas_fdf = f.readlines()
-
-            novo_conteudo_fdf = []
-            campo_encontrado = False
-            
-            i = 0
-            while i < len(linhas_fdf):
-                linha = linhas_fdf[i]
-                
-                if 'ExternalElectricField' in linha and ('%block' in linha or '#%block' in linha):
-                    novo_conteudo_fdf.append(conteudo_campo + '\n')
-                    campo_encontrado = True
-                    while i < len(linhas_fdf) and 'endblock ExternalElectricField' not in linhas_fdf[i]:
-                        i += 1
-                    i += 1
-                    continue
-
-                if 'LatticeVectors' in linha and ('%block' in linha or '#%block' in linha):
-                    novo_conteudo_fdf.append(conteudo_vetores + '\n')
-                    while i < len(linhas_fdf) and 'endblock LatticeVectors' not in linhas_fdf[i]:
-                        i += 1
-                    i += 1
-                    continue
-
-                if 'AtomicCoordinatesAndAtomicSpecies' in linha and ('%block' in linha or '#%block' in linha):
-                    novo_conteudo_fdf.append(conteudo_coordenadas + '\n')
-                    while i < len(linhas_fdf) and 'endblock AtomicCoordinatesAndAtomicSpecies' not in linhas_fdf[i]:
-                        i += 1
-                    i += 1
-                    continue
-                    
-                novo_conteudo_fdf.append(linha)
-                i += 1
+            completed = self.engine.run_calculations()
+        except ValueError as e:
+            self.log(f"Erro: {str(e)}")
+            self.post_to_ui(messagebox.showerror, "Erro", str(e))
+            return
+        if completed:
+            self.post_to_ui(messagebox.showinfo, "Concluído", "Todos os cálculos foram finalizados.")
+    
+    def ask_new_fdf(self, current_dir):
+        # Chamado pelas threads do motor; o diálogo abre na thread da interface.
+        return self.call_in_ui(self.choose_new_fdf)
+    
+    def choose_new_fdf(self):
+        new_fdf_path = filedialog.askopenfilename(
+            title="O cálculo anterior não convergiu. Selecione o novo arquivo FDF para continuar",
+            filetypes=[("FDF files", "*.fdf"), ("All files", "*.*")]
+        )
+        if new_fdf_path:
+            self.fdf_path.set(new_fdf_path)
+        return new_fdf_path or None
+    
+    def get_field_order(self):
+        labels = {label: mode for mode, label in ORDER_MODES.items()}
+        return labels.get(self.field_order.get(), "cartesian")
+    
+    def get_launcher(self):
+        labels = {label: launcher for launcher, label in LAUNCHERS.items()}
+        return labels.get(self.launcher.get(), "plain")
 
-            if not campo_encontrado:
-                novo_conteudo_fdf.append(f"\n{conteudo_campo}\n")
-                    
-            nome_base = Path(self.fdf_path.get()).stem
-            x_str = f"{field_values[0]:.4f}".replace('.', '_').replace('-', 'm')
-            y_str = f"{field_values[1]:.4f}".replace('.', '_').replace('-', 'm')
-            z_str = f"{field_values[2]:.4f}".replace('.', '_').replace('-', 'm')
-            
-            nome_saida = f"{nome_base}_E_{x_str}_{y_str}_{z_str}.fdf"
-            caminho_novo_arquivo = current_dir / nome_saida
-            
-            with open(caminho_novo_arquivo, 'w') as f:
-                f.writelines(novo_conteudo_fdf)
+    def get_batch_backend(self):
+        labels = {label: backend for backend, label in BATCH_BACKENDS.items()}
+        return labels.get(self.batch_backend.get(), "local")
 
-            self.log(f"FDF criado com sucesso: {caminho_novo_arquivo}")
-            return True
-                
-        except Exception as e:
-            self.log(f"Erro ao criar FDF: {str(e)}")
-            return False
+    def get_chain_mode(self):
+        labels = {label: mode for mode, label in CHAIN_MODES.items()}
+        return labels.get(self.chain_mode.get(), "blocks")
     
-    def extrair_dados_otimizacao_final(self, out_file_path, fdf_file_path):
-        def get_num_vectors_from_fdf(file_path):
-            try:
-                with open(file_path, 'r') as file:
-                    lines = file.readlines()
-            except FileNotFoundError:
-                return 0
-            
-            in_block = False
-            count = 0
-            for line in lines:
-                if 'LatticeVectors' in line and '%block' in line:
-                    in_block = True
-                    continue
-                if '%endblock LatticeVectors' in line:
-                    in_block = False
-                    break
-                if in_block and line.strip() and not line.strip().startswith(('#', '!')):
-                    count += 1
-            return count
-
-        num_vectors = get_num_vectors_from_fdf(fdf_file_path)
-        if num_vectors == 0:
-            return None, None, "unrelaxed"
-
-        try:
-            with open(out_file_path, 'r') as arquivo:
-                linhas = arquivo.readlines()
-        except FileNotFoundError:
-            return None, None, "unrelaxed"
-
-        coordenadas_bloco_final = []
-        vetores_bloco_final = []
-        
-        current_coor_block_lines = []
-        current_cell_block_lines = []
-        
-        status = "unrelaxed" # Assume unrelaxed por padrão
-        
-        state = 0
-        cell_vector_counter = 0
-
-        for linha in linhas:
-            if 'outcoor: Relaxed atomic coordinates (Ang):' in linha:
-                current_coor_block_lines = []
-                state = 1
-                status = "relaxed"
-            elif 'outcoor: Final atomic coordinates (unrelaxed) (Ang):' in linha:
-                current_coor_block_lines = []
-                state = 1
-                status = "unrelaxed"
-            
-            elif state == 1:
-                if 'outcell: Unit cell vectors (Ang):' in linha:
-                    processed_coor = []
-                    for line in current_coor_block_lines:
-                        if 'outcoor:' not in line and line.strip():
-                            parts = line.split()
-                            if len(parts) >= 4:
-                                processed_coor.append(' '.join(parts[:4]))
-                    coordenadas_bloco_final = processed_coor
-                    
-                    current_cell_block_lines = []
-                    cell_vector_counter = 0
-                    state = 2
-                else:
-                    current_coor_block_lines.append(linha)
-            
-            elif state == 2:
-                if cell_vector_counter < num_vectors:
-                    current_cell_block_lines.append(linha)
-                    cell_vector_counter += 1
-                else:
-                    vetores_bloco_final = [line.lstrip() for line in current_cell_block_lines if 'outcell:' not in line and line.strip()]
-                    state = 0
-                    
-        if state == 2:
-            vetores_bloco_final = [line.lstrip() for line in current_cell_block_lines if 'outcell:' not in line and line.strip()]
+    def get_extrapolation_mode(self):
+        labels = {label: mode for mode, label in EXTRAPOLATION_MODES.items()}
+        return labels.get(self.extrapolation.get(), "none")
+    
+    def get_adaptive_observable(self):
+        labels = {label: key for key, label in OBSERVABLES.items()}
+        return labels.get(self.adaptive_observable.get(), "energy")
+    
+    def get_sampling_mode(self):
+        labels = {label: mode for mode, label in SAMPLING_MODES.items()}
+        return labels.get(self.sampling_mode.get(), "grid")
 
-        return vetores_bloco_final, coordenadas_bloco_final, status
 
     def show_about(self):
         about_window = tk.Toplevel(self.root)
@@ -0,0 +1,371 @@
+"""
+OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Execução de uma varredura como job array de um gerenciador de filas (Slurm ou PBS).
+
+As pastas de campo já preparadas são listadas em ``batch_fields.txt`` e cada
+tarefa do array executa o ``siesta.py --headless`` de uma delas. Os comandos de
+submissão e de consulta são configuráveis; o backend ``fake`` usa
+``omni_fake_scheduler.py``, que imita ``sbatch``/``squeue`` com subprocessos
+locais, para testar o fluxo inteiro numa só máquina.
+"""
+
+import sys
+import time
+import subprocess
+from pathlib import Path
+
+from omni_engine import launcher_layout
+from omni_fdf import write_text_atomic
+
+BATCH_FIELDS_FILE = "batch_fields.txt"
+BATCH_SCRIPT_FILE = "omni_batch.sh"
+BATCH_LOG_DIR = "batch_logs"
+FAKE_SCHEDULER = Path(__file__).resolve().parent / "omni_fake_scheduler.py"
+
+
+class SlurmBackend:
+    """Job array do Slurm (``sbatch --array``), acompanhado por ``squeue -r``.
+
+    O fim do job (tarefas que sumiram da fila sem terem sido vistas) só é
+    aceito quando a contabilidade (``sacct``) confirma que nenhuma está ativa.
+    """
+    name = "slurm"
+    submit_command = ["sbatch", "--parsable"]
+    status_command = ["squeue", "-h", "-r", "-j", "{job}", "-o", "%i %T"]
+    accounting_command = ["sacct", "-n", "-X", "-P", "-j", "{job}", "-o", "State"]
+    task_variable = "SLURM_ARRAY_TASK_ID"
+    active_states = ("PENDING", "RUNNING", "REQUEUED", "RESIZING", "SUSPENDED", "COMPLETING", "CONFIGURING")
+
+    def __init__(self, options=None):
+        options = options or {}
+        for key in ("submit_command", "status_command", "accounting_command"):
+            if options.get(key):
+                setattr(self, key, list(options[key]))
+
+    def directives(self, job_name, num_tasks, cores_per_job, max_parallel, log_dir):
+        array = f"0-{num_tasks - 1}" + (f"%{max_parallel}" if max_parallel else "")
+        return [f"#SBATCH --job-name={job_name}",
+                f"#SBATCH --array={array}",
+                f"#SBATCH --cpus-per-task={cores_per_job}",
+                f"#SBATCH --output={log_dir}/%A_%a.log"]
+
+    def parse_job_id(self, output):
+        # --parsable imprime "id" ou "id;cluster".
+        return output.strip().splitlines()[-1].split(';')[0].strip()
+
+    def parse_status(self, output):
+        """{tarefa: estado} das tarefas ainda na fila (linhas "123_4 RUNNING")."""
+        tasks = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and '_' in parts[0]:
+                task = parts[0].rsplit('_', 1)[1]
+                if task.isdigit():
+                    tasks[int(task)] = parts[1].upper()
+        return tasks
+
+    def is_running_state(self, state):
+        return state in ("RUNNING", "COMPLETING", "CONFIGURING")
+
+    def parse_ended(self, output):
+        """True se a contabilidade lista o job e nenhuma tarefa está ativa ("CANCELLED by 123" etc.)."""
+        states = [line.split()[0].upper() for line in output.splitlines() if line.strip()]
+        return bool(states) and not any(state in self.active_states for state in states)
+
+
+class PbsBackend(SlurmBackend):
+    """Job array do PBS Pro (``qsub -J``), acompanhado por ``qstat -t``."""
+    name = "pbs"
+    submit_command = ["qsub"]
+    status_command = ["qstat", "-t", "{job}"]
+    accounting_command = ["qstat", "-x", "-f", "{job}"]
+    task_variable = "PBS_ARRAY_INDEX"
+
+    def directives(self, job_name, num_tasks, cores_per_job, max_parallel, log_dir):
+        # O PBS Pro não limita tarefas simultâneas no próprio array; max_parallel é ignorado.
+        return [f"#PBS -N {job_name}",
+                f"#PBS -J 0-{num_tasks - 1}",
+                f"#PBS -l select=1:ncpus={cores_per_job}",
+                "#PBS -j oe",
+                f"#PBS -o {log_dir}/"]
+
+    def parse_job_id(self, output):
+        return output.strip().splitlines()[-1].strip()
+
+    def parse_status(self, output):
+        """{tarefa: estado} das linhas ``123[4].servidor ... S ...`` do qstat."""
+        tasks = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if not parts or '[' not in parts[0] or not parts[0].split('[', 1)[1].split(']')[0].isdigit():
+                continue
+            task = int(parts[0].split('[', 1)[1].split(']')[0])
+            state = parts[-2] if len(parts) >= 6 else "Q"
+            if state not in ("F", "X"):
+                tasks[task] = state
+        return tasks
+
+    def is_running_state(self, state):
+        return state in ("R", "E")
+
+    def parse_ended(self, output):
+        """True se o histórico (``qstat -x -f``) dá o job array como terminado (``job_state = F``)."""
+        for line in output.splitlines():
+            key, _, value = line.partition("=")
+            if key.strip() == "job_state":
+                return value.strip() == "F"
+        return False
+
+
+class FakeSlurmBackend(SlurmBackend):
+    """Slurm simulado por ``omni_fake_scheduler.py`` (tarefas como subprocessos locais)."""
+    name = "fake"
+    submit_command = [sys.executable, str(FAKE_SCHEDULER), "sbatch", "--parsable"]
+    status_command = [sys.executable, str(FAKE_SCHEDULER), "squeue", "-h", "-r", "-j", "{job}", "-o", "%i %T"]
+    accounting_command = [sys.executable, str(FAKE_SCHEDULER), "sacct", "-n", "-X", "-P", "-j", "{job}", "-o", "State"]
+
+
+BATCH_BACKENDS = {
+    "local": "Local (agendador do OMNI)",
+    "slurm": "Slurm (job array)",
+    "pbs": "PBS Pro (job array)",
+    "fake": "Fila simulada (testes)",
+    "cluster": "Coordenador de workers (rede)"
+}
+BACKEND_CLASSES = {"slurm": SlurmBackend, "pbs": PbsBackend, "fake": FakeSlurmBackend}
+
+
+def get_backend(options):
+    backend = options.get("backend", "local")
+    if backend not in BACKEND_CLASSES:
+        raise ValueError(f"Backend de fila desconhecido: {backend}")
+    return BACKEND_CLASSES[backend](options)
+
+
+class BatchRun:
+    """Submete os campos pendentes como um job array e acompanha as tarefas até o fim.
+
+    O ``state.batch`` do motor guarda as opções (``backend``, ``max_parallel``,
+    ``directives``, ``python``, ``poll_interval`` e comandos) e, depois da
+    submissão, ``job_id``, ``indices`` e ``submitted_at``: uma sessão retomada
+    volta a acompanhar o mesmo job em vez de submeter outro.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.options = engine.state.batch
+        self.backend = get_backend(self.options)
+        self.log = engine.log
+
+    def format_command(self, command):
+        return [arg.replace("{job}", str(self.options["job_id"])) for arg in command]
+
+    def run(self):
+        engine = self.engine
+        state = engine.state
+        base_dir = engine.base_dir
+
+        if not self.options.get("job_id"):
+            indices = self.pending_indices(base_dir)
+            if not indices:
+                return True
+            if not self.submit(base_dir, indices):
+                return False
+
+        indices = self.options["indices"]
+        field_dirs = [engine.get_field_dir(base_dir, state.fields[i]) for i in indices]
+        for index, field_dir in zip(indices, field_dirs):
+            engine.run_dirs[index] = field_dir
+        return self.track(indices, field_dirs)
+
+    def pending_indices(self, base_dir):
+        """Campos a submeter; os que estiverem no cache de resultados são resolvidos aqui mesmo.
+
+        As tarefas do array são independentes, então não há warm start: pastas
+        sem FDF (fora das cabeças de cadeia) recebem o FDF do template.
+        """
+        engine = self.engine
+        state = engine.state
+        pending = [i for i in range(len(state.fields)) if not state.is_completed(i)]
+        script_name = Path(state.siesta_python_path).name
+        if any(not (engine.get_field_dir(base_dir, state.fields[i]) / script_name).exists() for i in pending):
+            engine.prepare_files()
+
+        indices = []
+        for index in pending:
+            field = state.fields[index]
+            field_dir = engine.get_field_dir(base_dir, field)
+            if not any(field_dir.glob("*.fdf")):
+                engine.write_fdf_from_template(field_dir, field)
+            cache_key = engine.result_cache_key(field_dir, field) if state.result_cache else None
+            if cache_key and engine.restore_cached_result(cache_key, field_dir):
+                with engine.state_lock:
+                    state.mark_completed(index)
+                engine.journal.record("cached", index, field, elapsed=0.0)
+                engine.field_status(index, "done")
+                continue
+            # A tarefa reescreve as saídas no lugar: nada da pasta pode continuar ligado ao cache.
+            engine.break_output_links(field_dir)
+            indices.append(index)
+        return indices
+
+    def render_script(self, base_dir, fields_file, num_tasks):
+        state = self.engine.state
+        ranks, threads = launcher_layout(state.launcher, state.cores_per_job, state.omp_threads)
+        log_dir = base_dir / BATCH_LOG_DIR
+        log_dir.mkdir(parents=True, exist_ok=True)
+        python = self.options.get("python") or sys.executable
+        lines = ["#!/bin/bash"]
+        lines += self.backend.directives(f"omni_{state.base_dir_name}", num_tasks, state.cores_per_job,
+                                         self.options.get("max_parallel"), log_dir)
+        lines += list(self.options.get("directives", []))
+        lines += [
+            "",
+            f'FIELD_DIR=$(sed -n "$((${self.backend.task_variable} + 1))p" "{fields_file}")',
+            'cd "$FIELD_DIR" || exit 1',
+            f"export OMNI_LAUNCHER={state.launcher} OMNI_MPI_RANKS={ranks} OMP_NUM_THREADS={threads}"
+        ]
+        if state.scratch_dir:
+            # Um OMNI_SCRATCH_DIR definido no nó (p.ex. pelo prólogo do gerenciador) prevalece.
+            lines.append(f'export OMNI_SCRATCH_DIR="${{OMNI_SCRATCH_DIR:-{state.scratch_dir}}}"')
+        lines += [f'exec "{python}" "{Path(state.siesta_python_path).name}" --headless', ""]
+        return "\n".join(lines)
+
+    def submit(self, base_dir, indices):
+        """Grava a lista de pastas e o script do array e submete; retorna False se a submissão falhar."""
+        engine = self.engine
+        fields_file = base_dir / BATCH_FIELDS_FILE
+        field_dirs = [engine.get_field_dir(base_dir, engine.state.fields[i]) for i in indices]
+        write_text_atomic(fields_file, "".join(f"{field_dir.resolve()}\n" for field_dir in field_dirs))
+        script = base_dir / BATCH_SCRIPT_FILE
+        write_text_atomic(script, self.render_script(base_dir.resolve(), fields_file.resolve(), len(indices)))
+
+        try:
+            result = subprocess.run(self.backend.submit_command + [str(script)], cwd=base_dir,
+                                    capture_output=True, text=True)
+        except OSError as e:
+            self.log(f"Erro na submissão ({' '.join(self.backend.submit_command)}): {e}")
+            return False
+        if result.returncode != 0:
+            self.log(f"Erro na submissão ({' '.join(self.backend.submit_command)}): {result.stderr.strip()}")
+            return False
+
+        self.options.update(job_id=self.backend.parse_job_id(result.stdout), indices=indices,
+                            submitted_at=time.time())
+        engine.save_state()
+        self.log(f"Job array {self.options['job_id']} submetido ao {BATCH_BACKENDS[self.backend.name]} "
+                 f"com {len(indices)} tarefa(s).")
+        return True
+
+    def run_query(self, command):
+        """Saída de um comando de consulta ao gerenciador, ou None (com aviso) se ele falhar."""
+        try:
+            result = subprocess.run(self.format_command(command), capture_output=True, text=True, timeout=120)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.log(f"Aviso: consulta à fila falhou: {e}")
+            return None
+        if result.returncode != 0:
+            # Timeout do controlador, erro transitório ou job já removido da fila:
+            # nada se conclui daqui; job_ended decide pela contabilidade.
+            self.log(f"Aviso: consulta à fila falhou ({' '.join(self.format_command(command))}): "
+                     f"{result.stderr.strip() or f'código {result.returncode}'}")
+            return None
+        return result.stdout
+
+    def query(self):
+        """{tarefa: estado} na fila, ou None se o comando de status falhar."""
+        output = self.run_query(self.backend.status_command)
+        return None if output is None else self.backend.parse_status(output)
+
+    def job_ended(self):
+        """True só se a contabilidade do gerenciador confirmar que o job terminou."""
+        output = self.run_query(self.backend.accounting_command)
+        return output is not None and self.backend.parse_ended(output)
+
+    def track(self, indices, field_dirs):
+        engine = self.engine
+        state = engine.state
+        submitted_at = self.options["submitted_at"]
+        poll_interval = self.options.get("poll_interval", 30)
+        remaining = {task for task, index in enumerate(indices) if not state.is_completed(index)}
+        seen, running = set(), set()
+
+        while remaining and engine.is_running:
+            queued = self.query()
+            # Fila vazia ou consulta falha não bastam para dar tarefas nunca vistas como encerradas.
+            ended = not queued and self.job_ended()
+            if queued is not None or ended:
+                for task in sorted(remaining):
+                    index = indices[task]
+                    task_state = (queued or {}).get(task)
+                    if task_state is not None:
+                        seen.add(task)
+                        if task not in running and self.backend.is_running_state(task_state):
+                            running.add(task)
+                            engine.field_status(index, "running")
+                            engine.journal.record("start", index, state.fields[index], task=task)
+                        continue
+                    # Fora da fila: terminou, se já foi vista ou deixou métricas desta submissão.
+                    metrics_file = field_dirs[task] / "metricas.json"
+                    finished = (task in seen or ended
+                                or (metrics_file.exists() and metrics_file.stat().st_mtime >= submitted_at))
+                    if finished:
+                        remaining.discard(task)
+                        self.finish_task(task, index, field_dirs[task], submitted_at)
+            if remaining:
+                self.sleep(poll_interval)
+
+        if remaining:
+            self.log(f"Acompanhamento do job {self.options['job_id']} interrompido com {len(remaining)} tarefa(s) "
+                     f"pendente(s); o job continua na fila e será acompanhado na retomada.")
+            return False
+
+        for key in ("job_id", "indices", "submitted_at"):
+            self.options.pop(key, None)
+        engine.save_state()
+        engine.export_metrics(force=True)
+        return all(state.is_completed(i) for i in indices)
+
+    def finish_task(self, task, index, field_dir, submitted_at):
+        engine = self.engine
+        state = engine.state
+        field = state.fields[index]
+        completion_file = field_dir / engine.completed_file
+        success = completion_file.exists() and completion_file.stat().st_mtime >= submitted_at
+        engine.record_scf_iterations(engine.base_dir, index, field_dir, dm_reused=False)
+        metrics = engine.read_field_metrics(index, field, submitted_at)
+        elapsed = metrics.get("wall_seconds") if metrics else None
+        if success:
+            with engine.state_lock:
+                state.mark_completed(index)
+            engine.journal.record("finish", index, field, elapsed=elapsed,
+                                  scf=state.scf_iterations.get(str(index)), metrics=metrics, task=task)
+            if state.result_cache:
+                cache_key = engine.result_cache_key(field_dir, field)
+                engine.store_cached_result(cache_key, field_dir, field)
+            self.log(f"Cálculo {index+1} (tarefa {task}) concluído com sucesso.")
+        else:
+            engine.journal.record("fail", index, field, elapsed=elapsed, metrics=metrics, task=task)
+            self.log(f"Erro no cálculo {index+1} (tarefa {task}); veja {BATCH_LOG_DIR}/ e o .out em {field_dir.name}.")
+        engine.field_status(index, "done" if success else "failed")
+        engine.export_metrics()
+
+    def sleep(self, seconds):
+        # Acorda a cada segundo para atender a um pedido de parada.
+        deadline = time.time() + seconds
+        while self.engine.is_running and time.time() < deadline:
+            time.sleep(min(1.0, deadline - time.time()))
@@ -0,0 +1,262 @@
+"""
+OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Linha de comando do OMNI para nós de cálculo sem display.
+
+O arquivo de especificação é um JSON com as mesmas chaves de
+``calculation_state.json`` (fdf_path, psf_files, siesta_python_path,
+base_dir_name, total_cores, cores_per_job, chain_mode, field_order, reuse_dm,
+extrapolation, adaptive, result_cache, launcher, omp_threads, pin_cpus,
+scratch_dir, batch) e, no lugar de ``fields``, opcionalmente ``axes`` ou
+``field_spec`` (especificação de um ``FieldSet``: grade, cascas esféricas,
+círculos polares ou hipercubo latino):
+
+    {"fdf_path": "Gr.fdf", "psf_files": ["C_gga.psf"],
+     "siesta_python_path": "siesta.py",
+     "axes": {"z": [0.0, 0.5, 0.1]}, "field_order": "serpentine"}
+
+    {"field_spec": {"sampling": "sphere", "magnitudes": [0.1, 0.2], "count": 20}, ...}
+
+Campos gerados assim não são expandidos no arquivo de estado.
+
+Refinamento adaptativo (observable: energy, fermi ou dipole):
+
+    {"adaptive": {"observable": "energy", "tolerance": 0.01, "min_step": 0.001, "max_rounds": 4}, ...}
+
+Lançador do SIESTA (launcher: plain, mpi ou hybrid; cada slot recebe núcleos
+próprios quando pin_cpus é verdadeiro):
+
+    {"launcher": "hybrid", "cores_per_job": 8, "omp_threads": 2, ...}
+
+Execução como job array de um gerenciador de filas (backend: slurm, pbs ou
+fake, a fila simulada de omni_fake_scheduler.py; submit_command e
+status_command substituem os comandos padrão):
+
+    {"batch": {"backend": "slurm", "max_parallel": 50, "poll_interval": 60,
+               "directives": ["#SBATCH --partition=long"]}, ...}
+
+Distribuição a workers em outras máquinas (backend cluster; o coordenador
+escuta em listen, host:porta ou unix:/caminho, e cada worker se conecta com
+``agent``; token, ou OMNI_CLUSTER_TOKEN, é o segredo compartilhado):
+
+    {"batch": {"backend": "cluster", "listen": "0.0.0.0:5757", "memory_per_job": 4000}, ...}
+
+Caminhos relativos são resolvidos em relação à pasta do arquivo de especificação.
+
+Uso:
+    python omni_cli.py fields  spec.json
+    python omni_cli.py prepare spec.json
+    python omni_cli.py run     spec.json [--prepare]
+    python omni_cli.py run     --resume
+    python omni_cli.py harvest [spec.json] [--workers N]
+    python omni_cli.py run     spec.json --worker     (um por nó, na mesma pasta)
+    python omni_cli.py status
+    python omni_cli.py run     spec.json --listen 0.0.0.0:5757   (coordenador)
+    python omni_cli.py agent   host:5757 [--cores N] [--memory MB]
+
+Com --worker vários processos (em nós diferentes, sobre NFS/Lustre) consomem a
+mesma varredura: cada campo é reservado por um arquivo .omni_claim com
+heartbeat, e reservas de workers mortos são retomadas depois de --lease
+segundos. Prepare as pastas uma vez antes de iniciar os workers.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import threading
+
+log_lock = threading.Lock()
+
+
+def log(message):
+    # Várias threads do agendador registram ao mesmo tempo: uma linha inteira por vez.
+    line = f"{time.strftime('%H:%M:%S')} - {message}\n"
+    with log_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def log_progress(done, total):
+    # Cerca de dez linhas por preparação, para não inundar o log do job.
+    if done and (done == total or done % max(1, total // 10) == 0):
+        log(f"Preparação: {done}/{total} pastas.")
+
+
+def load_spec(spec_path):
+    """Lê o JSON de especificação e resolve os caminhos relativos."""
+    from omni_engine import CalculationState
+
+    with open(spec_path, 'r') as f:
+        data = json.load(f)
+
+    spec_dir = os.path.dirname(os.path.abspath(spec_path))
+
+    def resolve(path):
+        return path if not path or os.path.isabs(path) else os.path.join(spec_dir, path)
+
+    data["fdf_path"] = resolve(data.get("fdf_path"))
+    data["siesta_python_path"] = resolve(data.get("siesta_python_path"))
+    data["psf_files"] = [resolve(path) for path in data.get("psf_files", [])]
+    if not data.get("fields") and data.get("axes") and not data.get("field_spec"):
+        data["field_spec"] = {"sampling": "grid", "axes": data["axes"]}
+    if data.get("field_spec"):
+        data["field_spec"] = dict(data["field_spec"])
+        data["field_spec"].setdefault("order", data.get("field_order", "cartesian"))
+
+    return CalculationState.from_dict(data)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="omni_cli.py",
+        description="Executa varreduras de campo elétrico do OMNI sem interface gráfica.")
+    parser.add_argument("--work-dir", default=os.getcwd(),
+                        help="pasta onde ficam calculation_state.json e a pasta base (padrão: atual)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fields_parser = subparsers.add_parser("fields", help="lista os campos gerados pela especificação")
+    fields_parser.add_argument("spec")
+
+    prepare_parser = subparsers.add_parser("prepare", help="cria as pastas de campo")
+    prepare_parser.add_argument("spec")
+
+    run_parser = subparsers.add_parser("run", help="executa a varredura")
+    run_parser.add_argument("spec", nargs="?")
+    run_parser.add_argument("--prepare", action="store_true", help="prepara as pastas antes de executar")
+    run_parser.add_argument("--resume", action="store_true",
+                            help="retoma a partir de calculation_state.json em vez da especificação")
+    run_parser.add_argument("--harvest", action="store_true", help="coleta os resultados ao final")
+    run_parser.add_argument("--backend", help="local, slurm, pbs, fake ou cluster (substitui batch.backend da especificação)")
+    run_parser.add_argument("--listen", help="endereço do coordenador (implica --backend cluster)")
+    run_parser.add_argument("--token", help="segredo compartilhado com os workers do coordenador")
+    run_parser.add_argument("--worker", action="store_true",
+                            help="divide a varredura com outros workers na mesma pasta (reserva por campo)")
+    run_parser.add_argument("--worker-id", default=None, help="identificador do worker (padrão: host-pid)")
+    run_parser.add_argument("--lease", type=float, default=None,
+                            help="segundos sem heartbeat até a reserva de um worker ser retomada (padrão: 300)")
+
+    subparsers.add_parser("status", help="mostra o progresso de todos os workers da varredura")
+
+    agent_parser = subparsers.add_parser(
+        "agent", help="roda campos distribuídos por um coordenador (pastas em --work-dir)")
+    agent_parser.add_argument("address", help="endereço do coordenador (host:porta ou unix:/caminho)")
+    agent_parser.add_argument("--cores", type=int, default=None, help="núcleos oferecidos (padrão: todos)")
+    agent_parser.add_argument("--memory", type=int, default=None, help="memória oferecida em MB (padrão: toda)")
+    agent_parser.add_argument("--worker-id", default=None, help="identificador do worker (padrão: host-pid)")
+    agent_parser.add_argument("--token", default=None, help="segredo compartilhado com o coordenador")
+
+    harvest_parser = subparsers.add_parser(
+        "harvest", help="coleta os resultados das pastas de campo em results.sqlite")
+    harvest_parser.add_argument("spec", nargs="?",
+                                help="especificação (padrão: calculation_state.json ou a pasta base padrão)")
+    harvest_parser.add_argument("--workers", type=int, default=None, help="processos do pool de coleta")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "agent":
+        from omni_cluster import ClusterWorker
+        worker = ClusterWorker(args.address, args.work_dir, args.cores, args.memory, args.worker_id,
+                               args.token, log=log)
+        try:
+            return worker.run()
+        except KeyboardInterrupt:
+            return 130
+
+    if not os.path.isdir(args.work_dir):
+        if args.command in ("prepare", "run"):
+            os.makedirs(args.work_dir, exist_ok=True)
+        elif args.command != "fields":
+            log(f"Pasta de trabalho não encontrada: {args.work_dir}")
+            return 1
+
+    # O motor (e o NumPy) só é importado depois de validar os argumentos.
+    from omni_engine import SweepEngine, FieldClaims, LEASE_TIMEOUT, WORKERS_DIR
+
+    engine = SweepEngine(args.work_dir, log=log)
+    engine.progress = log_progress
+    if getattr(args, "worker", False):
+        engine.enable_shared_mode(args.worker_id, args.lease or LEASE_TIMEOUT)
+
+    if args.command == "status":
+        if not engine.load_state():
+            log(f"Nenhum estado encontrado em {engine.state_file}.")
+            return 1
+        total = len(engine.state.fields)
+        done = sum(1 for i in range(total) if engine.state.is_completed(i))
+        log(f"Campos concluídos: {done}/{total}.")
+        for worker in FieldClaims.workers(engine.current_dir / WORKERS_DIR):
+            running = ", ".join(worker["running"]) or "nenhum campo reservado"
+            log(f"Worker {worker['worker']} (pid {worker['pid']}, heartbeat há "
+                f"{time.time() - worker['heartbeat']:.0f} s): {running}")
+        return 0
+
+    if args.command == "run" and args.resume:
+        if not engine.load_state():
+            log(f"Nenhum estado encontrado em {engine.state_file}.")
+            return 1
+        log("Estado de cálculo restaurado. Iniciando a partir do último ponto salvo.")
+    elif args.spec:
+        engine.state = load_spec(args.spec)
+        if engine.claims is not None:
+            engine.sync_shared_progress()
+    elif args.command == "harvest":
+        engine.load_state()
+    else:
+        log("Informe o arquivo de especificação ou use --resume.")
+        return 1
+
+    if getattr(args, "backend", None):
+        engine.state.batch = None if args.backend == "local" else dict(engine.state.batch or {}, backend=args.backend)
+    if getattr(args, "listen", None):
+        engine.state.batch = dict(engine.state.batch or {}, backend="cluster", listen=args.listen)
+    if getattr(args, "token", None):
+        # Pelo ambiente, para que o segredo não vá parar em calculation_state.json.
+        os.environ["OMNI_CLUSTER_TOKEN"] = args.token
+
+    if args.command == "fields":
+        for i, field in enumerate(engine.state.fields):
+            print(f"{i+1}\t{field[0]:.6f}\t{field[1]:.6f}\t{field[2]:.6f}")
+        return 0
+
+    if args.command == "harvest":
+        engine.harvest_results(args.workers)
+        return 0
+
+    try:
+        if args.command == "prepare" or args.prepare:
+            engine.prepare_files()
+        if args.command == "run":
+            completed = engine.run_calculations()
+            if args.harvest:
+                engine.harvest_results()
+            return 0 if completed else 1
+    except ValueError as e:
+        log(f"Erro: {e}")
+        return 1
+    except KeyboardInterrupt:
+        engine.stop()
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
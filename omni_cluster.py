@@ -0,0 +1,690 @@
+"""
+OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Distribuição dos campos de uma varredura a workers em outras máquinas.
+
+O coordenador (``ClusterCoordinator``, backend ``cluster`` da execução) serve a
+fila de campos num socket TCP ou Unix; cada worker (``ClusterWorker``, iniciado
+com ``omni_cli.py agent``) informa núcleos e memória, recebe as entradas da
+varredura (PSFs e siesta.py, uma vez, pelo hash) e pede campos enquanto tiver
+slots livres. Um campo cujo pai na cadeia de warm start rodou num worker vai de
+preferência para esse mesmo worker, que ainda tem a .DM do pai em disco. O
+worker devolve o estado de cada campo, as saídas (.out, FDF, concluido.txt,
+metricas.json) e a linha de resultados já extraída do .out.
+
+Protocolo: uma mensagem JSON por linha, em pares pedido/resposta iniciados
+pelo worker:
+
+    hello     {worker, host, cores, memory_mb, token}  -> welcome | error
+    input     {digest}                                 -> file {data}
+    request   {}                                       -> job | wait {seconds} | done
+    status    {index, status}                          -> ok
+    result    {index, ok, files, result, ...}          -> ok
+    heartbeat {running}                                -> ok
+
+Arquivos viajam compactados (zlib) em base64.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import hmac
+import base64
+import shutil
+import socket
+import hashlib
+import threading
+import subprocess
+import socketserver
+from pathlib import Path
+
+from omni_engine import (CHAIN_MODES, FIELD_METRICS_FILE, HEARTBEAT_INTERVAL, INPUT_STORE_DIR, LEASE_TIMEOUT,
+                         FieldScheduler, InputStore, SweepEngine, build_warm_start_parents,
+                         field_hop_distances, slot_cpu_sets)
+from omni_fdf import write_text_atomic
+from omni_results import RESULTS_DB, ResultsStore, harvest_field_dir
+
+DEFAULT_ADDRESS = "127.0.0.1:5757"
+DEFAULT_PORT = 5757
+RETURNED_FILES = ["*.out", "*.fdf", "*.XV", "*.STRUCT_OUT", "concluido.txt", FIELD_METRICS_FILE]
+WAIT_INTERVAL = 5
+
+
+def parse_address(address):
+    """``host:porta`` (TCP) ou ``unix:/caminho`` / caminho com barra (socket Unix)."""
+    address = str(address or DEFAULT_ADDRESS)
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    if "/" in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    if not host:
+        return socket.AF_INET, (address, DEFAULT_PORT)
+    return socket.AF_INET, (host, int(port))
+
+
+def pack_file(path):
+    with open(path, 'rb') as f:
+        return base64.b64encode(zlib.compress(f.read())).decode('ascii')
+
+
+def unpack_data(data):
+    return zlib.decompress(base64.b64decode(data))
+
+
+def write_bytes_atomic(path, data):
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+
+
+def send_message(stream, message):
+    stream.write((json.dumps(message) + "\n").encode('utf-8'))
+    stream.flush()
+
+
+def read_message(stream):
+    """Próxima mensagem da conexão, ou None quando o outro lado fecha."""
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def physical_memory_mb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class ReusableTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    """Uma conexão de worker: responde às mensagens até o worker sair ou ficar mudo."""
+    def handle(self):
+        coordinator = self.server.coordinator
+        # Um worker vivo manda heartbeat a cada HEARTBEAT_INTERVAL segundos.
+        self.connection.settimeout(coordinator.lease_timeout)
+        worker = None
+        try:
+            while True:
+                message = read_message(self.rfile)
+                if message is None:
+                    break
+                if worker is None and message.get("type") != "hello":
+                    reply = {"type": "error", "message": "O worker precisa se apresentar (hello) primeiro."}
+                else:
+                    reply = coordinator.handle_message(worker, message)
+                if reply.get("type") == "welcome":
+                    worker = reply["worker"]
+                send_message(self.wfile, reply)
+                if reply.get("type") == "error":
+                    break
+        except (OSError, ValueError) as e:
+            if worker is not None:
+                coordinator.log(f"Conexão com o worker {worker} perdida: {e}")
+        finally:
+            if worker is not None:
+                coordinator.drop_worker(worker)
+
+
+class ClusterCoordinator:
+    """Serve a fila de campos a workers remotos e registra o que eles devolvem.
+
+    O ``state.batch`` do motor guarda as opções: ``listen`` (endereço, padrão
+    127.0.0.1:5757), ``token`` (segredo compartilhado com os workers; também
+    lido de ``OMNI_CLUSTER_TOKEN``), ``memory_per_job`` (MB por cálculo, limita
+    os slots de cada worker pela memória), ``lease`` (segundos sem mensagem até
+    um worker ser dado como morto) e ``return_files`` (padrões das saídas
+    devolvidas). Campos de um worker que cai voltam para a fila.
+    """
+    def __init__(self, engine, chain_mode=None):
+        self.engine = engine
+        self.options = engine.state.batch or {}
+        self.chain_mode = chain_mode or engine.state.chain_mode
+        self.log = engine.log
+        self.token = self.options.get("token") or os.environ.get("OMNI_CLUSTER_TOKEN", "")
+        self.lease_timeout = self.options.get("lease", LEASE_TIMEOUT)
+        self.lock = threading.Lock()
+        self.results_lock = threading.Lock()
+        self.workers = {}
+        self.pending = set()
+        self.ready = set()
+        self.children = {}
+        self.assigned = {}
+        self.started = {}
+        self.cache_keys = {}
+        self.ran_on = {}
+        self.finished = threading.Event()
+        self.inputs = []
+        self.handlers = {"hello": self.welcome, "input": self.send_input, "request": self.next_job,
+                         "status": self.update_status, "result": self.finish_job, "heartbeat": self.heartbeat}
+
+    def run(self):
+        engine = self.engine
+        state = engine.state
+        base_dir = engine.base_dir
+        pending = [i for i in range(len(state.fields)) if not state.is_completed(i)]
+        if not pending:
+            return True
+
+        script_name = Path(state.siesta_python_path).name
+        if any(not (engine.get_field_dir(base_dir, state.fields[i]) / script_name).exists() for i in pending):
+            engine.prepare_files(self.chain_mode)
+        self.inputs = engine.store_inputs(base_dir)
+
+        # As cadeias são as mesmas do agendador local, e cada uma tende a ficar num worker.
+        num_slots = FieldScheduler(state.total_cores, state.cores_per_job).num_slots
+        engine.job_parents = build_warm_start_parents(state.fields, self.chain_mode, num_slots)
+        engine.hops = field_hop_distances(state.fields, engine.job_parents)
+        self.pending = set(pending)
+        for index in pending:
+            parent = engine.job_parents.get(index)
+            self.children.setdefault(parent, []).append(index)
+            if parent is None or parent not in self.pending:
+                self.ready.add(index)
+        num_chains = sum(1 for parent in engine.job_parents.values() if parent is None)
+
+        address = self.options.get("listen", DEFAULT_ADDRESS)
+        try:
+            server = self.serve(address)
+        except OSError as e:
+            self.log(f"Erro: não foi possível escutar em {address}: {e}")
+            return False
+        self.log(f"Coordenador em {address}: {len(pending)} campo(s) pendente(s) em {num_chains} cadeia(s) "
+                 f"de warm start ({CHAIN_MODES[self.chain_mode]}); aguardando workers.")
+        engine.log_hop_summary(engine.job_parents)
+
+        try:
+            while engine.is_running and not self.finished.wait(1.0):
+                pass
+            # Os workers recebem "done" no próximo pedido; dá alguns segundos para saírem.
+            deadline = time.time() + 2 * WAIT_INTERVAL
+            while self.workers and time.time() < deadline:
+                time.sleep(0.2)
+        finally:
+            server.shutdown()
+            server.server_close()
+            if server.address_family == socket.AF_UNIX and os.path.exists(server.server_address):
+                os.unlink(server.server_address)
+
+        if self.assigned:
+            self.log(f"Coordenador encerrado com {len(self.assigned)} campo(s) ainda em workers; "
+                     f"eles serão refeitos na retomada.")
+        engine.export_metrics(force=True)
+        return all(state.is_completed(i) for i in range(len(state.fields)))
+
+    def serve(self, address):
+        family, address = parse_address(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+            server = socketserver.ThreadingUnixStreamServer(address, CoordinatorHandler)
+            server.daemon_threads = True
+        else:
+            server = ReusableTCPServer(address, CoordinatorHandler)
+        server.coordinator = self
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def handle_message(self, worker, message):
+        handler = self.handlers.get(message.get("type"))
+        if handler is None:
+            return {"type": "error", "message": f"Mensagem desconhecida: {message.get('type')}"}
+        return handler(worker, message)
+
+    def welcome(self, worker, message):
+        if self.token and not hmac.compare_digest(str(message.get("token") or ""), self.token):
+            return {"type": "error", "message": "Token do coordenador inválido."}
+        state = self.engine.state
+        host = message.get("host", "?")
+        cores = int(message.get("cores") or 1)
+        memory = message.get("memory_mb")
+        slots = cores // state.cores_per_job
+        memory_per_job = self.options.get("memory_per_job")
+        if memory_per_job and memory:
+            slots = min(slots, int(memory // memory_per_job))
+        worker = str(message.get("worker") or f"{host}-{len(self.workers) + 1}")
+
+        with self.lock:
+            if worker in self.workers:
+                return {"type": "error", "message": f"Já há um worker conectado com o identificador {worker}."}
+            if slots < 1:
+                return {"type": "error", "message": f"Capacidade insuficiente ({cores} núcleo(s), {memory} MB) "
+                                                    f"para cálculos de {state.cores_per_job} núcleo(s)."}
+            self.workers[worker] = {"host": host, "cores": cores, "memory_mb": memory, "slots": slots,
+                                    "running": set(), "done": 0}
+        self.log(f"Worker {worker} ({host}) conectado: {cores} núcleo(s), {memory} MB, {slots} slot(s).")
+        return {"type": "welcome", "worker": worker, "slots": slots, "sweep": state.base_dir_name,
+                "cores_per_job": state.cores_per_job, "launcher": state.launcher,
+                "omp_threads": state.omp_threads, "pin_cpus": state.pin_cpus,
+                "scratch_dir": state.scratch_dir, "inputs": self.inputs,
+                "siesta": Path(state.siesta_python_path).name,
+                "return_files": self.options.get("return_files", RETURNED_FILES)}
+
+    def send_input(self, worker, message):
+        digest = message.get("digest")
+        if digest not in {stored for stored, _ in self.inputs}:
+            return {"type": "error", "message": f"Entrada desconhecida: {digest}"}
+        return {"type": "file", "digest": digest, "data": pack_file(self.engine.input_store.root / digest)}
+
+    def heartbeat(self, worker, message):
+        return {"type": "ok"}
+
+    def next_job(self, worker, message):
+        """Próximo campo para o worker; campos resolvidos pelo cache não chegam a sair."""
+        while True:
+            with self.lock:
+                info = self.workers[worker]
+                if not self.engine.is_running or self.finished.is_set():
+                    return {"type": "done"}
+                index = self.choose_field(worker) if len(info["running"]) < info["slots"] else None
+                if index is None:
+                    return {"type": "wait", "seconds": WAIT_INTERVAL}
+                self.pending.discard(index)
+                self.ready.discard(index)
+                self.assigned[index] = worker
+                info["running"].add(index)
+            job = self.stage_job(index, worker)
+            if job is not None:
+                return job
+
+    def choose_field(self, worker):
+        """Campo pronto de maior prioridade: continuar uma cadeia deste worker, abrir uma nova, herdar uma alheia."""
+        parents = self.engine.job_parents
+        best = None
+        for index in self.ready:
+            parent = self.warm_start_index(parents.get(index))
+            if parent is not None and self.ran_on.get(parent) == worker:
+                rank = 0
+            elif parents.get(index) is None:
+                rank = 1
+            else:
+                rank = 2
+            if best is None or (rank, index) < best:
+                best = (rank, index)
+        return best[1] if best else None
+
+    def warm_start_index(self, parent):
+        """Ancestral mais próximo já executado (o mesmo que ``find_warm_start_ancestors`` usaria)."""
+        engine = self.engine
+        while parent is not None and parent not in engine.run_dirs and not engine.state.is_completed(parent):
+            parent = engine.job_parents.get(parent)
+        return parent
+
+    def stage_job(self, index, worker):
+        """Gera o FDF do campo na pasta local e monta a mensagem ``job``; None se não houver o que enviar."""
+        engine = self.engine
+        state = engine.state
+        field = state.fields[index]
+        field_dir = engine.get_field_dir(engine.base_dir, field)
+        parent = engine.job_parents.get(index)
+        try:
+            staged, previous_dir = engine.write_field_fdf(engine.base_dir, index, parent)
+        except Exception as e:
+            self.log(f"Exceção ao preparar o cálculo {index+1}: {e}")
+            staged, previous_dir = False, None
+        if not staged:
+            engine.journal.record("fail", index, field, elapsed=0.0, worker=worker)
+            engine.field_status(index, "failed")
+            self.complete(worker, index, ran=False)
+            return None
+
+        cache_key = engine.result_cache_key(field_dir, field) if state.result_cache else None
+        if cache_key and engine.restore_cached_result(cache_key, field_dir):
+            engine.run_dirs[index] = field_dir
+            with engine.state_lock:
+                state.mark_completed(index)
+                engine.cached_fields.add(index)
+            engine.journal.record("cached", index, field, elapsed=0.0)
+            self.log(f"Cálculo {index+1} reaproveitado do cache de resultados ({cache_key[:12]}).")
+            engine.field_status(index, "done")
+            self.complete(worker, index, ran=False)
+            return None
+
+        dm_from = None
+        previous = self.warm_start_index(parent)
+        if state.reuse_dm and previous_dir and previous is not None:
+            if self.ran_on.get(previous) == worker:
+                dm_from = previous_dir.name
+            else:
+                self.log(f"Campo {index+1} vai para o worker {worker}, mas {previous_dir.name} rodou em "
+                         f"{self.ran_on.get(previous, 'outra sessão')}; o SCF partirá sem a .DM herdada.")
+        with self.lock:
+            self.started[index] = time.time()
+            self.cache_keys[index] = cache_key
+        fdf = {path.name: path.read_text(encoding='utf-8') for path in field_dir.glob("*.fdf")}
+        return {"type": "job", "index": index, "field": [float(v) for v in field], "dir": field_dir.name,
+                "fdf": fdf, "dm_from": dm_from}
+
+    def update_status(self, worker, message):
+        index = message["index"]
+        if message.get("status") == "running" and self.assigned.get(index) == worker:
+            state = self.engine.state
+            field_dir = self.engine.get_field_dir(self.engine.base_dir, state.fields[index])
+            self.log(f"Executando cálculo {index+1}/{len(state.fields)} no worker {worker}: {field_dir.name}")
+            self.engine.journal.record("start", index, state.fields[index], worker=worker)
+            self.engine.field_status(index, "running")
+        return {"type": "ok"}
+
+    def finish_job(self, worker, message):
+        """Grava as saídas devolvidas na pasta local e registra o campo como o agendador local faria."""
+        index = message["index"]
+        with self.lock:
+            if self.assigned.get(index) != worker:
+                # O campo já voltou para a fila (o worker foi dado como morto).
+                return {"type": "ok"}
+        engine = self.engine
+        state = engine.state
+        field = state.fields[index]
+        field_dir = engine.get_field_dir(engine.base_dir, field)
+        field_dir.mkdir(parents=True, exist_ok=True)
+        for name, data in message.get("files", {}).items():
+            write_bytes_atomic(field_dir / Path(name).name, unpack_data(data))
+        engine.run_dirs[index] = field_dir
+        engine.last_dir = field_dir
+        engine.record_scf_iterations(engine.base_dir, index, field_dir, dm_reused=bool(message.get("dm_reused")))
+        metrics = engine.read_field_metrics(index, field, self.started.get(index, 0.0))
+        self.store_result(field_dir, message.get("result"))
+
+        success = bool(message.get("ok"))
+        elapsed = message.get("elapsed")
+        if success:
+            with engine.state_lock:
+                state.mark_completed(index)
+            engine.journal.record("finish", index, field, elapsed=elapsed,
+                                  scf=state.scf_iterations.get(str(index)), metrics=metrics, worker=worker)
+            cache_key = self.cache_keys.get(index)
+            if cache_key:
+                engine.store_cached_result(cache_key, field_dir, field)
+            self.log(f"Cálculo {index+1} concluído com sucesso no worker {worker}.")
+        else:
+            engine.journal.record("fail", index, field, elapsed=elapsed, metrics=metrics, worker=worker)
+            self.log(f"Erro no cálculo {index+1} no worker {worker}: {message.get('error', '')}")
+        engine.field_status(index, "done" if success else "failed")
+        self.complete(worker, index, ran=True)
+        engine.export_metrics()
+        return {"type": "ok"}
+
+    def store_result(self, field_dir, row):
+        """Grava em results.sqlite a linha extraída pelo worker, apontando para a cópia local do .out."""
+        if not row or not (field_dir / row.get("out_file", "")).is_file():
+            return
+        info = (field_dir / row["out_file"]).stat()
+        row = dict(row, field_dir=field_dir.name, mtime=info.st_mtime, size=info.st_size)
+        with self.results_lock, ResultsStore(self.engine.base_dir / RESULTS_DB) as store:
+            store.upsert([row])
+
+    def complete(self, worker, index, ran):
+        with self.lock:
+            self.assigned.pop(index, None)
+            self.started.pop(index, None)
+            self.cache_keys.pop(index, None)
+            info = self.workers.get(worker)
+            if info:
+                info["running"].discard(index)
+                info["done"] += 1
+            if ran:
+                self.ran_on[index] = worker
+            for child in self.children.get(index, ()):
+                if child in self.pending:
+                    self.ready.add(child)
+            if not self.pending and not self.assigned:
+                self.finished.set()
+
+    def drop_worker(self, worker):
+        """Desconecta o worker e devolve à fila os campos que estavam com ele."""
+        with self.lock:
+            info = self.workers.pop(worker, None)
+            lost = sorted(info["running"]) if info else []
+            for index in lost:
+                self.assigned.pop(index, None)
+                self.started.pop(index, None)
+                self.pending.add(index)
+                self.ready.add(index)
+        for index in lost:
+            self.engine.field_status(index, "pending")
+        if lost and not self.finished.is_set():
+            self.log(f"Worker {worker} desconectado; {len(lost)} campo(s) voltam para a fila.")
+        else:
+            self.log(f"Worker {worker} desconectado ({info['done'] if info else 0} campo(s) atendido(s)).")
+
+
+class ClusterWorker:
+    """Agente que pede campos ao coordenador e roda o siesta.py de cada um numa pasta local.
+
+    As pastas ficam em ``scratch/<pasta base>/`` e as entradas recebidas são
+    guardadas por hash em ``scratch/.omni_inputs``, reaproveitadas entre
+    varreduras. Cada slot é uma thread; todas compartilham uma conexão, uma
+    troca (pedido e resposta) por vez.
+    """
+    def __init__(self, address, scratch=None, cores=None, memory_mb=None, worker_id=None, token=None,
+                 log=print, connect_timeout=60):
+        self.address = address
+        self.scratch = Path(scratch) if scratch else Path.cwd()
+        self.cores = cores or available_cores()
+        self.memory_mb = memory_mb or physical_memory_mb()
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.token = token or os.environ.get("OMNI_CLUSTER_TOKEN", "")
+        self.log = log
+        self.connect_timeout = connect_timeout
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.running = set()
+        self.running_lock = threading.Lock()
+        self.completed = 0
+        self.error = None
+        self.connection = None
+        self.stream = None
+        # Motor local só para os utilitários de cada pasta (.DM herdada, ambiente do lançador).
+        self.engine = SweepEngine(self.scratch, log=log)
+        self.store = None
+        self.base_dir = None
+        self.inputs = []
+        self.settings = {}
+
+    def run(self):
+        """Atende o coordenador até ele não ter mais campos; retorna o código de saída."""
+        try:
+            self.connect()
+        except OSError as e:
+            self.log(f"Erro: não foi possível conectar ao coordenador em {self.address}: {e}")
+            return 1
+        try:
+            self.setup(self.call({"type": "hello", "worker": self.worker_id, "host": socket.gethostname(),
+                                  "cores": self.cores, "memory_mb": self.memory_mb, "token": self.token}))
+            slots = [threading.Thread(target=self.slot_loop, args=(slot,), daemon=True)
+                     for slot in range(self.settings["slots"])]
+            for thread in slots + [threading.Thread(target=self.heartbeat_loop, daemon=True)]:
+                thread.start()
+            for thread in slots:
+                # join com timeout para que Ctrl+C chegue à thread principal.
+                while thread.is_alive():
+                    thread.join(0.5)
+        except (ConnectionError, OSError, ValueError) as e:
+            self.error = e
+        finally:
+            self.stopped.set()
+            self.close()
+
+        if self.error:
+            self.log(f"Erro: {self.error}")
+            return 1
+        self.log(f"Worker {self.worker_id}: o coordenador não tem mais campos; {self.completed} cálculo(s) executado(s).")
+        return 0
+
+    def connect(self):
+        family, address = parse_address(self.address)
+        deadline = time.time() + self.connect_timeout
+        while True:
+            connection = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                connection.connect(address)
+                break
+            except OSError:
+                connection.close()
+                # O coordenador pode ainda estar subindo.
+                if time.time() >= deadline:
+                    raise
+                time.sleep(1.0)
+        if family != socket.AF_UNIX:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.connection = connection
+        self.stream = connection.makefile('rwb')
+
+    def close(self):
+        for resource in (self.stream, self.connection):
+            try:
+                if resource is not None:
+                    resource.close()
+            except OSError:
+                pass
+
+    def call(self, message):
+        with self.lock:
+            send_message(self.stream, message)
+            reply = read_message(self.stream)
+        if reply is None:
+            raise ConnectionError("O coordenador encerrou a conexão.")
+        if reply.get("type") == "error":
+            raise ConnectionError(reply.get("message", "erro no coordenador"))
+        return reply
+
+    def setup(self, welcome):
+        """Guarda as opções da varredura e baixa as entradas que ainda não estão no armazenamento local."""
+        self.settings = welcome
+        self.worker_id = welcome["worker"]
+        self.base_dir = self.scratch / welcome["sweep"]
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.store = InputStore(self.scratch / INPUT_STORE_DIR)
+        self.inputs = welcome["inputs"]
+        for digest, name in self.inputs:
+            if not (self.store.root / digest).exists():
+                self.store_input(digest, unpack_data(self.call({"type": "input", "digest": digest})["data"]))
+
+        state = self.engine.state
+        state.launcher = welcome["launcher"]
+        state.omp_threads = welcome["omp_threads"]
+        state.cores_per_job = welcome["cores_per_job"]
+        state.scratch_dir = welcome.get("scratch_dir")
+        self.engine.slot_cpus = slot_cpu_sets(welcome["slots"], state.cores_per_job) if welcome.get("pin_cpus") else []
+        self.log(f"Worker {self.worker_id} conectado a {self.address}: {welcome['slots']} slot(s) de "
+                 f"{state.cores_per_job} núcleo(s) para {welcome['sweep']}.")
+
+    def store_input(self, digest, data):
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Entrada corrompida na transferência: {digest}")
+        temp_path = self.store.root / f".tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, self.store.root / digest)
+
+    def slot_loop(self, slot):
+        try:
+            while not self.stopped.is_set():
+                reply = self.call({"type": "request"})
+                if reply["type"] == "done":
+                    break
+                if reply["type"] == "wait":
+                    self.stopped.wait(reply.get("seconds", WAIT_INTERVAL))
+                    continue
+                self.call(self.run_job(reply, slot))
+        except (ConnectionError, OSError, ValueError) as e:
+            if not self.stopped.is_set():
+                self.error = e
+            self.stopped.set()
+
+    def heartbeat_loop(self):
+        try:
+            while not self.stopped.wait(HEARTBEAT_INTERVAL):
+                with self.running_lock:
+                    running = sorted(self.running)
+                self.call({"type": "heartbeat", "running": running})
+        except (ConnectionError, OSError, ValueError):
+            pass
+
+    def run_job(self, job, slot):
+        """Monta a pasta do campo, roda o siesta.py e retorna a mensagem ``result``."""
+        index = job["index"]
+        field_dir = self.base_dir / job["dir"]
+        if field_dir.exists():
+            # Saídas de uma tentativa anterior deste campo.
+            shutil.rmtree(field_dir)
+        field_dir.mkdir(parents=True)
+        for name, text in job["fdf"].items():
+            write_text_atomic(field_dir / Path(name).name, text)
+        for digest, name in self.inputs:
+            self.store.link(digest, field_dir / name)
+        dm_reused = bool(job.get("dm_from")) and self.engine.stage_density_matrix(
+            self.base_dir / job["dm_from"], field_dir)
+
+        with self.running_lock:
+            self.running.add(index)
+        self.call({"type": "status", "index": index, "status": "running"})
+        self.log(f"Executando cálculo {index+1} (slot {slot+1}): {field_dir.name}")
+        started = time.time()
+        try:
+            process = subprocess.run(
+                [sys.executable, self.settings["siesta"], "--headless"], cwd=field_dir,
+                env=self.engine.launcher_environment(slot, self.engine.state.cores_per_job),
+                stdin=subprocess.DEVNULL, capture_output=True, text=True)
+            success, error = process.returncode == 0, process.stderr.strip()[-2000:]
+        except OSError as e:
+            success, error = False, str(e)
+        finally:
+            with self.running_lock:
+                self.running.discard(index)
+
+        self.completed += 1
+        self.log(f"Cálculo {index+1} {'concluído' if success else 'falhou'}; enviando as saídas ao coordenador.")
+        return {"type": "result", "index": index, "ok": success, "error": error,
+                "elapsed": round(time.time() - started, 3), "dm_reused": dm_reused,
+                "files": self.collect_files(field_dir), "result": self.harvest(field_dir)}
+
+    def collect_files(self, field_dir):
+        paths = set()
+        for pattern in self.settings.get("return_files", RETURNED_FILES):
+            paths.update(path for path in field_dir.glob(pattern) if path.is_file())
+        return {path.name: pack_file(path) for path in sorted(paths)}
+
+    def harvest(self, field_dir):
+        """Linha de results.sqlite extraída do .out mais recente da pasta, ou None."""
+        out_files = list(field_dir.glob("*.out"))
+        if not out_files:
+            return None
+        try:
+            return harvest_field_dir(field_dir, max(out_files, key=os.path.getmtime))
+        except (OSError, ValueError) as e:
+            self.log(f"Aviso: não foi possível extrair os resultados de {field_dir.name}: {e}")
+            return None
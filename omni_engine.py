@@ -0,0 +1,2166 @@
+"""OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Motor de orquestração do OMNI, sem dependência de interface gráfica.
+
+A GUI (OMNI.py) e a linha de comando (omni_cli.py) são clientes deste módulo.
+O NumPy só é importado quando uma função numérica é chamada, para que execuções
+em lote em nós de cálculo iniciem rapidamente.
+"""
+
+import os
+import re
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import sys
+import json
+import mmap
+import csv
+import itertools
+import hashlib
+import gzip
+import stat
+from collections import OrderedDict
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from omni_fdf import FdfDocument, field_block_body, write_text_atomic
+
+class CalculationState:
+    def __init__(self):
+        self.fdf_path = None
+        self.psf_files = []
+        self.fields = []
+        self.base_dir_name = "electric_field_calculations"
+        self.siesta_python_path = None
+        self.last_completed_index = -1
+        self.is_running = False
+        self.paused_for_fdf = False
+        self.last_dir = None
+        self.completed_indices = []
+        self.total_cores = 1
+        self.cores_per_job = 1
+        self.chain_mode = "blocks"
+        self.field_order = "cartesian"
+        self.reuse_dm = False
+        self.scf_iterations = {}
+        self.extrapolation = "none"
+        self.adaptive = None
+        self.result_cache = True
+        self.launcher = "plain"
+        self.omp_threads = 1
+        self.pin_cpus = True
+        self.scratch_dir = None
+        self.batch = None
+
+    def to_dict(self):
+        # Campos gerados por um FieldSet são salvos só como especificação.
+        lazy = isinstance(self.fields, FieldSet)
+        return {
+            "fdf_path": self.fdf_path,
+            "psf_files": self.psf_files,
+            "fields": None if lazy else self.fields,
+            "field_spec": self.fields.to_dict() if lazy else None,
+            "base_dir_name": self.base_dir_name,
+            "siesta_python_path": self.siesta_python_path,
+            "last_completed_index": self.last_completed_index,
+            "completed_indices": self.completed_indices,
+            "total_cores": self.total_cores,
+            "cores_per_job": self.cores_per_job,
+            "chain_mode": self.chain_mode,
+            "field_order": self.field_order,
+            "reuse_dm": self.reuse_dm,
+            "scf_iterations": self.scf_iterations,
+            "extrapolation": self.extrapolation,
+            "adaptive": self.adaptive,
+            "result_cache": self.result_cache,
+            "launcher": self.launcher,
+            "omp_threads": self.omp_threads,
+            "pin_cpus": self.pin_cpus,
+            "scratch_dir": self.scratch_dir,
+            "batch": self.batch
+        }
+
+    @staticmethod
+    def from_dict(data):
+        state = CalculationState()
+        state.fdf_path = data.get("fdf_path")
+        state.psf_files = data.get("psf_files", [])
+        field_spec = data.get("field_spec")
+        state.fields = FieldSet(field_spec) if field_spec else data.get("fields") or []
+        state.base_dir_name = data.get("base_dir_name", "electric_field_calculations")
+        state.siesta_python_path = data.get("siesta_python_path")
+        state.last_completed_index = data.get("last_completed_index", -1)
+        state.completed_indices = data.get("completed_indices", [])
+        state.total_cores = data.get("total_cores", 1)
+        state.cores_per_job = data.get("cores_per_job", 1)
+        state.chain_mode = data.get("chain_mode", "blocks")
+        state.field_order = data.get("field_order", "cartesian")
+        state.reuse_dm = data.get("reuse_dm", False)
+        state.scf_iterations = data.get("scf_iterations", {})
+        state.extrapolation = data.get("extrapolation", "none")
+        state.adaptive = data.get("adaptive")
+        state.result_cache = data.get("result_cache", True)
+        state.launcher = data.get("launcher", "plain")
+        state.omp_threads = data.get("omp_threads", 1)
+        state.pin_cpus = data.get("pin_cpus", True)
+        state.scratch_dir = data.get("scratch_dir")
+        state.batch = data.get("batch")
+        return state
+
+    def mark_completed(self, index):
+        """Registra um campo concluído e avança o último índice contíguo."""
+        if index not in self.completed_indices:
+            self.completed_indices.append(index)
+        completed = set(self.completed_indices)
+        while self.last_completed_index + 1 in completed:
+            self.last_completed_index += 1
+
+    def is_completed(self, index):
+        return index <= self.last_completed_index or index in self.completed_indices
+
+ORDER_MODES = {
+    "cartesian": "Cartesiana (x, y, z)",
+    "serpentine": "Serpentina",
+    "hilbert": "Curva de Hilbert",
+    "nearest": "Vizinho mais próximo a partir do zero"
+}
+
+def _axis_ranks(values):
+    """Converte cada coluna de ``values`` no índice do valor entre os valores únicos do eixo."""
+    import numpy as np
+    ranks = np.empty(values.shape, dtype=int)
+    sizes = []
+    for axis in range(values.shape[1]):
+        unique, inverse = np.unique(values[:, axis], return_inverse=True)
+        ranks[:, axis] = inverse
+        sizes.append(len(unique))
+    return ranks, sizes
+
+def _hilbert_index(coords, bits):
+    """Índice de Hilbert de um ponto inteiro em n dimensões (algoritmo de Skilling)."""
+    x = [int(c) for c in coords]
+    n = len(x)
+    q = 1 << (bits - 1)
+    while q > 1:
+        p = q - 1
+        for i in range(n):
+            if x[i] & q:
+                x[0] ^= p
+            else:
+                t = (x[0] ^ x[i]) & p
+                x[0] ^= t
+                x[i] ^= t
+        q >>= 1
+    for i in range(1, n):
+        x[i] ^= x[i - 1]
+    t = 0
+    q = 1 << (bits - 1)
+    while q > 1:
+        if x[n - 1] & q:
+            t ^= q - 1
+        q >>= 1
+    for i in range(n):
+        x[i] ^= t
+
+    index = 0
+    for b in range(bits - 1, -1, -1):
+        for i in range(n):
+            index = (index << 1) | ((x[i] >> b) & 1)
+    return index
+
+def order_fields(fields, mode="cartesian"):
+    """Reordena os campos segundo ``field_order_permutation``."""
+    if mode == "cartesian" or len(fields) < 3:
+        return [list(field) for field in fields]
+    return [list(fields[int(i)]) for i in field_order_permutation(fields, mode)]
+
+def field_order_permutation(fields, mode="cartesian"):
+    """Índices que reordenam os campos para reduzir a distância entre execuções consecutivas.
+
+    - ``cartesian``: ordem original dos laços aninhados (x, depois y, depois z);
+    - ``serpentine``: boustrofédon, invertendo o sentido a cada linha da grade;
+    - ``hilbert``: ordem ao longo de uma curva de Hilbert sobre os eixos ativos;
+    - ``nearest``: vizinho mais próximo guloso partindo do campo de menor módulo.
+    """
+    import numpy as np
+    if mode == "cartesian" or len(fields) < 3:
+        return list(range(len(fields)))
+
+    values = np.asarray(fields, dtype=float)
+    ranks, sizes = _axis_ranks(values)
+
+    if mode == "serpentine":
+        keys = []
+        for rank in ranks:
+            key, row = [], 0
+            for axis, size in enumerate(sizes):
+                position = rank[axis] if row % 2 == 0 else size - 1 - rank[axis]
+                key.append(position)
+                row = row * size + position
+            keys.append(tuple(key))
+        order = sorted(range(len(fields)), key=lambda i: keys[i])
+
+    elif mode == "hilbert":
+        active = [axis for axis, size in enumerate(sizes) if size > 1]
+        bits = max(1, int(np.ceil(np.log2(max(sizes)))))
+        if len(active) < 2:
+            order = list(np.lexsort(ranks.T[::-1]))
+        else:
+            indices = [_hilbert_index(rank[active], bits) for rank in ranks]
+            order = sorted(range(len(fields)), key=lambda i: indices[i])
+
+    elif mode == "nearest":
+        remaining = np.ones(len(fields), dtype=bool)
+        current = int(np.argmin(np.linalg.norm(values, axis=1)))
+        order = []
+        while True:
+            order.append(current)
+            remaining[current] = False
+            if not remaining.any():
+                break
+            distances = np.linalg.norm(values - values[current], axis=1)
+            distances[~remaining] = np.inf
+            current = int(np.argmin(distances))
+
+    else:
+        raise ValueError(f"Modo de ordenação desconhecido: {mode}")
+
+    return [int(i) for i in order]
+
+def field_hop_distances(fields, parents):
+    """Distância (V/Ang) entre cada campo e o campo de onde parte sua geometria.
+
+    Campos sem pai (partindo do template) recebem ``None``. Os campos são lidos
+    em blocos de ``FIELD_CHUNK_SIZE``, junto com os pais de cada bloco.
+    """
+    import numpy as np
+    take = field_values_getter(fields)
+    hops = []
+    for start in range(0, len(fields), FIELD_CHUNK_SIZE):
+        indices = np.arange(start, min(start + FIELD_CHUNK_SIZE, len(fields)))
+        parent_indices = np.array([-1 if parents.get(i) is None else parents[i] for i in indices.tolist()], dtype=int)
+        has_parent = parent_indices >= 0
+        distances = np.zeros(len(indices))
+        if has_parent.any():
+            distances[has_parent] = np.linalg.norm(take(indices[has_parent]) - take(parent_indices[has_parent]), axis=1)
+        hops += [float(distance) if known else None for known, distance in zip(has_parent.tolist(), distances.tolist())]
+    return hops
+
+def field_values_getter(fields):
+    """Função ``indices -> array (k, 3)``: ``FieldSet.take`` ou indexação de uma lista já na memória."""
+    import numpy as np
+    if hasattr(fields, "take"):
+        return fields.take
+    return np.asarray(fields, dtype=float).reshape(-1, 3).__getitem__
+
+OUTCOOR_HEADERS = {
+    b"outcoor: Relaxed atomic coordinates (Ang):": "relaxed",
+    b"outcoor: Final atomic coordinates (unrelaxed) (Ang):": "unrelaxed"
+}
+OUTCELL_HEADER = b"outcell: Unit cell vectors (Ang):"
+
+def _rfind_outcoor(data, end):
+    """Posição e status do último cabeçalho ``outcoor`` antes de ``end`` (-1 se não houver)."""
+    position, status = -1, "unrelaxed"
+    for header, header_status in OUTCOOR_HEADERS.items():
+        found = data.rfind(header, 0, end)
+        if found > position:
+            position, status = found, header_status
+    return position, status
+
+def read_last_structure(out_file_path, num_vectors):
+    """Lê apenas o último bloco ``outcoor``/``outcell`` de um arquivo .out do SIESTA.
+
+    O arquivo é mapeado em memória e varrido de trás para frente, então só o trecho
+    do último bloco é decodificado, qualquer que seja o tamanho do .out. Retorna
+    ``(vetores, coordenadas, status)`` no mesmo formato de
+    ``extrair_dados_otimizacao_final``.
+    """
+    try:
+        with open(out_file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return [], [], "unrelaxed"
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _parse_last_structure(data, num_vectors)
+    except FileNotFoundError:
+        return None, None, "unrelaxed"
+
+def _parse_last_structure(data, num_vectors):
+    # O status vem sempre do último cabeçalho; se esse bloco foi truncado antes do
+    # outcell, a geometria vem do bloco completo anterior (como no parser sequencial).
+    start, status = _rfind_outcoor(data, len(data))
+    end = len(data)
+    cell = -1
+    while start != -1:
+        cell = data.find(OUTCELL_HEADER, start, end)
+        if cell != -1:
+            break
+        end = start
+        start, _ = _rfind_outcoor(data, start)
+
+    if start == -1:
+        return [], [], status
+
+    coor_start = data.find(b"\n", start, cell) + 1 or cell
+    coor_end = data.rfind(b"\n", 0, cell) + 1
+    coordenadas = []
+    for line in data[coor_start:coor_end].decode('utf-8', errors='ignore').splitlines():
+        if 'outcoor:' not in line and line.strip():
+            parts = line.split()
+            if len(parts) >= 4:
+                coordenadas.append(' '.join(parts[:4]))
+
+    vetores = []
+    position = data.find(b"\n", cell)
+    for _ in range(num_vectors):
+        if position == -1 or position + 1 >= len(data):
+            break
+        next_position = data.find(b"\n", position + 1)
+        line_end = len(data) if next_position == -1 else next_position + 1
+        line = data[position + 1:line_end].decode('utf-8', errors='ignore')
+        if 'outcell:' not in line and line.strip():
+            vetores.append(line.lstrip())
+        position = next_position
+
+    return vetores, coordenadas, status
+
+SCF_ITERATION_PATTERN = re.compile(rb"^\s*scf:\s+(\d+)\s", re.MULTILINE)
+# Separador gravado pelo siesta.py no .out a cada reinício do vigia (RESTART_MARKER lá).
+RESTART_MARKER = "# --- Reinício".encode()
+
+def count_scf_iterations(out_file_path):
+    """Conta as iterações SCF de um .out do SIESTA.
+
+    Retorna {"total", "first_cycle", "cycles"}: o total de iterações, as do
+    primeiro ciclo SCF (o que mais se beneficia de uma DM reaproveitada) e o
+    número de ciclos (um por passo de relaxação). Num .out com reinícios do
+    vigia, só a última tentativa conta.
+    """
+    total, first_cycle, cycles, previous = 0, 0, 0, 0
+    try:
+        with open(out_file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return {"total": 0, "first_cycle": 0, "cycles": 0}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = max(data.rfind(RESTART_MARKER), 0)
+                for match in SCF_ITERATION_PATTERN.finditer(data, start):
+                    iteration = int(match.group(1))
+                    if iteration <= previous or cycles == 0:
+                        cycles += 1
+                    if cycles == 1:
+                        first_cycle += 1
+                    total += 1
+                    previous = iteration
+    except FileNotFoundError:
+        pass
+    return {"total": total, "first_cycle": first_cycle, "cycles": cycles}
+
+OBSERVABLES = {
+    "energy": "Energia total (eV)",
+    "fermi": "Nível de Fermi (eV)",
+    "dipole": "Dipolo elétrico (Debye)"
+}
+NUMBER_PATTERN = rb"(-?\d+\.?\d*(?:[EeDd][-+]?\d+)?)"
+OBSERVABLE_PATTERNS = {
+    "energy": (b"siesta: Final energy (eV):", re.compile(rb"Total\s*=\s*" + NUMBER_PATTERN)),
+    "fermi": (b"Fermi =", re.compile(rb"Fermi\s*=\s*" + NUMBER_PATTERN)),
+    "dipole": (b"Electric dipole (Debye)",
+               re.compile(rb"Electric dipole \(Debye\)\s*=\s*" + NUMBER_PATTERN + rb"\s+" + NUMBER_PATTERN + rb"\s+" + NUMBER_PATTERN))
+}
+
+def read_observable(out_file_path, observable):
+    """Último valor de ``observable`` (chave de ``OBSERVABLES``) em um .out do SIESTA.
+
+    Retorna um float (energia, Fermi), uma tupla de 3 floats (dipolo) ou None.
+    """
+    anchor, pattern = OBSERVABLE_PATTERNS[observable]
+    try:
+        with open(out_file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return search_after_last(data, anchor, pattern)
+    except FileNotFoundError:
+        return None
+
+def search_after_last(data, anchor, pattern):
+    """Aplica ``pattern`` a partir da última ocorrência de ``anchor`` em ``data``.
+
+    Retorna o número capturado (float), uma tupla quando há vários grupos, ou None.
+    """
+    position = data.rfind(anchor)
+    match = pattern.search(data, position) if position != -1 else None
+    if not match:
+        return None
+    try:
+        values = [float(group.replace(b'D', b'E').replace(b'd', b'e')) for group in match.groups()]
+    except ValueError:
+        return None
+    return values[0] if len(values) == 1 else tuple(values)
+
+def refine_fields(fields, values, tolerance, min_step=0.0, max_delta=None):
+    """Novos campos onde a resposta observada deixa de ser linear ou muda rápido.
+
+    ``values`` mapeia o índice do campo para o observável medido (escalar ou
+    vetor). Ao longo de cada linha da grade (campos que só diferem num eixo), um
+    ponto cujo valor se afasta mais de ``tolerance`` da interpolação linear entre
+    os vizinhos marca os dois intervalos adjacentes; com ``max_delta``, também é
+    marcado todo intervalo cuja variação passa desse limite. Cada intervalo
+    marcado ganha o ponto médio, exceto se o novo passo ficar abaixo de
+    ``min_step`` (ou de 1e-6, a precisão dos campos) ou se o ponto cair na
+    pasta de um campo existente (``field_dir_name``).
+    """
+    import numpy as np
+    points = np.asarray(fields, dtype=float)
+    known = [i for i in range(len(points)) if values.get(i) is not None]
+    # Pastas, não tuplas: um ponto médio que caísse na pasta de um vizinho herdaria as saídas dele.
+    existing = {field_dir_name(point) for point in points}
+    new_fields = {}
+
+    for axis in range(3):
+        others = [a for a in range(3) if a != axis]
+        lines = {}
+        for i in known:
+            lines.setdefault(tuple(np.round(points[i, others], 6)), []).append(i)
+
+        for line in lines.values():
+            if len(line) < 2:
+                continue
+            line.sort(key=lambda i: points[i, axis])
+            x = points[line, axis]
+            y = np.array([np.atleast_1d(values[i]) for i in line], dtype=float)
+
+            flagged = set()
+            for k in range(1, len(line) - 1):
+                span = x[k + 1] - x[k - 1]
+                if span <= 0:
+                    continue
+                t = (x[k] - x[k - 1]) / span
+                if np.linalg.norm(y[k] - (y[k - 1] + t * (y[k + 1] - y[k - 1]))) > tolerance:
+                    flagged.update((k - 1, k))
+            if max_delta is not None:
+                for k in range(len(line) - 1):
+                    if np.linalg.norm(y[k + 1] - y[k]) > max_delta:
+                        flagged.add(k)
+
+            for k in sorted(flagged):
+                if (x[k + 1] - x[k]) / 2 < max(min_step, 1e-6):
+                    continue
+                midpoint = np.round((points[line[k]] + points[line[k + 1]]) / 2, 6) + 0.0
+                key = field_dir_name(midpoint)
+                if key not in existing:
+                    new_fields[key] = midpoint.tolist()
+
+    return list(new_fields.values())
+
+def field_dir_name(field):
+    """Nome da pasta do campo (``E_0p1000_0p0000_m0p2500``).
+
+    Cada componente usa 4 casas decimais, ou 6 (a precisão de ``FieldSet``)
+    quando não cabe em 4: campos distintos nunca dividem a pasta, e as pastas
+    de grades já existentes mantêm o nome.
+    """
+    parts = []
+    for value in field:
+        value = round(float(value), 6) + 0.0
+        parts.append(f"{value:.4f}" if round(value, 4) == value else f"{value:.6f}")
+    return ("E_" + "_".join(parts)).replace('.', 'p').replace('-', 'm')
+
+FIELD_BLOCK_COMMENT = "# -- ELECTRIC FIELD --"
+FIELD_STATUSES = ("pending", "running", "done", "failed")
+INPUT_STORE_DIR = ".omni_inputs"
+PREPARE_MANIFEST = "prepare_manifest.json"
+PREPARE_WORKERS = min(16, 2 * (os.cpu_count() or 1))
+RESULT_CACHE_DIR = ".omni_cache"
+JOURNAL_FILE = "calculation_journal.jsonl"
+WORKERS_DIR = ".omni_workers"
+CLAIM_FILE = ".omni_claim"
+LEASE_TIMEOUT = 300
+HEARTBEAT_INTERVAL = 30
+SHARED_POLL_INTERVAL = 5
+FIELD_METRICS_FILE = "metricas.json"
+METRICS_EXPORT_INTERVAL = 30
+PROMETHEUS_METRICS = [
+    ("wall_seconds", "Tempo de parede do cálculo do campo (s)"),
+    ("cpu_seconds", "Tempo de CPU somado sobre a árvore de processos do SIESTA (s)"),
+    ("peak_rss_bytes", "Pico da memória residente somada sobre a árvore de processos (bytes)"),
+    ("read_bytes", "Bytes lidos do disco pelo cálculo"),
+    ("write_bytes", "Bytes gravados no disco pelo cálculo"),
+    ("scf_steps", "Iterações SCF do cálculo"),
+    ("cg_steps", "Passos de relaxação (CG) do cálculo"),
+    ("restarts", "Reinícios feitos pelo vigia de travamento")
+]
+
+def format_prometheus(records, sweep):
+    """Métricas por campo no formato texto do Prometheus (coletor textfile do node exporter)."""
+    lines = []
+    for key, description in PROMETHEUS_METRICS:
+        name = f"omni_field_{key}"
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+        for record in records:
+            if record.get(key) is None:
+                continue
+            ex, ey, ez = record["field"]
+            labels = f'sweep="{sweep}",field_dir="{record["field_dir"]}",ex="{ex:.6f}",ey="{ey:.6f}",ez="{ez:.6f}"'
+            lines.append(f"{name}{{{labels}}} {record[key]}")
+    return "\n".join(lines) + "\n"
+RESULT_CACHE_INFO = ".omni_cache.json"
+# Só as saídas do cálculo vão para o cache (mais o concluido.txt); arquivos de
+# sessão do siesta.py, metricas.json e os arquivos de trabalho (.HSX etc.) ficam.
+RESULT_CACHE_SUFFIXES = (".out", ".XV", ".STRUCT_OUT", ".DM")
+
+def file_digest(path):
+    """SHA-256 do conteúdo de ``path`` (descompactado, se for .gz)."""
+    opener = gzip.open if str(path).lower().endswith('.gz') else open
+    digest = hashlib.sha256()
+    with opener(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(source, destination):
+    """Hardlink de ``source`` em ``destination``; link simbólico ou cópia como alternativas."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        try:
+            os.symlink(Path(source).resolve(), destination)
+        except OSError:
+            shutil.copy2(source, destination)
+
+EXTRAPOLATION_MODES = {
+    "none": "Nenhuma",
+    "linear": "Linear (2 campos)",
+    "quadratic": "Quadrática (3 campos)"
+}
+EXTRAPOLATION_POINTS = {"none": 1, "linear": 2, "quadratic": 3}
+
+def structure_to_arrays(vetores, coordenadas):
+    """Converte as linhas de vetores/coordenadas extraídas do .out em arrays NumPy.
+
+    Retorna ``(cell, coords, species)``: cell (n, 3), coords (N, 3) e a coluna de
+    espécies como array de strings.
+    """
+    import numpy as np
+    cell = np.array([[float(v) for v in line.split()[:3]] for line in vetores])
+    table = [line.split() for line in coordenadas]
+    coords = np.array([[float(v) for v in parts[:3]] for parts in table])
+    species = np.array([parts[3] for parts in table])
+    return cell, coords, species
+
+def arrays_to_structure(cell, coords, species):
+    """Inverso de ``structure_to_arrays``: gera as linhas dos blocos do FDF."""
+    vetores = [f"{a:.8f} {b:.8f} {c:.8f}" for a, b, c in cell]
+    coordenadas = [f"{x:.8f} {y:.8f} {z:.8f} {s}" for (x, y, z), s in zip(coords, species)]
+    return vetores, coordenadas
+
+def min_interatomic_distance(coords, cell=None, chunk=256):
+    """Menor distância entre átomos, incluindo as imagens periódicas vizinhas da célula."""
+    import numpy as np
+    if len(coords) == 0:
+        return np.inf
+    if cell is not None and np.shape(cell) == (3, 3):
+        offsets = np.array(list(itertools.product((-1, 0, 1), repeat=3)), dtype=float) @ cell
+    else:
+        offsets = np.zeros((1, 3))
+
+    best = np.inf
+    for offset in offsets:
+        shifted = coords + offset
+        self_image = not offset.any()
+        for start in range(0, len(coords), chunk):
+            block = coords[start:start + chunk]
+            distances = np.linalg.norm(block[:, None, :] - shifted[None, :, :], axis=2)
+            if self_image:
+                rows = np.arange(len(block))
+                distances[rows, rows + start] = np.inf
+            best = min(best, float(distances.min()))
+    return best
+
+def extrapolate_geometry(fields, cells, coords, target_field):
+    """Extrapola célula e coordenadas para ``target_field`` a partir de campos já relaxados.
+
+    ``fields``, ``cells`` e ``coords`` vêm do mais recente para o mais antigo. Os
+    campos são projetados na reta definida pelos dois mais recentes e a geometria
+    é extrapolada por Lagrange (linear com 2 pontos, quadrática com 3). Pontos
+    antigos fora dessa reta são descartados.
+    """
+    import numpy as np
+    fields = np.asarray(fields, dtype=float)
+    target = np.asarray(target_field, dtype=float)
+    step = fields[0] - fields[1]
+    spacing = np.linalg.norm(step)
+    if spacing < 1e-12:
+        return cells[0], coords[0]
+    direction = step / spacing
+
+    used = 2
+    for k in range(2, len(fields)):
+        offset = fields[k] - fields[0]
+        along = np.dot(offset, direction)
+        if np.linalg.norm(offset - along * direction) > 1e-3 * spacing:
+            break
+        if np.min(np.abs(along - (fields[:k] - fields[0]) @ direction)) < 1e-3 * spacing:
+            break
+        used = k + 1
+
+    s = (fields[:used] - fields[0]) @ direction
+    s_target = np.dot(target - fields[0], direction)
+    weights = []
+    for i in range(used):
+        weight = 1.0
+        for j in range(used):
+            if j != i:
+                weight *= (s_target - s[j]) / (s[i] - s[j])
+        weights.append(weight)
+
+    new_cell = sum(w * c for w, c in zip(weights, cells[:used]))
+    new_coords = sum(w * c for w, c in zip(weights, coords[:used]))
+    return new_cell, new_coords
+
+CHAIN_MODES = {
+    "blocks": "Blocos vizinhos",
+    "axes": "Por eixo (a partir do campo zero)",
+    "serial": "Serial",
+    "nearest": "Campo mais próximo já calculado",
+    "independent": "Independente"
+}
+
+def build_warm_start_parents(fields, mode="blocks", num_chains=1):
+    """Divide a lista de campos em cadeias independentes de continuação de geometria.
+
+    Retorna {índice: pai}, onde o pai é o campo cuja geometria relaxada serve de
+    ponto de partida (None = geometria do template).
+
+    - ``blocks``: ``num_chains`` trechos contíguos da lista (vizinhanças da grade);
+    - ``axes``: o campo de menor módulo é a raiz e cada direção/sinal forma uma
+      cadeia que parte dela em ordem crescente de módulo;
+    - ``serial``: uma única cadeia, como na execução sequencial;
+    - ``nearest``: cada campo parte do campo mais próximo que vem antes dele na lista
+      (O(n²), com todos os campos na memória);
+    - ``independent``: todos os campos partem do template.
+
+    ``blocks`` e ``axes`` leem os campos em blocos de ``FIELD_CHUNK_SIZE``.
+    """
+    import numpy as np
+    n = len(fields)
+    if n == 0:
+        return {}
+    if mode == "independent":
+        return {i: None for i in range(n)}
+    if mode == "serial":
+        mode, num_chains = "blocks", 1
+
+    parents = {}
+    if mode == "nearest":
+        values = np.asarray(fields, dtype=float)
+        parents[0] = None
+        for i in range(1, n):
+            parents[i] = int(np.argmin(np.linalg.norm(values[:i] - values[i], axis=1)))
+        return parents
+
+    if mode == "blocks":
+        num_chains = max(1, min(int(num_chains), n))
+        for chain in np.array_split(np.arange(n), num_chains):
+            previous = None
+            for i in chain:
+                parents[int(i)] = previous
+                previous = int(i)
+        return parents
+
+    if mode == "axes":
+        take = field_values_getter(fields)
+        norms = np.empty(n)
+        signs = np.empty((n, 3), dtype=np.int8)
+        for start in range(0, n, FIELD_CHUNK_SIZE):
+            values = take(np.arange(start, min(start + FIELD_CHUNK_SIZE, n)))
+            norms[start:start + len(values)] = np.linalg.norm(values, axis=1)
+            signs[start:start + len(values)] = np.sign(values)
+        root = int(np.argmin(norms))
+        parents[root] = None
+        groups = {}
+        for i in np.argsort(norms, kind='stable'):
+            i = int(i)
+            if i != root:
+                groups.setdefault(tuple(signs[i].tolist()), []).append(i)
+        for chain in groups.values():
+            previous = root
+            for i in chain:
+                parents[i] = previous
+                previous = i
+        return parents
+
+    raise ValueError(f"Modo de encadeamento desconhecido: {mode}")
+
+LAUNCHERS = {
+    "plain": "Serial/OpenMP (siesta)",
+    "mpi": "MPI (mpirun -np N)",
+    "hybrid": "Híbrido MPI × OpenMP"
+}
+
+def launcher_layout(launcher, cores_per_job, omp_threads=1):
+    """(ranks MPI, threads OpenMP) de um cálculo com ``cores_per_job`` núcleos."""
+    if launcher == "plain":
+        return 1, cores_per_job
+    if launcher == "mpi":
+        return cores_per_job, 1
+    if launcher == "hybrid":
+        threads = max(1, min(int(omp_threads), cores_per_job))
+        return max(1, cores_per_job // threads), threads
+    raise ValueError(f"Lançador desconhecido: {launcher}")
+
+def slot_cpu_sets(num_slots, cores_per_job):
+    """Núcleos de cada slot do agendador: blocos disjuntos dos núcleos disponíveis ao processo.
+
+    Se o orçamento passar do número de núcleos, os blocos dão a volta (e se sobrepõem).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    return [[available[(slot * cores_per_job + k) % len(available)] for k in range(cores_per_job)]
+            for slot in range(num_slots)]
+
+class FieldScheduler:
+    """Executa cálculos de campo em paralelo dentro de um orçamento de núcleos.
+
+    Cada cálculo ocupa ``cores_per_job`` núcleos e o número de slots simultâneos
+    é ``total_cores // cores_per_job``. Um job pode depender de outro (``parent``):
+    ele só é liberado depois que o pai terminar, o que preserva o warm start.
+    Exceções de um job vão para ``log`` (o log do motor) e contam como falha.
+    """
+    def __init__(self, total_cores, cores_per_job, log=print):
+        self.log = log
+        self.total_cores = max(1, int(total_cores))
+        self.cores_per_job = max(1, min(int(cores_per_job), self.total_cores))
+        self.num_slots = self.total_cores // self.cores_per_job
+        self.free_slots = list(range(self.num_slots))
+        self.running = {}
+        self.results = {}
+        self.condition = threading.Condition()
+
+    def run(self, jobs, run_job, should_continue=lambda: True):
+        """Executa ``jobs`` (lista de tuplas ``(index, parent)``) e retorna {index: sucesso}.
+
+        ``run_job(index, parent, slot)`` é chamado em uma thread por slot. Pais que
+        não fazem parte de ``jobs`` (ex.: concluídos em uma sessão anterior) são
+        considerados satisfeitos.
+        """
+        pending = list(jobs)
+        scheduled = {index for index, _ in pending}
+        self.results = {}
+
+        with self.condition:
+            while pending or self.running:
+                if should_continue():
+                    for job in list(pending):
+                        if not self.free_slots:
+                            break
+                        index, parent = job
+                        if parent is None or parent not in scheduled or parent in self.results:
+                            pending.remove(job)
+                            slot = self.free_slots.pop(0)
+                            self.running[index] = slot
+                            worker = threading.Thread(target=self._run_job,
+                                                      args=(run_job, index, parent, slot))
+                            worker.daemon = True
+                            worker.start()
+                elif not self.running:
+                    break
+                self.condition.wait(timeout=0.5)
+
+        return dict(self.results)
+
+    def _run_job(self, run_job, index, parent, slot):
+        try:
+            success = bool(run_job(index, parent, slot))
+        except Exception as e:
+            self.log(f"Erro no cálculo {index+1} (slot {slot+1}): {e}")
+            success = False
+
+        with self.condition:
+            self.results[index] = success
+            del self.running[index]
+            self.free_slots.append(slot)
+            self.free_slots.sort()
+            self.condition.notify_all()
+
+SAMPLING_MODES = {
+    "grid": "Grade (início, fim e passo por eixo)",
+    "sphere": "Cascas esféricas de módulo fixo",
+    "polar": "Círculos de módulo fixo num plano",
+    "lhs": "Hipercubo latino"
+}
+FIELD_CHUNK_SIZE = 65536
+# Acesso indexado (``fields[i]``): blocos menores, e os últimos ficam guardados.
+FIELD_BLOCK_SIZE = 1024
+FIELD_BLOCK_CACHE = 8
+
+def _axis_values(start, end, step):
+    import numpy as np
+    if start == end or step == 0:
+        return np.array([start], dtype=float)
+    if start < end:
+        values = np.arange(start, end + step/2, step)
+    else:
+        values = np.arange(start, end - step/2, -step)
+    return np.round(values, 6)
+
+def generate_axis_values(start, end, step):
+    return _axis_values(start, end, step).tolist()
+
+class FieldSet:
+    """Campos descritos por uma especificação compacta e calculados sob demanda.
+
+    ``spec`` traz ``sampling`` (uma chave de ``SAMPLING_MODES``), os parâmetros
+    do modo e ``order``:
+
+    - ``grid``: ``axes`` mapeia "x", "y" e "z" para ``(início, fim, passo)``;
+    - ``sphere``: ``magnitudes`` (V/Ang) e ``count`` pontos de Fibonacci por casca;
+    - ``polar``: ``magnitudes``, ``count`` ângulos igualmente espaçados e ``plane`` ("xy", "xz" ou "yz");
+    - ``lhs``: ``bounds`` mapeia os eixos para ``(mínimo, máximo)``, com ``count`` pontos e ``seed``.
+
+    O estado salvo guarda só a especificação. Na ordem cartesiana os campos
+    são gerados em blocos (``chunks``, ``take``) e a lista inteira nunca fica
+    na memória. As demais ordens são um limite a conhecer: ``__init__`` gera
+    todos os campos uma vez para calcular a permutação (``nearest`` custa
+    O(n²)) e depois guarda só ela; o mesmo vale para as cadeias ``nearest``
+    de ``build_warm_start_parents``.
+    """
+    def __init__(self, spec):
+        import numpy as np
+        self.spec = dict(spec)
+        sampling = self.spec.setdefault("sampling", "grid")
+        order = self.spec.setdefault("order", "cartesian")
+
+        if sampling == "grid":
+            axes = self.spec.get("axes", {})
+            self._axes = [_axis_values(*axes[axis]) if axis in axes else np.zeros(1) for axis in "xyz"]
+            self._shape = tuple(len(values) for values in self._axes)
+            self._size = int(np.prod(self._shape))
+        elif sampling in ("sphere", "polar"):
+            self._magnitudes = np.asarray(self.spec.get("magnitudes", []), dtype=float)
+            self._count = int(self.spec.get("count", 0))
+            self._size = len(self._magnitudes) * self._count
+            if sampling == "polar":
+                plane = self.spec.setdefault("plane", "xy")
+                if len(plane) != 2 or not set(plane) <= set("xyz") or plane[0] == plane[1]:
+                    raise ValueError(f"Plano inválido: {plane}")
+                self._plane = ["xyz".index(axis) for axis in plane]
+        elif sampling == "lhs":
+            self._size = int(self.spec.get("count", 0))
+            rng = np.random.default_rng(self.spec.setdefault("seed", 0))
+            self._lhs = np.zeros((self._size, 3))
+            for axis, (low, high) in sorted(self.spec.get("bounds", {}).items()):
+                strata = (rng.permutation(self._size) + rng.random(self._size)) / max(self._size, 1)
+                self._lhs[:, "xyz".index(axis)] = low + strata * (high - low)
+        else:
+            raise ValueError(f"Modo de amostragem desconhecido: {sampling}")
+
+        self._blocks = {}
+        self._blocks_lock = threading.Lock()
+        self._perm = None
+        if order != "cartesian" and self._size >= 3:
+            self._perm = np.asarray(field_order_permutation(self._generate(np.arange(self._size)), order))
+
+    def _generate(self, indices):
+        """Campos (k, 3) dos índices na ordem natural do modo de amostragem."""
+        import numpy as np
+        sampling = self.spec["sampling"]
+        if sampling == "grid":
+            coords = np.unravel_index(indices, self._shape)
+            values = np.stack([self._axes[axis][coords[axis]] for axis in range(3)], axis=1)
+        elif sampling == "sphere":
+            magnitude = self._magnitudes[indices // self._count]
+            k = indices % self._count
+            z = 1.0 - 2.0 * (k + 0.5) / self._count
+            r = np.sqrt(1.0 - z**2)
+            phi = k * np.pi * (3.0 - np.sqrt(5.0))
+            values = magnitude[:, None] * np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=1)
+        elif sampling == "polar":
+            magnitude = self._magnitudes[indices // self._count]
+            angle = 2.0 * np.pi * (indices % self._count) / self._count
+            values = np.zeros((len(indices), 3))
+            values[:, self._plane[0]] = magnitude * np.cos(angle)
+            values[:, self._plane[1]] = magnitude * np.sin(angle)
+        else:
+            values = self._lhs[indices]
+        return np.round(values, 6) + 0.0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        # Os slots leem campos de poucas regiões de cada vez: um bloco por região, em LRU.
+        start = index - index % FIELD_BLOCK_SIZE
+        with self._blocks_lock:
+            block = self._blocks.pop(start, None)
+            if block is None:
+                block = self.chunk(start, start + FIELD_BLOCK_SIZE).tolist()
+            self._blocks[start] = block
+            if len(self._blocks) > FIELD_BLOCK_CACHE:
+                del self._blocks[next(iter(self._blocks))]
+        return list(block[index - start])
+
+    def take(self, indices):
+        """Campos dos índices dados (na ordem de execução), como array (k, 3)."""
+        import numpy as np
+        indices = np.asarray(indices, dtype=int)
+        if self._perm is not None:
+            indices = self._perm[indices]
+        return self._generate(indices)
+
+    def chunk(self, start, stop):
+        """Campos ``start:stop`` na ordem de execução, como array (k, 3)."""
+        import numpy as np
+        return self.take(np.arange(start, min(stop, self._size)))
+
+    def chunks(self, size=FIELD_CHUNK_SIZE):
+        """Gera os campos em arrays (k, 3) de até ``size`` linhas, na ordem de execução."""
+        for start in range(0, self._size, size):
+            yield self.chunk(start, start + size)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk.tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        values = np.concatenate(list(self.chunks())) if self._size else np.zeros((0, 3))
+        return values if dtype is None else values.astype(dtype)
+
+    def tolist(self):
+        return list(self)
+
+    def to_dict(self):
+        return dict(self.spec)
+
+def generate_fields(axes, order="cartesian"):
+    """Gera o produto cartesiano dos valores dos eixos ativos.
+
+    ``axes`` mapeia "x", "y" e "z" para ``(início, fim, passo)``; eixos ausentes
+    ficam em 0.0. A lista resultante é reordenada segundo ``order``.
+    """
+    return FieldSet({"sampling": "grid", "axes": axes, "order": order}).tolist()
+
+class InputStore:
+    """Armazenamento endereçado por conteúdo dos arquivos de entrada da varredura.
+
+    Cada arquivo (PSF, siesta.py) é gravado uma vez em ``root`` com o nome do seu
+    SHA-256; as pastas de campo recebem hardlinks (ou links simbólicos, ou cópias
+    como último recurso). Arquivos ``.psf.gz`` são descompactados uma única vez.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def link_name(path):
+        name = Path(path).name
+        return name[:-3] if name.lower().endswith('.gz') else name
+
+    def add(self, path):
+        """Guarda ``path`` no armazenamento (se ainda não estiver) e retorna o hash."""
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        key = (path, info.st_size, info.st_mtime_ns)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+
+            opener = gzip.open if path.lower().endswith('.gz') else open
+            digest = hashlib.sha256()
+            temp_path = self.root / f".tmp-{os.getpid()}-{threading.get_ident()}"
+            with opener(path, 'rb') as source, open(temp_path, 'wb') as target:
+                for chunk in iter(lambda: source.read(1 << 20), b''):
+                    digest.update(chunk)
+                    target.write(chunk)
+            digest = digest.hexdigest()
+
+            stored = self.root / digest
+            if stored.exists():
+                temp_path.unlink()
+            else:
+                shutil.copymode(path, temp_path)
+                # Somente leitura: um hardlink editado numa pasta de campo alteraria todas.
+                os.chmod(temp_path, stat.S_IMODE(os.stat(temp_path).st_mode) & ~0o222)
+                os.replace(temp_path, stored)
+            self._digests[key] = digest
+            return digest
+
+    def link(self, digest, destination):
+        """Cria ``destination`` apontando para o arquivo armazenado (custo de metadados)."""
+        stored = self.root / digest
+        destination = Path(destination)
+        if destination.exists() or destination.is_symlink():
+            try:
+                if os.path.samefile(stored, destination):
+                    return
+            except OSError:
+                pass
+            destination.unlink()
+        link_or_copy(stored, destination)
+
+class StateJournal:
+    """Diário append-only (JSONL) dos eventos de cada campo: start, finish, cached e fail.
+
+    Cada evento é uma linha gravada com flush/fsync, então salvar o progresso
+    custa O(1) e uma queda no meio da escrita perde no máximo a última linha.
+    A cada ``compact_every`` eventos o arquivo é reescrito (substituição
+    atômica) com apenas o último evento de cada campo.
+
+    Com ``shared_dir`` (vários workers na mesma varredura), cada worker grava o
+    próprio diário ``journal.<worker>.jsonl`` nessa pasta, sem compactação, e a
+    leitura junta os diários de todos.
+    """
+    def __init__(self, path, compact_every=1000, shared_dir=None):
+        self.path = Path(path)
+        self.compact_every = compact_every
+        self.shared_dir = Path(shared_dir) if shared_dir else None
+        self.lock = threading.Lock()
+        self.handle = None
+        self.events_since_compaction = 0
+        self.offsets = {}
+
+    def record(self, event, index, field, **data):
+        entry = {"t": round(time.time(), 3), "event": event, "index": index,
+                 "field": [round(float(v), 6) for v in field]}
+        entry.update(data)
+        with self.lock:
+            if self.handle is None:
+                self.handle = open(self.path, 'a', encoding='utf-8')
+            self.handle.write(json.dumps(entry) + "\n")
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.events_since_compaction += 1
+            compact = bool(self.compact_every) and self.events_since_compaction >= self.compact_every
+        if compact:
+            self.compact()
+
+    def paths(self):
+        if self.shared_dir is None:
+            return [self.path]
+        return [self.shared_dir.parent / JOURNAL_FILE] + sorted(self.shared_dir.glob("journal.*.jsonl"))
+
+    def read_new(self):
+        """Eventos completos gravados desde a última leitura, de todos os diários, em ordem de ``t``."""
+        entries = []
+        for path in self.paths():
+            inode, offset = self.offsets.get(path, (None, 0))
+            try:
+                with open(path, 'rb') as f:
+                    info = os.fstat(f.fileno())
+                    # A compactação troca o arquivo (substituição atômica): relê do início,
+                    # mesmo que novos eventos já o tenham deixado maior que o offset antigo.
+                    if info.st_ino != inode or info.st_size < offset:
+                        offset = 0
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            end = data.rfind(b"\n") + 1
+            self.offsets[path] = (info.st_ino, offset + end)
+            for line in data[:end].splitlines():
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        entries.sort(key=lambda entry: entry.get("t", 0))
+        return entries
+
+    @staticmethod
+    def apply(events, entry):
+        previous = events.get(entry["index"])
+        # Um "start" posterior a uma conclusão não desfaz a conclusão.
+        if entry["event"] == "start" and previous and previous["event"] in ("finish", "cached"):
+            return
+        events[entry["index"]] = entry
+
+    def replay(self):
+        """Último evento de cada campo, {índice: evento}; linhas truncadas são ignoradas."""
+        self.offsets = {}
+        events = {}
+        for entry in self.read_new():
+            self.apply(events, entry)
+        return events
+
+    def compact(self, events=None):
+        with self.lock:
+            if events is None:
+                self._close()
+                events = self.replay()
+            self._close()
+            if events:
+                lines = "".join(json.dumps(events[index]) + "\n" for index in sorted(events))
+                write_text_atomic(self.path, lines)
+            self.events_since_compaction = 0
+
+    def clear(self):
+        with self.lock:
+            self._close()
+            if self.path.exists():
+                self.path.unlink()
+            self.events_since_compaction = 0
+
+    def _close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+class FieldClaims:
+    """Reserva de pastas de campo entre workers que compartilham a pasta da varredura (NFS/Lustre).
+
+    Um worker reserva um campo criando ``.omni_claim`` na pasta com O_EXCL; uma
+    thread renova o mtime das reservas (e o arquivo de status do worker em
+    ``.omni_workers``) a cada ``heartbeat_interval`` segundos. Uma reserva sem
+    renovação há mais de ``lease_timeout`` segundos é de um worker morto: quem a
+    renomear primeiro (rename é atômico) a retoma. As idades são medidas contra o
+    relógio do servidor de arquivos (o mtime do próprio status), não o do nó.
+    """
+    def __init__(self, workers_dir, worker_id=None, lease_timeout=LEASE_TIMEOUT, heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.workers_dir = Path(workers_dir)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.status_file = self.workers_dir / f"{self.worker_id}.json"
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.workers_dir.mkdir(parents=True, exist_ok=True)
+        self.heartbeat()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for path in list(self.held):
+            self.release(path.parent)
+        if self.status_file.exists():
+            self.status_file.unlink()
+
+    def _heartbeat_loop(self):
+        while not self.stop_event.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def heartbeat(self):
+        """Renova as reservas e regrava o status do worker."""
+        with self.lock:
+            held = list(self.held)
+        for path in held:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                with self.lock:
+                    self.held.discard(path)
+        write_text_atomic(self.status_file, json.dumps({
+            "worker": self.worker_id, "host": socket.gethostname(), "pid": os.getpid(),
+            "heartbeat": time.time(), "running": sorted(path.parent.name for path in held)}))
+
+    def server_now(self):
+        """Hora do servidor de arquivos: o mtime do status do worker, recém-tocado."""
+        try:
+            os.utime(self.status_file)
+            return self.status_file.stat().st_mtime
+        except FileNotFoundError:
+            return time.time()
+
+    def is_stale(self, path, now=None):
+        try:
+            return (now or self.server_now()) - path.stat().st_mtime > self.lease_timeout
+        except FileNotFoundError:
+            return False
+
+    def claim(self, field_dir):
+        """Tenta reservar a pasta; retorna False se outro worker vivo a detém."""
+        path = Path(field_dir) / CLAIM_FILE
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self.is_stale(path):
+                    return False
+                stale = path.with_name(f"{CLAIM_FILE}.stale.{self.worker_id}")
+                try:
+                    os.rename(path, stale)
+                except FileNotFoundError:
+                    continue
+                # Outro worker pode ter retomado a reserva entre a verificação e o rename.
+                if not self.is_stale(stale):
+                    try:
+                        os.link(stale, path)
+                    except FileExistsError:
+                        pass
+                    os.unlink(stale)
+                    return False
+                os.unlink(stale)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"worker": self.worker_id, "host": socket.gethostname(), "pid": os.getpid()}, f)
+            with self.lock:
+                self.held.add(path)
+            return True
+        return False
+
+    def release(self, field_dir):
+        path = Path(field_dir) / CLAIM_FILE
+        with self.lock:
+            if path not in self.held:
+                return
+            self.held.discard(path)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def holder(self, field_dir):
+        """Worker vivo que detém a pasta, ou None."""
+        path = Path(field_dir) / CLAIM_FILE
+        if self.is_stale(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f).get("worker")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def workers(workers_dir, lease_timeout=LEASE_TIMEOUT):
+        """Status dos workers com heartbeat recente."""
+        workers = []
+        for path in sorted(Path(workers_dir).glob("*.json")):
+            try:
+                with open(path, 'r') as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if time.time() - status.get("heartbeat", 0) <= lease_timeout:
+                workers.append(status)
+        return workers
+
+class SweepEngine:
+    """Prepara e executa uma varredura de campos elétricos sem interface gráfica.
+
+    A configuração fica em ``self.state`` (um ``CalculationState``). Os clientes
+    registram ``log`` para receber mensagens e ``ask_new_fdf`` para decidir o que
+    fazer quando um campo anterior não relaxou (retornar ``None`` interrompe a
+    execução). Sem ``ask_new_fdf`` (modo headless), o campo parte do FDF
+    template e as demais cadeias seguem. ``progress(feitas, total)`` é chamado durante a preparação das
+    pastas, a partir da thread que chamou ``prepare_files``, e
+    ``field_status(índice, status)`` a cada mudança de ``FIELD_STATUSES`` durante
+    a execução, a partir das threads do agendador. ``fields_added(campos)``
+    avisa sobre campos acrescentados pelo refinamento adaptativo.
+    """
+    def __init__(self, work_dir=None, log=print):
+        self.current_dir = Path(work_dir).resolve() if work_dir else Path.cwd()
+        self.state_file = self.current_dir / "calculation_state.json"
+        self.journal = StateJournal(self.current_dir / JOURNAL_FILE)
+        self.claims = None
+        self.attempted = set()
+        self.shared_failed = set()
+        self.cached_fields = set()
+        self.field_metrics = {}
+        self.slot_cpus = []
+        self.metrics_exported = 0.0
+        self.state = CalculationState()
+        self.completed_file = "concluido.txt"
+        # Sempre headless: só o SiestaRunner tem o vigia de travamento e grava metricas.json.
+        self.siesta_args = ["--headless"]
+        self.is_running = False
+        self.paused_for_fdf = False
+        self.last_dir = None
+        self.log = log
+        self.ask_new_fdf = None
+        self.progress = lambda done, total: None
+        self.field_status = lambda index, status: None
+        self.fields_added = lambda fields: None
+        self.run_dirs = {}
+        self.job_parents = {}
+        self.hops = []
+        self.state_lock = threading.Lock()
+        self.fdf_prompt_lock = threading.Lock()
+        self.scf_log_lock = threading.Lock()
+        self.geometry_history = OrderedDict()
+        self.geometry_lock = threading.Lock()
+        self._template = None
+        self.input_store = None
+        self.input_digests = {}
+        self.cache_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    @property
+    def base_dir(self):
+        return self.current_dir / self.state.base_dir_name
+
+    def load_state(self):
+        """Carrega ``calculation_state.json`` e reaplica o diário; retorna False se não existir.
+
+        Um campo conta como concluído se o último evento dele no diário for
+        ``finish`` ou ``cached`` para o mesmo vetor de campo.
+        """
+        if not self.state_file.exists():
+            return False
+        with open(self.state_file, 'r') as f:
+            self.state = CalculationState.from_dict(json.load(f))
+
+        journal = self.journal
+        workers_dir = self.current_dir / WORKERS_DIR
+        if self.claims is None and workers_dir.is_dir():
+            # Varredura consumida por vários workers: junta os diários de todos.
+            journal = StateJournal(self.journal.path, shared_dir=workers_dir)
+        events = journal.replay()
+        for index, event in events.items():
+            self.apply_journal_event(index, event)
+        if journal.shared_dir is None:
+            self.journal.compact(events)
+        return True
+
+    def apply_journal_event(self, index, event):
+        """Aplica ao estado um evento do diário; retorna True se ele concluiu o campo."""
+        if index >= len(self.state.fields) or event.get("field") != [round(v, 6) for v in self.state.fields[index]]:
+            return False
+        if event["event"] == "fail":
+            self.shared_failed.add(index)
+        if event["event"] not in ("finish", "cached"):
+            return False
+        with self.state_lock:
+            self.state.mark_completed(index)
+            if event.get("scf"):
+                self.state.scf_iterations[str(index)] = event["scf"]
+            if event.get("metrics"):
+                self.field_metrics[index] = event["metrics"]
+        return True
+
+    def enable_shared_mode(self, worker_id=None, lease_timeout=LEASE_TIMEOUT, heartbeat_interval=HEARTBEAT_INTERVAL):
+        """Permite que vários workers (um por nó) consumam a mesma varredura.
+
+        Cada campo é reservado com ``FieldClaims`` antes de rodar, e o progresso
+        de todos os workers é lido dos diários em ``.omni_workers``.
+        """
+        workers_dir = self.current_dir / WORKERS_DIR
+        self.claims = FieldClaims(workers_dir, worker_id, lease_timeout, heartbeat_interval)
+        self.journal = StateJournal(workers_dir / f"journal.{self.claims.worker_id}.jsonl",
+                                    compact_every=None, shared_dir=workers_dir)
+        workers_dir.mkdir(parents=True, exist_ok=True)
+
+    def sync_shared_progress(self):
+        """Incorpora os eventos gravados pelos outros workers desde a última leitura."""
+        # Leitura e aplicação juntas: read_new avança os offsets antes de os
+        # eventos serem aplicados, e outra thread não pode ver "nada novo" no meio.
+        with self.sync_lock:
+            for event in self.journal.read_new():
+                index = event.get("index")
+                if index is not None and not self.state.is_completed(index) and self.apply_journal_event(index, event):
+                    self.field_status(index, "done")
+
+    def claim_field(self, base_dir, index, parent):
+        """Reserva o campo para este worker; False se já concluído, reservado ou à espera do pai."""
+        self.sync_shared_progress()
+        if self.state.is_completed(index) or index in self.attempted:
+            return False
+        # O pai precisa ter terminado (aqui ou em outro worker) para servir de warm start.
+        if (parent is not None and not self.state.is_completed(parent)
+                and parent not in self.run_dirs and parent not in self.shared_failed):
+            return False
+        field_dir = self.get_field_dir(base_dir, self.state.fields[index])
+        if not self.claims.claim(field_dir):
+            return False
+        # Outro worker pode ter concluído o campo logo antes de liberar a reserva; o
+        # concluido.txt (gravado pelo siesta.py só ao fim de um cálculo bem-sucedido)
+        # cobre um diário ainda não visível neste nó.
+        self.sync_shared_progress()
+        if not self.state.is_completed(index) and (field_dir / self.completed_file).exists():
+            self.log(f"Campo {index+1} já concluído por outro worker ({self.completed_file} em {field_dir.name}).")
+            with self.state_lock:
+                self.state.mark_completed(index)
+            self.field_status(index, "done")
+        if self.state.is_completed(index):
+            self.claims.release(field_dir)
+            return False
+        self.attempted.add(index)
+        return True
+
+    def save_state(self):
+        """Grava a configuração da varredura (atomicamente); o progresso vai para o diário."""
+        try:
+            with self.state_lock:
+                write_text_atomic(self.state_file, json.dumps(self.state.to_dict(), indent=4))
+        except Exception as e:
+            self.log(f"Erro ao salvar o estado: {e}")
+
+    def clear_state(self):
+        if self.claims is not None:
+            # Os diários são o progresso dos outros workers: só o último worker ativo os apaga.
+            if FieldClaims.workers(self.claims.workers_dir, self.claims.lease_timeout):
+                return
+            for path in self.journal.paths():
+                if path.exists():
+                    path.unlink()
+        if self.state_file.exists():
+            self.state_file.unlink()
+        self.journal.clear()
+        self.state.last_completed_index = -1
+        self.state.completed_indices = []
+
+    def stop(self):
+        self.is_running = False
+        self.log("Parando execução...")
+
+    def log_hop_summary(self, parents):
+        hops = [hop for hop in field_hop_distances(self.state.fields, parents) if hop is not None]
+        if hops:
+            self.log(f"Saltos no espaço de campo: máximo {max(hops):.6f}, médio {sum(hops) / len(hops):.6f}, "
+                     f"total {sum(hops):.6f} V/Ang.")
+
+    def prepare_files(self, chain_mode=None):
+        """Cria as pastas de campo e liga os arquivos de entrada; retorna a pasta base.
+
+        As pastas são preparadas em paralelo e de forma incremental: o manifesto
+        ``prepare_manifest.json`` guarda um hash por pasta (campo, FDF gerado e
+        entradas), e só as pastas cujo hash mudou são tocadas. O progresso é
+        enviado a ``self.progress(feitas, total)``.
+        """
+        if not self.state.fdf_path:
+            raise ValueError("Selecione um arquivo FDF.")
+            
+        if not self.state.fields:
+            raise ValueError("Gere pelo menos um campo elétrico.")
+            
+        base_dir = self.base_dir
+        base_dir.mkdir(exist_ok=True)
+
+        # O template é analisado uma vez e o FDF de cada início de cadeia é gerado
+        # em memória; os demais campos recebem o FDF do campo anterior na execução.
+        num_slots = FieldScheduler(self.state.total_cores, self.state.cores_per_job).num_slots
+        parents = build_warm_start_parents(self.state.fields, chain_mode or self.state.chain_mode, num_slots)
+        heads = [i for i in range(len(self.state.fields)) if parents[i] is None]
+        variants = self.template_document().block_variants(
+            "ExternalElectricField", (field_block_body(self.state.fields[i]) for i in heads),
+            at_start=True, comment=FIELD_BLOCK_COMMENT)
+        fdf_texts = dict(zip(heads, variants))
+        fdf_name = Path(self.state.fdf_path).name
+        inputs = self.store_inputs(base_dir)
+
+        manifest_path = base_dir / PREPARE_MANIFEST
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = {}
+
+        tasks = []
+        for i, field in enumerate(self.state.fields):
+            field_dir = self.get_field_dir(base_dir, field)
+            fdf_text = fdf_texts.get(i)
+            entry = json.dumps([list(field), inputs, fdf_name if fdf_text is not None else None,
+                                hashlib.sha256(fdf_text.encode()).hexdigest() if fdf_text is not None else None])
+            entry_hash = hashlib.sha256(entry.encode()).hexdigest()
+            if manifest.get(field_dir.name) != entry_hash or not field_dir.is_dir():
+                tasks.append((field_dir, fdf_text, entry_hash))
+
+        skipped = len(self.state.fields) - len(tasks)
+        done = 0
+        self.progress(done, len(tasks))
+
+        def prepare(field_dir, fdf_text):
+            field_dir.mkdir(exist_ok=True)
+            self.prepare_field_files(field_dir, inputs)
+            if fdf_text is not None:
+                write_text_atomic(field_dir / fdf_name, fdf_text)
+
+        try:
+            with ThreadPoolExecutor(max_workers=PREPARE_WORKERS) as pool:
+                futures = {pool.submit(prepare, field_dir, fdf_text): (field_dir, entry_hash)
+                           for field_dir, fdf_text, entry_hash in tasks}
+                for future in as_completed(futures):
+                    future.result()
+                    field_dir, entry_hash = futures[future]
+                    manifest[field_dir.name] = entry_hash
+                    done += 1
+                    self.progress(done, len(tasks))
+        finally:
+            write_text_atomic(manifest_path, json.dumps(manifest, indent=1))
+
+        self.log(f"Preparados {len(tasks)} diretórios com arquivos de campo elétrico"
+                 f" ({skipped} já estavam atualizados).")
+        return base_dir
+            
+    def get_field_dir(self, base_dir, field):
+        return base_dir / field_dir_name(field)
+    
+    def template_document(self):
+        """FDF template analisado uma única vez (reanalisado se o arquivo mudar)."""
+        path = str(self.state.fdf_path)
+        mtime = os.path.getmtime(path)
+        if self._template is None or self._template[:2] != (path, mtime):
+            self._template = (path, mtime, FdfDocument.from_file(path))
+        return self._template[2]
+    
+    def write_fdf_from_template(self, field_dir, field_values):
+        """Escreve o FDF inicial (geometria do template) com o bloco de campo atualizado."""
+        document = self.template_document().copy()
+        document.set_block("ExternalElectricField", field_block_body(field_values),
+                           at_start=True, comment=FIELD_BLOCK_COMMENT)
+        document.write(field_dir / Path(self.state.fdf_path).name)
+    
+    def store_inputs(self, base_dir):
+        """Guarda PSFs e siesta.py no armazenamento da pasta base; retorna ``(hash, nome)``."""
+        store = InputStore(base_dir / INPUT_STORE_DIR)
+        paths = list(self.state.psf_files)
+        if self.state.siesta_python_path:
+            paths.append(self.state.siesta_python_path)
+        inputs = [(store.add(path), InputStore.link_name(path)) for path in paths]
+        self.input_store = store
+        return inputs
+    
+    def prepare_field_files(self, field_dir, inputs):
+        for digest, name in inputs:
+            self.input_store.link(digest, field_dir / name)
+            
+    def run_calculations(self):
+        """Executa todos os campos pendentes (bloqueante); retorna True se todos concluíram.
+
+        Com ``state.adaptive`` definido, a grade inicial é refinada em rodadas
+        (ver ``refine_adaptively``) antes de a varredura ser dada por concluída.
+        Com ``state.batch`` apontando para um gerenciador de filas, os campos
+        rodam como job array (ver ``omni_batch.BatchRun``); com o backend
+        ``cluster``, são distribuídos a workers pela rede (ver ``omni_cluster``).
+        """
+        if not self.state.fields:
+            raise ValueError("Nenhum campo elétrico foi gerado.")
+            
+        if not self.state.siesta_python_path:
+            raise ValueError("Selecione o caminho para siesta.py.")
+        if self.state.adaptive and self.state.adaptive.get("observable") not in OBSERVABLES:
+            raise ValueError("Escolha o observável do refinamento adaptativo.")
+        if self.state.launcher not in LAUNCHERS:
+            raise ValueError(f"Lançador desconhecido: {self.state.launcher}")
+        if self.claims is not None and (self.state.adaptive or (self.state.batch and self.state.batch.get("backend", "local") != "local")):
+            raise ValueError("O modo com vários workers não combina com refinamento adaptativo nem com filas.")
+
+        self.is_running = True
+        self.save_state()
+
+        # Após a primeira rodada adaptativa, os campos novos partem do vizinho mais próximo.
+        adaptive = self.state.adaptive
+        chain_mode = "nearest" if adaptive and adaptive.get("round") else self.state.chain_mode
+        completed = self.run_fields(chain_mode)
+        if completed and adaptive:
+            completed = self.refine_adaptively()
+
+        self.is_running = False
+        pending = [i for i in range(len(self.state.fields)) if not self.state.is_completed(i)]
+        if not completed or pending:
+            self.log(f"Execução finalizada com {len(pending)} cálculo(s) pendente(s). O estado foi mantido para retomada.")
+            return False
+
+        self.log("Todos os cálculos foram concluídos.")
+        self.clear_state()
+        return True
+    
+    def run_fields(self, chain_mode):
+        """Executa os campos pendentes no agendador local, como job array ou distribuídos a workers na rede."""
+        backend = (self.state.batch or {}).get("backend", "local")
+        if backend == "cluster":
+            from omni_cluster import ClusterCoordinator
+            self.run_dirs = {}
+            return ClusterCoordinator(self, chain_mode).run()
+        if backend != "local":
+            from omni_batch import BatchRun
+            self.run_dirs = {}
+            return BatchRun(self).run()
+        return self.run_pending_fields(chain_mode)
+
+    def run_pending_fields(self, chain_mode):
+        """Executa os campos ainda não concluídos; retorna True se não restar nenhum."""
+        base_dir = self.base_dir
+        scheduler = FieldScheduler(self.state.total_cores, self.state.cores_per_job, log=self.log)
+        self.run_dirs = {}
+
+        # Cada cadeia passa a geometria relaxada adiante internamente, enquanto as
+        # cadeias rodam lado a lado nos slots do agendador.
+        self.job_parents = build_warm_start_parents(self.state.fields, chain_mode, scheduler.num_slots)
+        jobs = [(i, self.job_parents[i]) for i in range(len(self.state.fields))
+                if not self.state.is_completed(i)]
+
+        num_chains = sum(1 for parent in self.job_parents.values() if parent is None)
+        self.log(f"Agendador: {scheduler.num_slots} slot(s) com {scheduler.cores_per_job} núcleo(s) cada; "
+                 f"{num_chains} cadeia(s) de warm start ({CHAIN_MODES[chain_mode]}).")
+        ranks, threads = launcher_layout(self.state.launcher, scheduler.cores_per_job, self.state.omp_threads)
+        self.slot_cpus = slot_cpu_sets(scheduler.num_slots, scheduler.cores_per_job) if self.state.pin_cpus else []
+        self.log(f"Lançador: {LAUNCHERS[self.state.launcher]}, {ranks} rank(s) × {threads} thread(s) por cálculo"
+                 + (", núcleos fixos por slot." if self.slot_cpus else "."))
+        if self.slot_cpus and scheduler.num_slots * scheduler.cores_per_job > len({cpu for cpus in self.slot_cpus for cpu in cpus}):
+            self.log("Aviso: o orçamento de núcleos excede os núcleos disponíveis; slots vão compartilhar núcleos.")
+        self.hops = field_hop_distances(self.state.fields, self.job_parents)
+        self.log_hop_summary(self.job_parents)
+
+        def run_job(index, parent, slot):
+            field = self.state.fields[index]
+            if self.claims is not None and not self.claim_field(base_dir, index, parent):
+                return False
+            self.field_status(index, "running")
+            self.journal.record("start", index, field, slot=slot)
+            started = time.time()
+            try:
+                success = self.run_field(base_dir, index, parent, slot, scheduler.cores_per_job)
+                elapsed = round(time.time() - started, 3)
+                metrics = None if index in self.cached_fields else self.read_field_metrics(index, field, started)
+                if success:
+                    self.journal.record("cached" if index in self.cached_fields else "finish", index, field,
+                                        elapsed=elapsed, scf=self.state.scf_iterations.get(str(index)), metrics=metrics)
+                else:
+                    self.journal.record("fail", index, field, elapsed=elapsed, metrics=metrics)
+            finally:
+                # A reserva só cai depois do evento no diário: outro worker que a
+                # pegue em seguida já vê o campo concluído.
+                if self.claims is not None:
+                    self.claims.release(self.get_field_dir(base_dir, field))
+            self.field_status(index, "done" if success else "failed")
+            self.export_metrics()
+            return success
+
+        if self.claims is None:
+            scheduler.run(jobs, run_job, lambda: self.is_running)
+        else:
+            self.run_shared(scheduler, jobs, run_job)
+        self.export_metrics(force=True)
+        return all(self.state.is_completed(i) for i in range(len(self.state.fields)))
+
+    def run_shared(self, scheduler, jobs, run_job):
+        """Passadas do agendador até não restar campo que este worker possa reservar.
+
+        Campos reservados por outros workers vivos (ou à espera de um pai deles)
+        são pulados; entre passadas o worker espera ``SHARED_POLL_INTERVAL``
+        segundos e relê os diários, até que os campos restantes terminem em
+        outro worker ou que as reservas de workers mortos vençam.
+        """
+        self.claims.start()
+        self.log(f"Worker {self.claims.worker_id} consumindo a varredura compartilhada "
+                 f"({len(FieldClaims.workers(self.claims.workers_dir))} worker(s) ativo(s)).")
+        try:
+            while self.is_running:
+                scheduler.run(jobs, run_job, lambda: self.is_running)
+                self.sync_shared_progress()
+                jobs = [(i, parent) for i, parent in jobs
+                        if not self.state.is_completed(i) and i not in self.attempted]
+                if not jobs:
+                    break
+                deadline = time.time() + SHARED_POLL_INTERVAL
+                while self.is_running and time.time() < deadline:
+                    time.sleep(min(1.0, deadline - time.time()))
+        finally:
+            self.claims.stop()
+    
+    def read_field_metrics(self, index, field, started):
+        """Registro de ``metricas.json`` gravado pelo siesta.py nesta execução, ou None."""
+        field_dir = self.run_dirs.get(index)
+        if field_dir is None:
+            return None
+        metrics_file = field_dir / FIELD_METRICS_FILE
+        try:
+            if metrics_file.stat().st_mtime < started:
+                return None
+            with open(metrics_file, 'r') as f:
+                metrics = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        metrics.update(field_dir=field_dir.name, field=[float(v) for v in field])
+        with self.state_lock:
+            self.field_metrics[index] = metrics
+        return metrics
+
+    @property
+    def metrics_export_file(self):
+        """Arquivo .prom da varredura; ``OMNI_METRICS_DIR`` aponta para o coletor textfile do node exporter."""
+        directory = Path(os.environ.get("OMNI_METRICS_DIR") or self.base_dir)
+        return directory / f"omni_{self.state.base_dir_name}.prom"
+
+    def export_metrics(self, force=False):
+        """Regrava o arquivo Prometheus, no máximo a cada ``METRICS_EXPORT_INTERVAL`` segundos."""
+        with self.state_lock:
+            if not self.field_metrics or (not force and time.time() - self.metrics_exported < METRICS_EXPORT_INTERVAL):
+                return
+            self.metrics_exported = time.time()
+            records = [self.field_metrics[index] for index in sorted(self.field_metrics)]
+        try:
+            write_text_atomic(self.metrics_export_file, format_prometheus(records, self.state.base_dir_name))
+        except OSError as e:
+            self.log(f"Aviso: não foi possível exportar as métricas: {e}")
+
+    def collect_observable(self, observable):
+        """Observável de cada campo concluído, lido do .out mais recente da pasta."""
+        values = {}
+        for i, field in enumerate(self.state.fields):
+            if not self.state.is_completed(i):
+                continue
+            out_files = list(self.get_field_dir(self.base_dir, field).glob("*.out"))
+            if out_files:
+                values[i] = read_observable(max(out_files, key=os.path.getmtime), observable)
+        return values
+    
+    def refine_adaptively(self):
+        """Insere campos onde a resposta não é linear até atingir a tolerância.
+
+        ``state.adaptive`` guarda ``observable``, ``tolerance``, ``max_delta``
+        (opcional), ``min_step``, ``max_rounds`` e a rodada atual (``round``), para
+        que uma varredura interrompida retome o refinamento.
+        """
+        adaptive = self.state.adaptive
+        observable = adaptive["observable"]
+        while self.is_running:
+            values = self.collect_observable(observable)
+            missing = sum(1 for value in values.values() if value is None)
+            if missing:
+                self.log(f"Aviso: {OBSERVABLES[observable]} não encontrado em {missing} saída(s); esses campos serão ignorados.")
+            
+            new_fields = refine_fields(self.state.fields, values, adaptive.get("tolerance", 1e-3),
+                                       adaptive.get("min_step", 0.0), adaptive.get("max_delta"))
+            if not new_fields:
+                self.log(f"Refinamento adaptativo concluído: tolerância atingida após {adaptive.get('round', 0)} rodada(s).")
+                return True
+            if adaptive.get("round", 0) >= adaptive.get("max_rounds", 4):
+                self.log(f"Refinamento adaptativo interrompido no limite de {adaptive.get('round', 0)} rodada(s); "
+                         f"{len(new_fields)} intervalo(s) ainda acima da tolerância.")
+                return True
+            
+            adaptive["round"] = adaptive.get("round", 0) + 1
+            self.state.fields = list(self.state.fields) + new_fields
+            self.fields_added(new_fields)
+            self.log(f"Rodada adaptativa {adaptive['round']}: {len(new_fields)} novo(s) campo(s) "
+                     f"({OBSERVABLES[observable]}).")
+            self.prepare_files(chain_mode="nearest")
+            self.save_state()
+            if not self.run_fields("nearest"):
+                return False
+        return False
+    
+    def harvest_results(self, workers=None):
+        """Coleta os resultados das pastas de campo em ``results.sqlite`` (ver omni_results)."""
+        from omni_results import harvest
+        if not self.base_dir.is_dir():
+            self.log(f"Pasta base não encontrada: {self.base_dir}")
+            return 0, 0
+        return harvest(self.base_dir, workers, log=self.log)
+    
+    def find_warm_start_ancestors(self, base_dir, parent, count):
+        """Sobe na cadeia de dependências e retorna até ``count`` campos já executados.
+
+        A lista vem do mais próximo para o mais antigo, como tuplas ``(campo, pasta)``.
+        """
+        ancestors = []
+        while parent is not None and len(ancestors) < count:
+            if parent in self.run_dirs:
+                ancestors.append((self.state.fields[parent], self.run_dirs[parent]))
+            elif self.state.is_completed(parent):
+                ancestors.append((self.state.fields[parent], self.get_field_dir(base_dir, self.state.fields[parent])))
+            parent = self.job_parents.get(parent)
+        return ancestors
+    
+    def find_warm_start_dir(self, base_dir, parent):
+        """Sobe na cadeia de dependências até o campo mais próximo que já foi executado."""
+        ancestors = self.find_warm_start_ancestors(base_dir, parent, 1)
+        return ancestors[0][1] if ancestors else None
+    
+    def run_field(self, base_dir, index, parent, slot, cores_per_job):
+        field = self.state.fields[index]
+        field_dir = self.get_field_dir(base_dir, field)
+
+        self.log(f"Executando cálculo {index+1}/{len(self.state.fields)} (slot {slot+1}): {field_dir.name}")
+
+        try:
+            staged, previous_dir = self.write_field_fdf(base_dir, index, parent)
+            if not staged:
+                return False
+            if previous_dir and self.state.reuse_dm:
+                self.stage_density_matrix(previous_dir, field_dir)
+            
+            siesta_script = field_dir / Path(self.state.siesta_python_path).name
+            
+            if not siesta_script.exists():
+                self.log(f"Erro: siesta.py não encontrado em {field_dir}")
+                return False
+            
+            cache_key = self.result_cache_key(field_dir, field) if self.state.result_cache else None
+            if cache_key and self.restore_cached_result(cache_key, field_dir):
+                self.run_dirs[index] = field_dir
+                self.last_dir = field_dir
+                self.log(f"Cálculo {index+1} reaproveitado do cache de resultados ({cache_key[:12]}).")
+                with self.state_lock:
+                    self.state.mark_completed(index)
+                    self.cached_fields.add(index)
+                return True
+            self.break_output_links(field_dir)
+            
+            env = self.launcher_environment(slot, cores_per_job)
+            process = subprocess.Popen(
+                [sys.executable, str(siesta_script)] + self.siesta_args,
+                cwd=field_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                env=env
+            )
+            
+            stdout, stderr = process.communicate()
+            self.run_dirs[index] = field_dir
+            self.last_dir = field_dir
+            self.record_scf_iterations(base_dir, index, field_dir, dm_reused=bool(previous_dir) and self.state.reuse_dm)
+            
+            if process.returncode == 0:
+                self.log(f"Cálculo {index+1} concluído com sucesso.")
+                completion_file = field_dir / self.completed_file
+                if completion_file.exists():
+                    self.log(f"Arquivo de conclusão encontrado: {completion_file}")
+                else:
+                    self.log(f"Aviso: Arquivo de conclusão não encontrado em {field_dir}")
+                with self.state_lock:
+                    self.state.mark_completed(index)
+                if cache_key:
+                    self.store_cached_result(cache_key, field_dir, field)
+                return True
+            
+            self.log(f"Erro no cálculo {index+1}: {stderr}")
+            return False
+            
+        except Exception as e:
+            self.log(f"Exceção no cálculo {index+1}: {str(e)}")
+            return False
+    
+    def write_field_fdf(self, base_dir, index, parent):
+        """Grava o FDF inicial do campo: template nas cabeças de cadeia, geometria do ancestral nas demais.
+
+        Retorna ``(ok, pasta anterior)``; ``ok`` é False se o FDF não pôde ser gerado.
+        """
+        field = self.state.fields[index]
+        field_dir = self.get_field_dir(base_dir, field)
+        ancestors = self.find_warm_start_ancestors(base_dir, parent, EXTRAPOLATION_POINTS[self.state.extrapolation])
+        previous_dir = ancestors[0][1] if ancestors else None
+        # O siesta.py roda o primeiro *.fdf da pasta: um FDF de outra origem (o
+        # template gravado na preparação, ou o de um pai anterior) não pode sobrar.
+        field_dir.mkdir(parents=True, exist_ok=True)
+        for stale_fdf in field_dir.glob("*.fdf"):
+            stale_fdf.unlink()
+        if previous_dir:
+            hop = self.hops[index] if index < len(self.hops) else None
+            hop_text = f" (salto {hop:.6f} V/Ang)" if hop is not None else ""
+            self.log(f"Campo {index+1} parte da geometria de {previous_dir.name}{hop_text}.")
+            return self.create_fdf_from_previous(field_dir, previous_dir, field, ancestors), previous_dir
+        self.write_fdf_from_template(field_dir, field)
+        return True, None
+
+    def launcher_environment(self, slot, cores_per_job):
+        """Ambiente do siesta.py: lançador, ranks, threads, núcleos reservados ao slot e scratch local."""
+        ranks, threads = launcher_layout(self.state.launcher, cores_per_job, self.state.omp_threads)
+        env = os.environ.copy()
+        env["OMNI_LAUNCHER"] = self.state.launcher
+        env["OMNI_MPI_RANKS"] = str(ranks)
+        env["OMP_NUM_THREADS"] = str(threads)
+        if slot < len(self.slot_cpus):
+            env["OMNI_CPUS"] = ",".join(str(cpu) for cpu in self.slot_cpus[slot])
+        else:
+            env.pop("OMNI_CPUS", None)
+        if self.state.scratch_dir:
+            # Um OMNI_SCRATCH_DIR já exportado no nó prevalece.
+            env.setdefault("OMNI_SCRATCH_DIR", self.state.scratch_dir)
+        return env
+
+    @property
+    def result_cache_dir(self):
+        return Path(os.environ.get("OMNI_CACHE_DIR") or self.current_dir / RESULT_CACHE_DIR)
+    
+    def input_names(self):
+        """Nomes dos arquivos de entrada ligados em cada pasta (PSFs e siesta.py)."""
+        names = {InputStore.link_name(path) for path in self.state.psf_files}
+        if self.state.siesta_python_path:
+            names.add(Path(self.state.siesta_python_path).name)
+        return names
+    
+    def input_digest(self, path):
+        """``file_digest`` de uma entrada, reaproveitado enquanto tamanho e mtime não mudarem."""
+        info = os.stat(path)
+        key = (os.path.abspath(path), info.st_size, info.st_mtime_ns)
+        with self.cache_lock:
+            digest = self.input_digests.get(key)
+        if digest is None:
+            digest = file_digest(path)
+            with self.cache_lock:
+                self.input_digests[key] = digest
+        return digest
+
+    def result_cache_key(self, field_dir, field):
+        """Hash dos FDFs da pasta, dos PSFs, do siesta.py, do lançador e do vetor de campo."""
+        psf_digests = [self.input_digest(path) for path in self.state.psf_files]
+        script_digest = self.input_digest(self.state.siesta_python_path) if self.state.siesta_python_path else None
+        launcher = [self.state.launcher, *launcher_layout(self.state.launcher, self.state.cores_per_job, self.state.omp_threads)]
+
+        fdf_digests = [(fdf.name, file_digest(fdf)) for fdf in sorted(field_dir.glob("*.fdf"))]
+        payload = json.dumps([fdf_digests, sorted(psf_digests), script_digest, launcher,
+                              [round(float(v), 6) for v in field]])
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def restore_cached_result(self, cache_key, field_dir):
+        """Liga na pasta as saídas de um cálculo idêntico já concluído; False se não houver."""
+        entry = self.result_cache_dir / cache_key
+        if not entry.is_dir():
+            return False
+        for cached in entry.iterdir():
+            if cached.name.startswith('.'):
+                continue
+            destination = field_dir / cached.name
+            if destination.exists() or destination.is_symlink():
+                destination.unlink()
+            link_or_copy(cached, destination)
+        return True
+    
+    def store_cached_result(self, cache_key, field_dir, field):
+        """Guarda (por hardlink) as saídas da pasta (``RESULT_CACHE_SUFFIXES``) no cache de resultados."""
+        entry = self.result_cache_dir / cache_key
+        if entry.exists():
+            return
+        temp_entry = self.result_cache_dir / f".{cache_key}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            temp_entry.mkdir(parents=True)
+            for output in field_dir.iterdir():
+                if (output.is_file() and not output.is_symlink() and not output.name.startswith('.')
+                        and (output.suffix in RESULT_CACHE_SUFFIXES or output.name == self.completed_file)):
+                    link_or_copy(output, temp_entry / output.name)
+            with open(temp_entry / RESULT_CACHE_INFO, 'w') as f:
+                json.dump({"field": list(field), "source": str(field_dir)}, f)
+            os.rename(temp_entry, entry)
+        except OSError as e:
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            if not entry.exists():
+                self.log(f"Aviso: não foi possível guardar {field_dir.name} no cache de resultados: {e}")
+    
+    def break_output_links(self, field_dir):
+        """Remove saídas compartilhadas com o cache antes de o SIESTA reescrevê-las no lugar."""
+        skip = self.input_names()
+        for output in field_dir.iterdir():
+            if output.name in skip or output.suffix == ".fdf" or not output.is_file():
+                continue
+            if output.is_symlink() or output.stat().st_nlink > 1:
+                output.unlink()
+    
+    def stage_density_matrix(self, previous_dir, current_dir):
+        """Copia a .DM do campo anterior para a pasta atual com o SystemLabel do novo FDF."""
+        fdf_files = list(current_dir.glob("*.fdf"))
+        previous_fdfs = list(previous_dir.glob("*.fdf"))
+        if not fdf_files or not previous_fdfs:
+            return False
+
+        previous_label = FdfDocument.from_file(previous_fdfs[0]).get("SystemLabel", "siesta")
+        label = FdfDocument.from_file(max(fdf_files, key=os.path.getmtime)).get("SystemLabel", "siesta")
+
+        dm_file = previous_dir / f"{previous_label}.DM"
+        if not dm_file.exists():
+            dm_files = list(previous_dir.glob("*.DM"))
+            if not dm_files:
+                self.log(f"Nenhuma matriz densidade (.DM) encontrada em {previous_dir}; SCF partirá do zero.")
+                return False
+            dm_file = max(dm_files, key=os.path.getmtime)
+
+        shutil.copy2(dm_file, current_dir / f"{label}.DM")
+        self.log(f"Matriz densidade reaproveitada: {dm_file.name} -> {current_dir.name}")
+        return True
+    
+    def record_scf_iterations(self, base_dir, index, field_dir, dm_reused):
+        """Registra o número de iterações SCF do campo no estado e em scf_iterations.csv."""
+        out_files = list(field_dir.glob("*.out"))
+        if not out_files:
+            return
+
+        scf = count_scf_iterations(max(out_files, key=os.path.getmtime))
+        field = self.state.fields[index]
+        self.log(f"Campo {index+1}: {scf['total']} iterações SCF em {scf['cycles']} ciclo(s) "
+                 f"(primeiro ciclo: {scf['first_cycle']}; DM reutilizada: {'sim' if dm_reused else 'não'}).")
+
+        with self.scf_log_lock:
+            self.state.scf_iterations[str(index)] = dict(scf, dm_reused=dm_reused)
+            csv_path = base_dir / "scf_iterations.csv"
+            write_header = not csv_path.exists()
+            with open(csv_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(["index", "Ex", "Ey", "Ez", "dm_reused", "scf_total", "scf_first_cycle", "scf_cycles"])
+                writer.writerow([index + 1, field[0], field[1], field[2], int(dm_reused),
+                                 scf["total"], scf["first_cycle"], scf["cycles"]])
+    
+    def load_relaxed_geometry(self, directory):
+        """Geometria relaxada (cell, coords, species) de uma pasta de campo, com cache LRU."""
+        key = str(directory)
+        with self.geometry_lock:
+            if key in self.geometry_history:
+                self.geometry_history.move_to_end(key)
+                return self.geometry_history[key]
+
+        out_files = list(directory.glob("*.out"))
+        fdf_files = list(directory.glob("*.fdf"))
+        if not out_files or not fdf_files:
+            return None
+        vetores, coordenadas, status = self.extrair_dados_otimizacao_final(
+            max(out_files, key=os.path.getctime), fdf_files[0])
+        if not vetores or not coordenadas or status != "relaxed":
+            return None
+
+        geometry = structure_to_arrays(vetores, coordenadas)
+        with self.geometry_lock:
+            self.geometry_history[key] = geometry
+            while len(self.geometry_history) > 64:
+                self.geometry_history.popitem(last=False)
+        return geometry
+    
+    def extrapolate_from_history(self, vetores, coordenadas, field_values, ancestors):
+        """Extrapola a geometria inicial a partir dos últimos campos relaxados da cadeia.
+
+        Volta para a geometria do campo anterior se o histórico for insuficiente ou
+        se a extrapolação aproximar demais os átomos.
+        """
+        import numpy as np
+        cell, coords, species = structure_to_arrays(vetores, coordenadas)
+        with self.geometry_lock:
+            self.geometry_history[str(ancestors[0][1])] = (cell, coords, species)
+
+        fields, cells, coord_list = [ancestors[0][0]], [cell], [coords]
+        for field, directory in ancestors[1:]:
+            geometry = self.load_relaxed_geometry(directory)
+            if geometry is None:
+                break
+            old_cell, old_coords, old_species = geometry
+            if old_cell.shape != cell.shape or old_coords.shape != coords.shape or not np.array_equal(old_species, species):
+                break
+            fields.append(field)
+            cells.append(old_cell)
+            coord_list.append(old_coords)
+
+        if len(fields) < 2:
+            return vetores, coordenadas
+
+        new_cell, new_coords = extrapolate_geometry(fields, cells, coord_list, field_values)
+        previous_distance = min_interatomic_distance(coords, cell)
+        new_distance = min_interatomic_distance(new_coords, new_cell)
+        if not np.all(np.isfinite(new_coords)) or new_distance < max(0.5, 0.75 * previous_distance):
+            self.log(f"Extrapolação descartada (distância mínima {new_distance:.3f} Ang); "
+                     "usando a geometria do campo anterior.")
+            return vetores, coordenadas
+
+        self.log(f"Geometria inicial extrapolada a partir de {len(fields)} campos relaxados.")
+        return arrays_to_structure(new_cell, new_coords, species)
+    
+    def create_fdf_from_previous(self, current_dir, previous_dir, field_values, ancestors=None):
+        try:
+            out_files = list(previous_dir.glob("*.out"))
+            if not out_files:
+                self.log(f"Nenhum arquivo .out encontrado em {previous_dir}")
+                return False
+                
+            latest_out = max(out_files, key=os.path.getctime)
+            
+            fdf_files = list(previous_dir.glob("*.fdf"))
+            if not fdf_files:
+                self.log(f"Nenhum arquivo .fdf encontrado em {previous_dir}")
+                return False
+                
+            latest_fdf = fdf_files[0]
+            
+            vetores, coordenadas, status = self.extrair_dados_otimizacao_final(latest_out, latest_fdf)
+            
+            if not vetores or not coordenadas:
+                self.log(f"Dados de otimização não encontrados em {latest_out}")
+                return False
+            
+            if status == "unrelaxed" and self.ask_new_fdf is None:
+                # Sem ninguém para escolher outro FDF, parar tudo derrubaria as outras cadeias.
+                self.log(f"Aviso: o cálculo em {previous_dir.name} não relaxou; "
+                         f"{current_dir.name} parte da geometria do FDF template.")
+                self.write_fdf_from_template(current_dir, field_values)
+                return True
+
+            if status == "unrelaxed":
+                with self.fdf_prompt_lock:
+                    self.is_running = False
+                    self.paused_for_fdf = True
+                    self.log("Aviso: O cálculo anterior não relaxou. Pausando a execução.")
+                    
+                    new_fdf_path = self.ask_new_fdf(current_dir)
+                    
+                    if new_fdf_path:
+                        shutil.copy2(new_fdf_path, current_dir)
+                        self.state.fdf_path = new_fdf_path
+                        self.paused_for_fdf = False
+                        self.is_running = True
+                        return True
+                    else:
+                        self.log("Seleção de novo FDF cancelada. Execução parada.")
+                        return False
+            
+            if ancestors and len(ancestors) > 1:
+                vetores, coordenadas = self.extrapolate_from_history(vetores, coordenadas, field_values, ancestors)
+            
+            documento = FdfDocument.from_file(latest_fdf)
+            documento.set_block("LatticeVectors", [f"    {linha.strip()}" for linha in vetores])
+            documento.set_block("AtomicCoordinatesAndAtomicSpecies", [f"    {linha.strip()}" for linha in coordenadas])
+            documento.set_block("ExternalElectricField", field_block_body(field_values))
+            
+            if self.state.reuse_dm:
+                documento.set("DM.UseSaveDM", "true")
+                    
+            nome_base = Path(self.state.fdf_path).stem
+            x_str = f"{field_values[0]:.4f}".replace('.', '_').replace('-', 'm')
+            y_str = f"{field_values[1]:.4f}".replace('.', '_').replace('-', 'm')
+            z_str = f"{field_values[2]:.4f}".replace('.', '_').replace('-', 'm')
+            
+            nome_saida = f"{nome_base}_E_{x_str}_{y_str}_{z_str}.fdf"
+            caminho_novo_arquivo = current_dir / nome_saida
+            
+            documento.write(caminho_novo_arquivo)
+
+            self.log(f"FDF criado com sucesso: {caminho_novo_arquivo}")
+            return True
+                
+        except Exception as e:
+            self.log(f"Erro ao criar FDF: {str(e)}")
+            return False
+    
+    def extrair_dados_otimizacao_final(self, out_file_path, fdf_file_path):
+        try:
+            lattice = FdfDocument.from_file(fdf_file_path).get_block("LatticeVectors")
+        except FileNotFoundError:
+            lattice = None
+
+        num_vectors = len(lattice.data_lines()) if lattice else 0
+        if num_vectors == 0:
+            return None, None, "unrelaxed"
+
+        return read_last_structure(out_file_path, num_vectors)
@@ -0,0 +1,176 @@
+"""
+OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Gerenciador de filas simulado, compatível com o subconjunto de ``sbatch`` e
+``squeue`` usado pelo backend Slurm do OMNI.
+
+``sbatch`` lê as diretivas ``#SBATCH --array=0-N%M`` e ``--output`` do script,
+registra o job em ``OMNI_FAKE_SPOOL`` (padrão ``~/.omni_fake_scheduler``) e
+dispara em segundo plano um executor que roda as tarefas como subprocessos
+locais, no máximo M ao mesmo tempo. ``squeue`` lista as tarefas pendentes ou
+em execução no formato ``job_tarefa ESTADO``, e ``sacct`` o estado de todas
+as tarefas, uma por linha.
+
+Uso:
+    python omni_fake_scheduler.py sbatch [--parsable] script.sh
+    python omni_fake_scheduler.py squeue -j JOB [-h] [-r] [-o FORMATO]
+    python omni_fake_scheduler.py sacct -j JOB [-n] [-X] [-P] [-o State]
+"""
+
+import os
+import re
+import sys
+import json
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+ARRAY_DIRECTIVE = re.compile(r"^#SBATCH\s+--array=(\d+)-(\d+)(?:%(\d+))?", re.MULTILINE)
+OUTPUT_DIRECTIVE = re.compile(r"^#SBATCH\s+--output=(\S+)", re.MULTILINE)
+
+
+def spool_dir():
+    path = Path(os.environ.get("OMNI_FAKE_SPOOL") or Path.home() / ".omni_fake_scheduler")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def write_json(path, data):
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def next_job_id(spool):
+    # O contador é protegido por um arquivo criado com O_EXCL.
+    lock = spool / ".lock"
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL)
+            break
+        except FileExistsError:
+            threading.Event().wait(0.01)
+    try:
+        counter = spool / "counter"
+        job_id = int(counter.read_text()) + 1 if counter.exists() else 1000
+        counter.write_text(str(job_id))
+        return job_id
+    finally:
+        os.close(fd)
+        lock.unlink()
+
+
+def sbatch(args):
+    script = Path([arg for arg in args if not arg.startswith("-")][-1]).resolve()
+    text = script.read_text()
+    match = ARRAY_DIRECTIVE.search(text)
+    first, last, limit = (int(match.group(1)), int(match.group(2)), match.group(3)) if match else (0, 0, None)
+    output = OUTPUT_DIRECTIVE.search(text)
+
+    spool = spool_dir()
+    job_id = next_job_id(spool)
+    write_json(spool / f"{job_id}.json", {
+        "script": str(script), "cwd": os.getcwd(),
+        "output": output.group(1) if output else "slurm-%A_%a.out",
+        "limit": int(limit) if limit else os.cpu_count() or 1,
+        "tasks": {str(task): "PENDING" for task in range(first, last + 1)}
+    })
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "_run", str(job_id)],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    print(job_id)
+    return 0
+
+
+def run_job(job_id):
+    """Executor em segundo plano: roda as tarefas e atualiza o arquivo do job."""
+    job_file = spool_dir() / f"{job_id}.json"
+    job = json.loads(job_file.read_text())
+    lock = threading.Lock()
+
+    def set_state(task, value):
+        with lock:
+            job["tasks"][task] = value
+            write_json(job_file, job)
+
+    def run_task(task):
+        set_state(task, "RUNNING")
+        log_path = Path(job["cwd"], job["output"].replace("%A", str(job_id)).replace("%a", task))
+        env = dict(os.environ, SLURM_JOB_ID=str(job_id), SLURM_ARRAY_JOB_ID=str(job_id), SLURM_ARRAY_TASK_ID=task)
+        with open(log_path, 'w') as log:
+            code = subprocess.call(["bash", job["script"]], cwd=job["cwd"], env=env,
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        set_state(task, "COMPLETED" if code == 0 else "FAILED")
+
+    with ThreadPoolExecutor(max_workers=job["limit"]) as pool:
+        list(pool.map(run_task, sorted(job["tasks"], key=int)))
+    return 0
+
+
+def job_tasks(args):
+    """{job: {tarefa: estado}} dos jobs em ``-j``; None se algum não existir."""
+    job_ids = []
+    for i, arg in enumerate(args):
+        if arg == "-j" and i + 1 < len(args):
+            job_ids += args[i + 1].split(',')
+    spool = spool_dir()
+    jobs = {}
+    for job_id in job_ids:
+        job_file = spool / f"{job_id}.json"
+        if not job_file.exists():
+            return None
+        tasks = json.loads(job_file.read_text())["tasks"]
+        jobs[job_id] = sorted(tasks.items(), key=lambda item: int(item[0]))
+    return jobs
+
+
+def squeue(args):
+    jobs = job_tasks(args)
+    if jobs is None:
+        print("slurm_load_jobs error: Invalid job id specified", file=sys.stderr)
+        return 1
+    for job_id, tasks in jobs.items():
+        for task, state in tasks:
+            if state in ("PENDING", "RUNNING"):
+                print(f"{job_id}_{task} {state}")
+    return 0
+
+
+def sacct(args):
+    jobs = job_tasks(args)
+    for tasks in (jobs or {}).values():
+        for _, state in tasks:
+            print(state)
+    return 0
+
+
+COMMANDS = {"sbatch": sbatch, "squeue": squeue, "sacct": sacct}
+
+
+def main(argv):
+    if len(argv) >= 2 and argv[0] == "_run":
+        return run_job(argv[1])
+    if not argv or argv[0] not in COMMANDS:
+        print(__doc__.split("Uso:")[1], file=sys.stderr)
+        return 2
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,256 @@
+"""
+OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Modelo de documento FDF: o arquivo é lido uma única vez e indexado por bloco e
+por opção, preservando comentários e linhas não reconhecidas.
+"""
+
+import os
+import re
+import threading
+
+COMMENT_CHARS = ('#', '!', ';')
+COMMENTED_BLOCK = re.compile(r'^[#!;]+\s*%block\s+(\S+)', re.IGNORECASE)
+COMMENTED_ENDBLOCK = re.compile(r'^[#!;]+\s*%endblock', re.IGNORECASE)
+
+
+def fdf_label(name):
+    """Normaliza um rótulo FDF: ignora maiúsculas e os caracteres '.', '_' e '-'."""
+    return name.lower().replace('.', '').replace('_', '').replace('-', '')
+
+
+class FdfBlock:
+    """Bloco ``%block``; ``commented`` indica um bloco desativado com '#'."""
+    def __init__(self, name, header, body, footer, commented=False):
+        self.name = name
+        self.header = header
+        self.body = body
+        self.footer = footer
+        self.commented = commented
+
+    def render(self):
+        return self.header + ''.join(self.body) + (self.footer or '')
+
+    def data_lines(self):
+        """Linhas do corpo que não são comentários nem vazias."""
+        return [line for line in self.body
+                if line.strip() and not line.strip().startswith(COMMENT_CHARS)]
+
+
+class FdfOption:
+    """Linha ``rótulo valor``."""
+    def __init__(self, key, value, line):
+        self.key = key
+        self.value = value
+        self.line = line
+
+    def render(self):
+        return self.line
+
+
+class FdfDocument:
+    """Arquivo FDF analisado uma vez, com índice de blocos e opções por rótulo.
+
+    As entradas (``FdfBlock``, ``FdfOption`` ou linhas de texto) ficam na ordem
+    original, então ``render`` reproduz o arquivo byte a byte quando nada muda.
+    """
+    def __init__(self, lines=()):
+        self.entries = []
+        self._parse(list(lines))
+        self._reindex()
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(text.splitlines(keepends=True))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(f.readlines())
+
+    def copy(self):
+        """Cópia independente, sem reler o disco."""
+        document = FdfDocument()
+        for entry in self.entries:
+            if isinstance(entry, FdfBlock):
+                entry = FdfBlock(entry.name, entry.header, list(entry.body), entry.footer, entry.commented)
+            document.entries.append(entry)
+        document._reindex()
+        return document
+
+    def _parse(self, lines):
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            stripped = line.strip()
+            lowered = stripped.lower()
+
+            if lowered.startswith('%block'):
+                parts = stripped.split()
+                name = parts[1] if len(parts) > 1 else ''
+                body, footer = [], None
+                i += 1
+                while i < len(lines):
+                    if lines[i].strip().lower().startswith('%endblock'):
+                        footer = lines[i]
+                        break
+                    body.append(lines[i])
+                    i += 1
+                self.entries.append(FdfBlock(name, line, body, footer))
+
+            elif COMMENTED_BLOCK.match(stripped):
+                name = COMMENTED_BLOCK.match(stripped).group(1)
+                body, footer = [], None
+                i += 1
+                while i < len(lines):
+                    if COMMENTED_ENDBLOCK.match(lines[i].strip()):
+                        footer = lines[i]
+                        break
+                    body.append(lines[i])
+                    i += 1
+                self.entries.append(FdfBlock(name, line, body, footer, commented=True))
+
+            elif stripped and not stripped.startswith(COMMENT_CHARS + ('%',)):
+                parts = stripped.split(None, 1)
+                value = parts[1] if len(parts) > 1 else ''
+                for char in COMMENT_CHARS:
+                    value = value.split(char, 1)[0]
+                self.entries.append(FdfOption(parts[0], value.strip(), line))
+
+            else:
+                self.entries.append(line)
+            i += 1
+
+    def _reindex(self):
+        self.blocks = {}
+        self.commented_blocks = {}
+        self.options = {}
+        for position, entry in enumerate(self.entries):
+            if isinstance(entry, FdfBlock):
+                index = self.commented_blocks if entry.commented else self.blocks
+                index.setdefault(fdf_label(entry.name), position)
+            elif isinstance(entry, FdfOption):
+                self.options.setdefault(fdf_label(entry.key), position)
+
+    # --- Opções ---
+    def get(self, key, default=None):
+        position = self.options.get(fdf_label(key))
+        return default if position is None else self.entries[position].value
+
+    def set(self, key, value):
+        """Substitui a opção (ou a acrescenta ao final do documento)."""
+        position = self.options.get(fdf_label(key))
+        if position is not None and self.entries[position].value == str(value):
+            return
+        option = FdfOption(key, str(value), f"{key:<38}{value}\n")
+        if position is None:
+            self._ensure_trailing_newline()
+            self.entries.append(option)
+            self._reindex()
+        else:
+            self.entries[position] = option
+
+    # --- Blocos ---
+    def get_block(self, name):
+        """Bloco ativo com este rótulo, ou None."""
+        position = self.blocks.get(fdf_label(name))
+        return None if position is None else self.entries[position]
+
+    def set_block(self, name, body, at_start=False, comment=None):
+        """Substitui o corpo do bloco ``name``.
+
+        Um bloco comentado com o mesmo rótulo é reativado no lugar. Se não existir,
+        o bloco é acrescentado ao final, ou antes da primeira linha não comentada
+        quando ``at_start`` é verdadeiro; ``comment`` é uma linha de cabeçalho opcional.
+        """
+        body = [line if line.endswith('\n') else line + '\n' for line in body]
+        block = FdfBlock(name, f"%block {name}\n", body, f"%endblock {name}\n")
+        label = fdf_label(name)
+
+        position = self.blocks.get(label, self.commented_blocks.get(label))
+        if position is not None:
+            self.entries[position] = block
+            self._reindex()
+            return
+
+        new_entries = ([comment if comment.endswith('\n') else comment + '\n'] if comment else []) + [block]
+        if at_start:
+            insert_at = 0
+            for position, entry in enumerate(self.entries):
+                if not isinstance(entry, str) or (entry.strip() and not entry.strip().startswith(COMMENT_CHARS)):
+                    insert_at = position
+                    break
+            self.entries[insert_at:insert_at] = new_entries
+        else:
+            self._ensure_trailing_newline()
+            self.entries.append('\n')
+            self.entries.extend(new_entries)
+        self._reindex()
+
+    def _ensure_trailing_newline(self):
+        if self.entries:
+            last = self.entries[-1]
+            text = last if isinstance(last, str) else last.render()
+            if text and not text.endswith('\n'):
+                self.entries.append('\n')
+
+    # --- Saída ---
+    def render(self):
+        return ''.join(entry if isinstance(entry, str) else entry.render() for entry in self.entries)
+
+    def write(self, path):
+        write_text_atomic(path, self.render())
+
+    def block_variants(self, name, bodies, at_start=False, comment=None):
+        """Gera o texto do documento para cada corpo de ``bodies`` no bloco ``name``.
+
+        O documento é renderizado uma única vez em prefixo e sufixo; cada variante
+        custa apenas a concatenação com o novo bloco.
+        """
+        template = self.copy()
+        template.set_block(name, [], at_start=at_start, comment=comment)
+        position = template.blocks[fdf_label(name)]
+        prefix = ''.join(entry if isinstance(entry, str) else entry.render()
+                         for entry in template.entries[:position])
+        suffix = ''.join(entry if isinstance(entry, str) else entry.render()
+                         for entry in template.entries[position + 1:])
+        for body in bodies:
+            lines = ''.join(line if line.endswith('\n') else line + '\n' for line in body)
+            yield f"{prefix}%block {name}\n{lines}%endblock {name}\n{suffix}"
+
+
+def write_text_atomic(path, text):
+    """Grava em um arquivo temporário na mesma pasta e renomeia sobre ``path``.
+
+    Um leitor (ou uma execução interrompida) nunca vê um FDF pela metade.
+    """
+    path = os.fspath(path)
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def field_block_body(field_values):
+    """Corpo do bloco ExternalElectricField para um vetor de campo (V/Ang)."""
+    return [f"    {field_values[0]:.6f} {field_values[1]:.6f} {field_values[2]:.6f} V/Ang\n"]
@@ -0,0 +1,186 @@
+"""
+OMNI - Orchestrated Modeling of Nanomaterials under electric-field Influence
+
+Copyright 2024 HenriqueDFT (Henrique Lago) - Grupo de Nanofísica Computacional (GNC-UFPI)
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Coleta dos resultados de uma varredura para um banco SQLite por campo.
+
+Cada pasta de campo tem seu .out mais recente lido uma vez (em paralelo, num
+pool de processos); uma nova coleta só relê as saídas cujo mtime ou tamanho
+mudou desde a última.
+"""
+
+import os
+import re
+import mmap
+import sqlite3
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from omni_engine import NUMBER_PATTERN, count_scf_iterations, search_after_last
+from omni_fdf import FdfDocument
+
+RESULTS_DB = "results.sqlite"
+
+FINAL_ENERGY = b"siesta: Final energy (eV):"
+RESULT_PATTERNS = {
+    "energy": (FINAL_ENERGY, re.compile(rb"Total\s*=\s*" + NUMBER_PATTERN)),
+    "free_energy": (FINAL_ENERGY, re.compile(rb"FreeEng\s*=\s*" + NUMBER_PATTERN)),
+    "fermi": (b"Fermi =", re.compile(rb"Fermi\s*=\s*" + NUMBER_PATTERN)),
+    "max_force": (b"siesta: Atomic forces (eV/Ang):",
+                  re.compile(rb"^\s*Max\s+" + NUMBER_PATTERN, re.MULTILINE)),
+    "dipole": (b"Electric dipole (Debye)",
+               re.compile(rb"Electric dipole \(Debye\)\s*=\s*" + rb"\s+".join([NUMBER_PATTERN] * 3))),
+    "stress": (b"Stress tensor Voigt",
+               re.compile(rb"Stress tensor Voigt\[x,y,z,yz,xz,xy\] \(kbar\):\s*" + rb"\s+".join([NUMBER_PATTERN] * 6))),
+    "wall_time": (b"Elapsed wall time (sec)", re.compile(rb"Elapsed wall time \(sec\)\s*=\s*" + NUMBER_PATTERN))
+}
+
+COLUMNS = [
+    ("field_dir", "TEXT PRIMARY KEY"), ("ex", "REAL"), ("ey", "REAL"), ("ez", "REAL"),
+    ("out_file", "TEXT"), ("mtime", "REAL"), ("size", "INTEGER"), ("finished", "INTEGER"),
+    ("energy", "REAL"), ("free_energy", "REAL"), ("fermi", "REAL"),
+    ("dipole_x", "REAL"), ("dipole_y", "REAL"), ("dipole_z", "REAL"), ("max_force", "REAL"),
+    ("stress_xx", "REAL"), ("stress_yy", "REAL"), ("stress_zz", "REAL"),
+    ("stress_yz", "REAL"), ("stress_xz", "REAL"), ("stress_xy", "REAL"),
+    ("scf_total", "INTEGER"), ("scf_cycles", "INTEGER"), ("wall_time", "REAL")
+]
+
+
+def parse_siesta_output(out_file_path):
+    """Extrai as grandezas principais de um .out do SIESTA (None onde não houver)."""
+    result = {name: None for name, _ in COLUMNS[8:]}
+    result["finished"] = 0
+    with open(out_file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return result
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            values = {name: search_after_last(data, anchor, pattern)
+                      for name, (anchor, pattern) in RESULT_PATTERNS.items()}
+            result["finished"] = int(data.rfind(b"End of run") != -1)
+
+    for name in ("energy", "free_energy", "fermi", "max_force", "wall_time"):
+        result[name] = values[name]
+    if values["dipole"]:
+        result["dipole_x"], result["dipole_y"], result["dipole_z"] = values["dipole"]
+    if values["stress"]:
+        (result["stress_xx"], result["stress_yy"], result["stress_zz"],
+         result["stress_yz"], result["stress_xz"], result["stress_xy"]) = values["stress"]
+
+    scf = count_scf_iterations(out_file_path)
+    result["scf_total"], result["scf_cycles"] = scf["total"], scf["cycles"]
+    return result
+
+
+def read_field_vector(field_dir):
+    """Campo (V/Ang) do bloco ExternalElectricField do FDF mais recente da pasta."""
+    fdf_files = list(Path(field_dir).glob("*.fdf"))
+    if not fdf_files:
+        return None
+    block = FdfDocument.from_file(max(fdf_files, key=os.path.getmtime)).get_block("ExternalElectricField")
+    if not block or not block.data_lines():
+        return None
+    try:
+        return [float(value) for value in block.data_lines()[0].split()[:3]]
+    except ValueError:
+        return None
+
+
+def harvest_field_dir(field_dir, out_file):
+    """Linha de resultados de uma pasta (executada nos processos do pool)."""
+    info = os.stat(out_file)
+    row = {"field_dir": Path(field_dir).name, "out_file": Path(out_file).name,
+           "mtime": info.st_mtime, "size": info.st_size}
+    row["ex"], row["ey"], row["ez"] = read_field_vector(field_dir) or (None, None, None)
+    row.update(parse_siesta_output(out_file))
+    return row
+
+
+class ResultsStore:
+    """Banco SQLite com uma linha por pasta de campo, indexado pelo vetor de campo."""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS)
+        with self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS results ({columns})")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_field ON results (ex, ey, ez)")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def known_outputs(self):
+        """{pasta: (arquivo, mtime, tamanho)} já coletados."""
+        rows = self.connection.execute("SELECT field_dir, out_file, mtime, size FROM results")
+        return {row["field_dir"]: (row["out_file"], row["mtime"], row["size"]) for row in rows}
+
+    def upsert(self, rows):
+        names = [name for name, _ in COLUMNS]
+        placeholders = ", ".join("?" for _ in names)
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(names)}) VALUES ({placeholders})",
+                [[row.get(name) for name in names] for row in rows])
+
+    def query(self, where="1", params=(), order_by="ex, ey, ez"):
+        """Linhas de ``results`` que satisfazem ``where`` (SQL), como dicionários."""
+        cursor = self.connection.execute(f"SELECT * FROM results WHERE {where} ORDER BY {order_by}", params)
+        return [dict(row) for row in cursor]
+
+    def get(self, field, tolerance=5e-5):
+        """Resultado do campo mais próximo de ``field`` dentro de ``tolerance`` (V/Ang)."""
+        rows = self.query("ABS(ex - ?) <= ? AND ABS(ey - ?) <= ? AND ABS(ez - ?) <= ?",
+                          (field[0], tolerance, field[1], tolerance, field[2], tolerance))
+        return rows[0] if rows else None
+
+
+def harvest(base_dir, workers=None, log=print):
+    """Coleta os resultados de todas as pastas de campo de ``base_dir`` em ``results.sqlite``.
+
+    Só as pastas com .out novo ou alterado (mtime/tamanho) são relidas.
+    Retorna ``(coletadas, inalteradas)``.
+    """
+    base_dir = Path(base_dir)
+    with ResultsStore(base_dir / RESULTS_DB) as store:
+        known = store.known_outputs()
+        tasks = []
+        unchanged = 0
+        for field_dir in sorted(base_dir.glob("E_*")):
+            out_files = list(field_dir.glob("*.out")) if field_dir.is_dir() else []
+            if not out_files:
+                continue
+            out_file = max(out_files, key=os.path.getmtime)
+            info = os.stat(out_file)
+            if known.get(field_dir.name) == (out_file.name, info.st_mtime, info.st_size):
+                unchanged += 1
+                continue
+            tasks.append((str(field_dir), str(out_file)))
+
+        rows = []
+        if tasks:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rows = list(pool.map(harvest_field_dir, *zip(*tasks), chunksize=16))
+            store.upsert(rows)
+
+    log(f"Resultados coletados: {len(rows)} pasta(s) lida(s), {unchanged} inalterada(s) "
+        f"({base_dir / RESULTS_DB}).")
+    return len(rows), unchanged
@@ -1,17 +1,58 @@
-import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog, ttk
+import asyncio
 import subprocess
 import os
+import re
 import sys
 import json
 import shutil
+import fnmatch
+import filecmp
+import hashlib
 import psutil
 import time
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 # --- Configurações e Arquivos de Estado ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 STATE_FILE = os.path.join(SCRIPT_DIR, "ultima_sessao.json")
 CONFIG_FILE = os.path.join(SCRIPT_DIR, "configuracao.json")
+METRICS_FILE = "metricas.json"
+
+# Vigia de travamento: sem saída nova (ou sem nova iteração SCF, depois da
+# primeira) por ``stall_timeout`` segundos, o Siesta é encerrado e reiniciado
+# até ``max_restarts`` vezes, esperando ``restart_backoff * 2**n`` segundos.
+WATCHDOG_DEFAULTS = {"stall_timeout": 1800, "max_restarts": 3, "restart_backoff": 30, "metrics_interval": 5}
+# Linha gravada no .out antes de cada reinício do vigia; a verificação de
+# conclusão só considera o que vem depois da última.
+RESTART_MARKER = "# --- Reinício"
+PROGRESS_PATTERN = re.compile(rb"^\s*(?:scf:\s+\d+|Begin .*move)", re.MULTILINE)
+# Lançadores: "{siesta}" é substituído pelo executável (e -Diagon-restart, se
+# for o caso); {ranks}, {threads} e {cpus} vêm das configurações abaixo, que
+# o OMNI passa por variáveis de ambiente (OMNI_LAUNCHER, OMNI_MPI_RANKS,
+# OMP_NUM_THREADS, OMNI_CPUS) e podem ser fixadas em configuracao.json.
+LAUNCHER_TEMPLATES = {
+    "plain": ["{siesta}"],
+    "mpi": ["mpirun", "-np", "{ranks}", "--cpu-set", "{cpus}", "--bind-to", "core", "{siesta}"],
+    "hybrid": ["mpirun", "-np", "{ranks}", "-x", "OMP_NUM_THREADS", "-x", "OMP_PLACES", "-x", "OMP_PROC_BIND",
+               "--cpu-set", "{cpus}", "--map-by", "slot:PE={threads}", "--bind-to", "core", "{siesta}"]
+}
+LAUNCHER_DEFAULTS = {"launcher": "plain", "siesta_executable": "siesta", "mpi_ranks": 1,
+                     "omp_threads": None, "cpus": None, "launcher_templates": {}}
+# Scratch local: com ``scratch_dir`` (ou OMNI_SCRATCH_DIR) o Siesta roda numa
+# pasta em disco local ou tmpfs, que recebe os arquivos de ``stage_in``; ao fim
+# do cálculo (concluído, interrompido ou travado) só os arquivos de
+# ``stage_back`` voltam para a pasta do campo. Os arquivos de trabalho grandes
+# (.HSX, .WFSX, .ORB_INDX) ficam no scratch, apagado em seguida salvo com
+# ``scratch_keep``. O .out continua sendo escrito na pasta do campo.
+STAGING_DEFAULTS = {"scratch_dir": None, "scratch_keep": False,
+                    "stage_in": ["*.fdf", "*.psf", "*.psml", "*.ion", "*.DM", "*.XV"],
+                    "stage_back": ["*.DM", "*.XV", "*.STRUCT_OUT", "*.ANI", "*.EIG", "*.KP", "*.bands", "*.FA", "*.xml"]}
+SCF_PATTERN = re.compile(rb"^\s*scf:\s+\d+", re.MULTILINE)
+MOVE_PATTERN = re.compile(rb"^\s*Begin .*move", re.MULTILINE)
 
 def load_state():
     """Carrega o estado do último cálculo do arquivo JSON."""
@@ -35,11 +76,14 @@ def load_config():
             try:
                 # Retorna a configuração existente, mas garante que o auto_restart esteja ativado
                 config = json.load(f)
-                config["auto_restart_enabled"] = True
-                return config
             except json.JSONDecodeError:
-                return {"auto_restart_enabled": True}
-    return {"auto_restart_enabled": True}
+                config = {}
+    else:
+        config = {}
+    config["auto_restart_enabled"] = True
+    for key, value in {**WATCHDOG_DEFAULTS, **LAUNCHER_DEFAULTS, **STAGING_DEFAULTS}.items():
+        config.setdefault(key, value)
+    return config
 
 def save_config(config_data):
     """Salva as configurações no arquivo JSON."""
@@ -61,6 +105,7 @@ def check_calculation_status(output_folder, fdf_name):
         except IOError:
             f.seek(0)
             content = f.read()
+    content = content.rpartition(RESTART_MARKER)[2]
     
     # As mensagens de sucesso agora são verificadas em uma lista
     success_messages = [
@@ -74,18 +119,268 @@ def check_calculation_status(output_folder, fdf_name):
     else:
         return "incomplete"
 
-def get_siesta_command(fdf_name, use_restart_flag=False):
-    """Determina o comando para executar o Siesta."""
-    siesta_args = "-Diagon-restart" if use_restart_flag else ""
-    return f"siesta {siesta_args}"
+def parse_cpu_list(text):
+    """Converte "0-3,8,10-11" em [0, 1, 2, 3, 8, 10, 11]."""
+    cpus = []
+    for part in str(text).split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
 
-# --- Classe da Aplicação ---
-class SiestaApp(tk.Tk):
+def launcher_settings(config):
+    """Lançador, ranks MPI, threads OpenMP e núcleos do cálculo (o ambiente prevalece sobre a configuração)."""
+    cpus = os.environ.get("OMNI_CPUS") or config.get("cpus")
+    if isinstance(cpus, str):
+        cpus = parse_cpu_list(cpus)
+    threads = os.environ.get("OMP_NUM_THREADS") or config.get("omp_threads")
+    return {
+        "launcher": os.environ.get("OMNI_LAUNCHER") or config.get("launcher", "plain"),
+        "siesta": config.get("siesta_executable", "siesta"),
+        "ranks": int(os.environ.get("OMNI_MPI_RANKS") or config.get("mpi_ranks") or 1),
+        "threads": int(threads) if threads else None,
+        "cpus": list(cpus) if cpus else None,
+        "templates": config.get("launcher_templates") or {}
+    }
+
+def get_siesta_command(use_restart_flag=False, settings=None):
+    """Monta o argv do Siesta a partir do modelo do lançador (sem passar por um shell)."""
+    settings = settings or launcher_settings(load_config())
+    name = settings["launcher"]
+    template = settings["templates"].get(name) or LAUNCHER_TEMPLATES.get(name)
+    if template is None:
+        raise ValueError(f"Lançador desconhecido: {name}")
+
+    cpus = settings["cpus"]
+    if cpus is None:
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    values = {"ranks": settings["ranks"], "threads": settings["threads"] or 1,
+              "cpus": ",".join(str(cpu) for cpu in cpus)}
+
+    command = []
+    for arg in template:
+        if arg == "{siesta}":
+            command.append(settings["siesta"])
+            if use_restart_flag:
+                command.append("-Diagon-restart")
+        else:
+            command.append(arg.format(**values))
+    return command
+
+def launcher_environment(settings):
+    """Ambiente do Siesta: threads OpenMP presas aos núcleos reservados ao cálculo."""
+    env = os.environ.copy()
+    if settings["threads"]:
+        env["OMP_NUM_THREADS"] = str(settings["threads"])
+    if settings["cpus"]:
+        env.setdefault("OMP_PLACES", "cores")
+        env.setdefault("OMP_PROC_BIND", "close")
+    return env
+
+def pin_to_cpus(cpus):
+    """``preexec_fn`` que restringe o processo (e seus filhos) aos núcleos dados."""
+    if not cpus or not hasattr(os, "sched_setaffinity"):
+        return None
+    return lambda: os.sched_setaffinity(0, cpus)
+
+def scratch_root(config):
+    """Pasta de scratch local (o ambiente prevalece sobre a configuração), ou None."""
+    path = os.environ.get("OMNI_SCRATCH_DIR") or config.get("scratch_dir")
+    return os.path.expandvars(os.path.expanduser(path)) if path else None
+
+def matching_files(folder, patterns):
+    return [name for name in sorted(os.listdir(folder))
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+            and os.path.isfile(os.path.join(folder, name))]
+
+def copy_changed(source, destination, names):
+    """Copia os arquivos ausentes ou com conteúdo diferente no destino (via temporário renomeado); retorna quantos.
+
+    Compara o conteúdo, não a data: um .DM herdado recém-copiado para a pasta do
+    campo é mais antigo que a cópia deixada no scratch por ``scratch_keep``.
+    """
+    copied = 0
+    for name in names:
+        source_path = os.path.join(source, name)
+        target_path = os.path.join(destination, name)
+        if os.path.exists(target_path) and filecmp.cmp(source_path, target_path, shallow=False):
+            continue
+        temp_path = os.path.join(destination, f".{name}.{os.getpid()}.tmp")
+        shutil.copy2(source_path, temp_path)
+        os.replace(temp_path, target_path)
+        copied += 1
+    return copied
+
+def open_pidfd(process):
+    """Descritor que fica legível quando o processo termina (Linux >= 5.3), ou None."""
+    if not hasattr(os, "pidfd_open"):
+        return None
+    try:
+        return os.pidfd_open(process.pid)
+    except OSError:
+        return None
+
+async def wait_for_exit(process):
+    """Espera o fim do processo sem polling e retorna o código de saída.
+
+    Com pidfd o laço de eventos é acordado pelo kernel assim que o filho sai;
+    sem ele, uma thread fica bloqueada em ``process.wait()``.
+    """
+    loop = asyncio.get_running_loop()
+    pidfd = open_pidfd(process)
+    if pidfd is None:
+        return await loop.run_in_executor(None, process.wait)
+
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    return process.wait()
+
+def terminate_process_tree(process, grace=10):
+    """Envia SIGTERM ao processo e aos filhos (ranks MPI) e mata quem não sair em ``grace`` s."""
+    try:
+        parent = psutil.Process(process.pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.NoSuchProcess:
+        return
+    for proc in processes:
+        try:
+            proc.terminate()
+        except psutil.NoSuchProcess:
+            pass
+    _, alive = psutil.wait_procs(processes, timeout=grace)
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+class OutputWatchdog:
+    """Acompanha o .out por deslocamento de bytes e detecta um cálculo parado.
+
+    Cada ``poll`` lê só os bytes novos desde a última leitura. O cálculo é dado
+    como travado se o arquivo não cresce por ``timeout`` segundos ou, depois
+    da primeira iteração SCF, se nenhuma iteração (ou passo de relaxação) nova
+    aparece nesse intervalo.
+    """
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        # Num reinício o .out já traz a tentativa anterior: só o que vier depois conta.
+        self.offset = os.path.getsize(path) if os.path.exists(path) else 0
+        self.partial = b""
+        self.steps = 0
+        self.last_output = self.last_step = time.monotonic()
+
+    def poll(self):
+        now = time.monotonic()
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self.offset:  # Arquivo truncado: recomeça do início.
+                    self.offset, self.partial = 0, b""
+                f.seek(self.offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        if not chunk:
+            return
+        self.offset += len(chunk)
+        self.last_output = now
+        lines, _, self.partial = (self.partial + chunk).rpartition(b"\n")
+        steps = len(PROGRESS_PATTERN.findall(lines))
+        if steps:
+            self.steps += steps
+            self.last_step = now
+
+    def stall_reason(self):
+        """Motivo do travamento, ou None se o cálculo ainda progride."""
+        now = time.monotonic()
+        if now - self.last_output > self.timeout:
+            return f"nenhuma saída nova em {self.timeout:.0f} s"
+        if self.steps and now - self.last_step > self.timeout:
+            return f"nenhuma iteração SCF nova em {self.timeout:.0f} s (última: {self.steps})"
+        return None
+
+class ResourceSampler:
+    """Amostra a árvore de processos do Siesta com psutil.
+
+    CPU e E/S são acumulados por PID (o último valor lido de cada processo),
+    então ranks que já saíram continuam contando; o pico de RSS é a maior soma
+    observada sobre a árvore inteira.
+    """
     def __init__(self):
-        super().__init__()
-        self.title("Siesta Runner")
-        self.geometry("400x300")
-        
+        self.started = time.time()
+        self.cpu = {}
+        self.io = {}
+        self.peak_rss = 0
+        self.samples = 0
+
+    def sample(self, process):
+        try:
+            parent = psutil.Process(process.pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        rss = 0
+        for proc in processes:
+            try:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    rss += proc.memory_info().rss
+                    self.cpu[proc.pid] = times.user + times.system
+                    if hasattr(proc, "io_counters"):
+                        io = proc.io_counters()
+                        self.io[proc.pid] = (io.read_bytes, io.write_bytes)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+        self.samples += 1
+
+    def summary(self, output_file, restarts):
+        """Registro de métricas do campo (gravado em ``metricas.json``)."""
+        cpu_seconds = sum(self.cpu.values())
+        if resource is not None:
+            # Os filhos já foram coletados: o kernel soma a CPU de toda a árvore.
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu_seconds = max(cpu_seconds, usage.ru_utime + usage.ru_stime)
+        scf_steps = cg_steps = 0
+        try:
+            with open(output_file, 'rb') as f:
+                content = f.read()
+            scf_steps = len(SCF_PATTERN.findall(content))
+            cg_steps = len(MOVE_PATTERN.findall(content))
+        except FileNotFoundError:
+            pass
+        return {
+            "wall_seconds": round(time.time() - self.started, 3),
+            "cpu_seconds": round(cpu_seconds, 3),
+            "peak_rss_bytes": self.peak_rss,
+            "read_bytes": sum(read for read, _ in self.io.values()),
+            "write_bytes": sum(write for _, write in self.io.values()),
+            "scf_steps": scf_steps,
+            "cg_steps": cg_steps,
+            "restarts": restarts,
+            "samples": self.samples,
+            "finished_at": time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+# --- Execução sem interface gráfica ---
+class SiestaRunner:
+    """Inicia e supervisiona um cálculo Siesta na pasta do script, sem Tk.
+
+    ``notify(titulo, mensagem)`` recebe os avisos que a interface gráfica mostra
+    em caixas de diálogo; no modo headless eles vão para o terminal.
+    """
+    def __init__(self, notify=None):
+        self.notify = notify or (lambda title, message: print(f"{title}: {message}", file=sys.stderr))
         self.state_data = load_state()
         self.config_data = load_config()
         save_config(self.config_data)  # Garante que a configuração inicial seja salva
@@ -95,12 +390,10 @@ class SiestaApp(tk.Tk):
         self.fdf_path = None
         self.psf_paths = []
         self.restarts = 0
+        self.run_folder = None
+        self.sampler = ResourceSampler()
 
         self.find_files_in_folder()
-        self.create_widgets()
-        
-        self.check_last_run()
-        self.iniciar_calculo_auto()
 
     def find_files_in_folder(self):
         """Procura por todos os arquivos .fdf e .psf na pasta do script."""
@@ -111,31 +404,6 @@ class SiestaApp(tk.Tk):
             self.fdf_path = os.path.join(SCRIPT_DIR, fdf_files[0])
         self.psf_paths = [os.path.join(SCRIPT_DIR, f) for f in psf_files]
 
-    def create_widgets(self):
-        main_frame = tk.Frame(self, padx=10, pady=10)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-
-        fdf_frame = tk.LabelFrame(main_frame, text="Arquivo FDF", padx=10, pady=5)
-        fdf_frame.pack(fill=tk.X, pady=5)
-        fdf_text = f"Arquivo FDF: {os.path.basename(self.fdf_path)}" if self.fdf_path else "Nenhum selecionado."
-        self.fdf_label = tk.Label(fdf_frame, text=fdf_text)
-        self.fdf_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        psf_frame = tk.LabelFrame(main_frame, text="Arquivos PSF", padx=10, pady=5)
-        psf_frame.pack(fill=tk.X, pady=5)
-        psf_text = f"Arquivos PSF: {len(self.psf_paths)} selecionados." if self.psf_paths else "Nenhum selecionado."
-        self.psf_label = tk.Label(psf_frame, text=psf_text)
-        self.psf_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
-
-        self.stop_button = tk.Button(main_frame, text="Interromper Cálculo", command=self.interromper_calculo, state=tk.DISABLED)
-        self.stop_button.pack(pady=5)
-
-        feedback_frame = tk.LabelFrame(main_frame, text="Status", padx=10, pady=5)
-        feedback_frame.pack(fill=tk.X, pady=10)
-
-        self.restarts_label = tk.Label(feedback_frame, text="Reinícios: 0")
-        self.restarts_label.pack(pady=5)
-        
     def check_last_run(self):
         if not self.state_data or not self.config_data["auto_restart_enabled"]:
             return
@@ -151,25 +419,27 @@ class SiestaApp(tk.Tk):
                     self.fdf_path = os.path.join(last_folder_path, fdf_name)
                     self.psf_paths = [os.path.join(last_folder_path, f) for f in os.listdir(last_folder_path) if f.endswith('.psf')]
                     self.restarts = self.state_data.get("restarts", 0)
-                    self.restarts_label.config(text=f"Reinícios: {self.restarts}")
 
-    def iniciar_calculo_auto(self):
-        if not self.fdf_path or not self.psf_paths:
-            messagebox.showwarning("Aviso", "Não foi encontrado um arquivo FDF ou PSF na pasta do script. O aplicativo será fechado.")
-            self.destroy()
-            return
-            
-        restarting = self.state_data and self.config_data["auto_restart_enabled"]
-        self.iniciar_calculo(restarting=restarting)
+    def has_inputs(self):
+        return bool(self.fdf_path and self.psf_paths)
 
-    def iniciar_calculo(self, restarting=False):
-        if self.siesta_process and self.siesta_process.poll() is None:
-            messagebox.showwarning("Aviso", "Já existe um cálculo em andamento. Interrompa-o primeiro.")
-            return
+    def is_running(self):
+        return self.siesta_process is not None and self.siesta_process.poll() is None
+
+    def iniciar_calculo(self, restarting=False, append_output=False):
+        """Inicia o Siesta; retorna False (após notificar) se não for possível.
+
+        Com ``append_output`` (reinício do vigia) a saída da tentativa anterior é
+        mantida no .out, separada por ``RESTART_MARKER``.
+        """
+        if self.is_running():
+            self.notify("Aviso", "Já existe um cálculo em andamento. Interrompa-o primeiro.")
+            return False
 
         output_folder = os.getcwd()
         fdf_name = os.path.basename(self.fdf_path)
         output_file_name = fdf_name.replace('.fdf', '.out')
+        run_folder = self.prepare_run_folder(output_folder)
         
         if not restarting:
             self.restarts = 0
@@ -178,81 +448,325 @@ class SiestaApp(tk.Tk):
         else:
             self.restarts += 1
             self.state_data["restarts"] = self.restarts
-            dm_file_path = os.path.join(output_folder, fdf_name.replace('.fdf', '.DM'))
+            dm_file_path = os.path.join(run_folder, fdf_name.replace('.fdf', '.DM'))
             use_restart_flag = os.path.exists(dm_file_path)
 
-        self.restarts_label.config(text=f"Reinícios: {self.restarts}")
         save_state(self.state_data)
 
-        siesta_command = get_siesta_command(fdf_name, use_restart_flag=use_restart_flag)
+        settings = launcher_settings(self.config_data)
         
         try:
-            self.output_file_handle = open(output_file_name, 'w')
+            siesta_command = get_siesta_command(use_restart_flag=use_restart_flag, settings=settings)
+            if self.output_file_handle and not self.output_file_handle.closed:
+                self.output_file_handle.close()
+            if not append_output and os.path.exists(os.path.join(output_folder, "concluido.txt")):
+                # Marca de uma execução anterior: só esta execução pode recriá-la.
+                os.remove(os.path.join(output_folder, "concluido.txt"))
+            self.output_file_handle = open(output_file_name, 'a' if append_output else 'w')
+            if append_output:
+                self.output_file_handle.write(f"\n{RESTART_MARKER} {self.restarts} ({time.strftime('%Y-%m-%d %H:%M:%S')}) ---\n")
+                self.output_file_handle.flush()
             
-            with open(self.fdf_path, 'r') as fdf_input:
+            fdf_input_path = self.fdf_path if run_folder == output_folder else os.path.join(run_folder, fdf_name)
+            with open(fdf_input_path, 'r') as fdf_input:
                 self.siesta_process = subprocess.Popen(
                     siesta_command,
-                    shell=True,
-                    cwd=output_folder,
+                    cwd=run_folder,
                     stdin=fdf_input,
                     stdout=self.output_file_handle,
-                    stderr=subprocess.STDOUT
+                    stderr=subprocess.STDOUT,
+                    env=launcher_environment(settings),
+                    preexec_fn=pin_to_cpus(settings["cpus"])
                 )
-
-            self.stop_button.config(state=tk.NORMAL)
-            self.monitor_process()
+            return True
         except Exception as e:
-            messagebox.showerror("Erro", f"Não foi possível iniciar o cálculo. Erro: {e}")
-            self.stop_button.config(state=tk.DISABLED)
+            self.notify("Erro", f"Não foi possível iniciar o cálculo. Erro: {e}")
             if self.output_file_handle:
                 self.output_file_handle.close()
+            return False
+
+    def prepare_run_folder(self, output_folder):
+        """Pasta onde o Siesta roda: a do campo ou, com scratch configurado, uma cópia local dela."""
+        if self.run_folder:
+            return self.run_folder
+        root = scratch_root(self.config_data)
+        run_folder = output_folder
+        if root:
+            # Nome fixo por pasta de campo: um cálculo retomado no mesmo nó reencontra o scratch.
+            digest = hashlib.sha1(os.path.abspath(output_folder).encode()).hexdigest()[:10]
+            run_folder = os.path.join(root, f"omni_{os.path.basename(output_folder)}_{digest}")
+            try:
+                os.makedirs(run_folder, exist_ok=True)
+                copy_changed(output_folder, run_folder, matching_files(output_folder, self.config_data["stage_in"]))
+            except OSError as e:
+                self.notify("Aviso", f"Não foi possível preparar o scratch {run_folder} ({e}); "
+                                     f"o cálculo roda na pasta do campo.")
+                run_folder = output_folder
+        self.run_folder = run_folder
+        return run_folder
+
+    def stage_back(self):
+        """Traz do scratch as saídas de ``stage_back`` e apaga o scratch (também após falhas)."""
+        output_folder = os.getcwd()
+        if not self.run_folder or self.run_folder == output_folder:
+            return
+        try:
+            copy_changed(self.run_folder, output_folder, matching_files(self.run_folder, self.config_data["stage_back"]))
+        except OSError as e:
+            self.notify("Erro", f"Não foi possível copiar as saídas de {self.run_folder}: {e}. O scratch foi mantido.")
+            return
+        if not self.config_data["scratch_keep"]:
+            shutil.rmtree(self.run_folder, ignore_errors=True)
+        self.run_folder = None
 
     def interromper_calculo(self):
-        if self.siesta_process and self.siesta_process.poll() is None:
+        """Encerra a árvore de processos do Siesta; retorna a mensagem de resultado."""
+        if not self.is_running():
+            return None
+        try:
+            parent = psutil.Process(self.siesta_process.pid)
+            for child in parent.children(recursive=True):
+                child.terminate()
+            parent.terminate()
+            return "Cálculo Siesta interrompido com sucesso."
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self.siesta_process.kill()
+            return "Cálculo Siesta interrompido com sucesso (forçado)."
+        finally:
             try:
-                parent = psutil.Process(self.siesta_process.pid)
-                for child in parent.children(recursive=True):
-                    child.terminate()
-                parent.terminate()
-                messagebox.showinfo("Interrompido", "Cálculo Siesta interrompido com sucesso.")
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                self.siesta_process.kill()
-                messagebox.showinfo("Interrompido", "Cálculo Siesta interrompido com sucesso (forçado).")
-            finally:
-                self.siesta_process = None
-                if self.output_file_handle:
-                    self.output_file_handle.close()
-                self.stop_button.config(state=tk.DISABLED)
+                self.siesta_process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+            self.siesta_process = None
+            if self.output_file_handle:
+                self.output_file_handle.close()
+            self.stage_back()
+
+    def finalizar(self):
+        """Fecha a saída, verifica o resultado e grava concluido.txt; retorna o status."""
+        # O filho já saiu: tudo o que ele escreveu no .out está visível para a leitura.
+        if self.output_file_handle:
+            self.output_file_handle.close()
+        self.stage_back()
+
+        if not self.fdf_path:
+            return "incomplete"
+
+        output_folder = os.getcwd()
+        fdf_name = os.path.basename(self.fdf_path)
+        status = check_calculation_status(output_folder, fdf_name)
+        
+        if status == "completed":
+            # A sessão terminou: uma nova execução na pasta não deve retomá-la.
+            if os.path.exists(STATE_FILE):
+                os.remove(STATE_FILE)
+            self.state_data = {}
+            concluido_file_path = os.path.join(output_folder, "concluido.txt")
+            try:
+                with open(concluido_file_path, "w") as f:
+                    f.write("O cálculo Siesta foi concluído com sucesso.\n")
+                    f.write(f"Data e hora de conclusão: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            except Exception as e:
+                print(f"Erro: Não foi possível criar o arquivo concluido.txt. Erro: {e}")
+        return status
+
+    def run(self):
+        """Fluxo completo sem interface: inicia, vigia (reiniciando se travar) e finaliza. Retorna o código de saída."""
+        return asyncio.run(self.supervise())
+
+    async def supervise(self):
+        if not self.has_inputs():
+            self.notify("Aviso", "Não foi encontrado um arquivo FDF ou PSF na pasta do script.")
+            return 1
+
+        # Só os reinícios do vigia dentro deste laço contam; cada execução começa do zero.
+        restarting = False
+        while True:
+            if not self.iniciar_calculo(restarting=restarting, append_output=restarting):
+                self.stage_back()
+                return 1
+            reason = await self.watch()
+            if reason is None:
+                break
+
+            terminate_process_tree(self.siesta_process)
+            self.siesta_process.wait()
+            self.output_file_handle.close()
+            attempts = self.restarts + 1
+            if attempts > self.config_data["max_restarts"]:
+                self.notify("Erro", f"Cálculo travado ({reason}); limite de {self.config_data['max_restarts']} reinício(s) atingido.")
+                break
+            delay = self.config_data["restart_backoff"] * 2 ** self.restarts
+            self.notify("Aviso", f"Cálculo travado ({reason}). Reinício {attempts} em {delay:g} s.")
+            await asyncio.sleep(delay)
+            restarting = True
+
+        status = self.finalizar()
+        self.write_metrics()
+        return 0 if status == "completed" else 1
+
+    def write_metrics(self):
+        metrics = self.sampler.summary(self.output_file_handle.name, self.restarts)
+        try:
+            with open(METRICS_FILE, "w") as f:
+                json.dump(metrics, f, indent=4)
+        except OSError as e:
+            print(f"Erro: Não foi possível gravar {METRICS_FILE}. Erro: {e}")
+
+    async def watch(self):
+        """Espera o Siesta sair; retorna None ao sair ou o motivo, se o vigia detectar travamento."""
+        exited = asyncio.ensure_future(wait_for_exit(self.siesta_process))
+        timeout = self.config_data["stall_timeout"]
+        watchdog = OutputWatchdog(self.output_file_handle.name, timeout) if timeout else None
+        interval = min(30.0, timeout / 4) if timeout else 30.0
+        if self.config_data["metrics_interval"]:
+            interval = min(interval, self.config_data["metrics_interval"])
+
+        # Amostras frequentes no início, para que cálculos curtos também sejam medidos.
+        wait = min(0.5, interval)
+        while True:
+            self.sampler.sample(self.siesta_process)
+            done, _ = await asyncio.wait({exited}, timeout=wait)
+            wait = min(wait * 2, interval)
+            if done:
+                return None
+            if watchdog is None:
+                continue
+            watchdog.poll()
+            reason = watchdog.stall_reason()
+            if reason:
+                exited.cancel()
+                try:
+                    await exited
+                except asyncio.CancelledError:
+                    pass
+                return reason
+
+# --- Classe da Aplicação ---
+class SiestaApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Siesta Runner")
+        self.root.geometry("400x300")
+        
+        self.runner = SiestaRunner(notify=messagebox.showwarning)
+
+        self.pidfd = None
+
+        self.runner.check_last_run()
+        self.create_widgets()
+        
+        self.iniciar_calculo_auto()
+
+    def create_widgets(self):
+        main_frame = tk.Frame(self.root, padx=10, pady=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        fdf_path = self.runner.fdf_path
+        psf_paths = self.runner.psf_paths
+
+        fdf_frame = tk.LabelFrame(main_frame, text="Arquivo FDF", padx=10, pady=5)
+        fdf_frame.pack(fill=tk.X, pady=5)
+        fdf_text = f"Arquivo FDF: {os.path.basename(fdf_path)}" if fdf_path else "Nenhum selecionado."
+        self.fdf_label = tk.Label(fdf_frame, text=fdf_text)
+        self.fdf_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        psf_frame = tk.LabelFrame(main_frame, text="Arquivos PSF", padx=10, pady=5)
+        psf_frame.pack(fill=tk.X, pady=5)
+        psf_text = f"Arquivos PSF: {len(psf_paths)} selecionados." if psf_paths else "Nenhum selecionado."
+        self.psf_label = tk.Label(psf_frame, text=psf_text)
+        self.psf_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        self.stop_button = tk.Button(main_frame, text="Interromper Cálculo", command=self.interromper_calculo, state=tk.DISABLED)
+        self.stop_button.pack(pady=5)
+
+        feedback_frame = tk.LabelFrame(main_frame, text="Status", padx=10, pady=5)
+        feedback_frame.pack(fill=tk.X, pady=10)
+
+        self.restarts_label = tk.Label(feedback_frame, text=f"Reinícios: {self.runner.restarts}")
+        self.restarts_label.pack(pady=5)
+
+    def iniciar_calculo_auto(self):
+        if not self.runner.has_inputs():
+            messagebox.showwarning("Aviso", "Não foi encontrado um arquivo FDF ou PSF na pasta do script. O aplicativo será fechado.")
+            self.root.destroy()
+            return
+            
+        restarting = self.runner.state_data and self.runner.config_data["auto_restart_enabled"]
+        self.iniciar_calculo(restarting=restarting)
+
+    def iniciar_calculo(self, restarting=False):
+        started = self.runner.iniciar_calculo(restarting=restarting)
+        self.restarts_label.config(text=f"Reinícios: {self.runner.restarts}")
+        if started:
+            self.stop_button.config(state=tk.NORMAL)
+            self.monitor_process()
+            self.sample_resources()
+        else:
+            self.stop_button.config(state=tk.DISABLED)
+
+    def interromper_calculo(self):
+        message = self.runner.interromper_calculo()
+        if message:
+            messagebox.showinfo("Interrompido", message)
+            self.stop_button.config(state=tk.DISABLED)
         else:
             messagebox.showwarning("Aviso", "Nenhum cálculo em andamento para interromper.")
 
     def monitor_process(self):
-        if self.siesta_process and self.siesta_process.poll() is None:
-            self.after(1000, self.monitor_process)
+        """Registra o pidfd do Siesta no laço do Tk; o fim do processo chama ``on_process_exit``."""
+        self.pidfd = open_pidfd(self.runner.siesta_process)
+        if self.pidfd is not None:
+            try:
+                self.root.tk.createfilehandler(self.pidfd, tk.READABLE, lambda fd, mask: self.on_process_exit())
+                return
+            except (AttributeError, tk.TclError):
+                os.close(self.pidfd)
+                self.pidfd = None
+        self.poll_process()
+
+    def sample_resources(self):
+        """Amostra a árvore do Siesta para o metricas.json, como o ``watch`` do modo headless."""
+        if self.runner.is_running():
+            self.runner.sampler.sample(self.runner.siesta_process)
+            interval = self.runner.config_data["metrics_interval"] or 30
+            self.root.after(int(interval * 1000), self.sample_resources)
+
+    def poll_process(self):
+        # Sem pidfd (ou sem createfilehandler, como no Windows): verificação periódica.
+        if self.runner.is_running():
+            self.root.after(200, self.poll_process)
         else:
-            self.stop_button.config(state=tk.DISABLED)
-            if self.output_file_handle:
-                self.output_file_handle.close()
-            
-            time.sleep(1) # Aguarda um pouco para o arquivo ser salvo completamente
+            self.on_process_exit()
 
-            if self.fdf_path:
-                output_folder = os.getcwd()
-                fdf_name = os.path.basename(self.fdf_path)
-                status = check_calculation_status(output_folder, fdf_name)
-                
-                if status == "completed":
-                    concluido_file_path = os.path.join(output_folder, "concluido.txt")
-                    try:
-                        with open(concluido_file_path, "w") as f:
-                            f.write("O cálculo Siesta foi concluído com sucesso.\n")
-                            f.write(f"Data e hora de conclusão: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    except Exception as e:
-                        print(f"Erro: Não foi possível criar o arquivo concluido.txt. Erro: {e}")
-                    finally:
-                        self.destroy()
+    def on_process_exit(self):
+        if self.pidfd is not None:
+            self.root.tk.deletefilehandler(self.pidfd)
+            os.close(self.pidfd)
+            self.pidfd = None
+        self.stop_button.config(state=tk.DISABLED)
+        if self.runner.siesta_process is not None:
+            self.runner.siesta_process.wait()
+            status = self.runner.finalizar()
+            self.runner.write_metrics()
+            if status == "completed":
+                self.root.destroy()
 
 # --- Ponto de Entrada Principal ---
+def main(argv):
+    # Com --headless (ou sem display) o Tk nem chega a ser importado.
+    headless = "--headless" in argv or (sys.platform.startswith("linux") and not os.environ.get("DISPLAY"))
+    if headless:
+        return SiestaRunner().run()
+
+    global tk, messagebox
+    import tkinter as tk
+    from tkinter import messagebox
+
+    root = tk.Tk()
+    SiestaApp(root)
+    root.mainloop()
+    return 0
+
 if __name__ == "__main__":
-    app = SiestaApp()
-    app.mainloop()
+    sys.exit(main(sys.argv[1:]))
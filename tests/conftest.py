@@ -0,0 +1,115 @@
+"""
+Fixtures dos testes de execução distribuída: um SIESTA falso no PATH e uma
+varredura pequena com o FDF e o PSF da pasta teste/.
+
+O SIESTA falso lê o FDF da entrada padrão, escreve no .out a geometria final,
+a energia e o ">> End of run" que o siesta.py procura, e anota em
+``FAKE_SIESTA_RUNS`` o nome da pasta de cada execução, para os testes contarem
+quantas vezes cada campo rodou.
+"""
+
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+OMNI_CLI = REPO_DIR / "omni_cli.py"
+CLI_TIMEOUT = 180
+sys.path.insert(0, str(REPO_DIR))
+
+FAKE_SIESTA = r'''
+import os
+import re
+import sys
+import time
+
+fdf = sys.stdin.read()
+field = re.search(r"%block ExternalElectricField\s*\n\s*(\S+)\s+(\S+)\s+(\S+)", fdf)
+ez = float(field.group(3)) if field else 0.0
+label = re.search(r"^\s*SystemLabel\s+(\S+)", fdf, re.M | re.I)
+label = label.group(1) if label else "siesta"
+time.sleep(float(os.environ.get("FAKE_SIESTA_SLEEP", "0.2")))
+
+print("   scf:    1   -300.0\n   scf:    2   -300.0")
+print("outcoor: Relaxed atomic coordinates (Ang):")
+print(f"    0.00000000    0.00000000    {ez:.8f}   1       1  C_gga")
+print(f"    1.42800000    0.00000000    {ez:.8f}   1       2  C_gga")
+print("\noutcell: Unit cell vectors (Ang):")
+print("        2.130424    1.230000    0.000000\n        2.130424   -1.230000    0.000000\n        0.000000    0.000000   20.000000")
+print("\nsiesta: Final energy (eV):")
+print(f"siesta:         Total =    {-300.0 - ez:.6f}")
+print(">> End of run")
+with open(f"{label}.DM", "w") as f:
+    f.write("dm")
+with open(os.environ["FAKE_SIESTA_RUNS"], "a") as f:
+    f.write(os.path.basename(os.getcwd()) + "\n")
+'''
+
+
+@pytest.fixture
+def fake_siesta(tmp_path, monkeypatch):
+    """Instala o SIESTA falso no PATH; retorna o arquivo com as pastas executadas."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "siesta"
+    script.write_text(f"#!{sys.executable}\n{FAKE_SIESTA}")
+    script.chmod(0o755)
+    runs = tmp_path / "execucoes.log"
+    runs.touch()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("FAKE_SIESTA_RUNS", str(runs))
+    for name in ("OMNI_SCRATCH_DIR", "OMNI_CACHE_DIR", "OMNI_CLUSTER_TOKEN", "OMNI_METRICS_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    return runs
+
+
+@pytest.fixture
+def sweep_spec(tmp_path):
+    """Especificação de uma varredura de 6 campos em z, sem cache de resultados."""
+    spec = {
+        "fdf_path": str(REPO_DIR / "teste" / "Gr.fdf"),
+        "psf_files": [str(REPO_DIR / "teste" / "C_gga.psf")],
+        "siesta_python_path": str(REPO_DIR / "siesta.py"),
+        "axes": {"z": [0.0, 0.5, 0.1]},
+        "total_cores": 2,
+        "cores_per_job": 1,
+        "pin_cpus": False,
+        "chain_mode": "independent",
+        "result_cache": False
+    }
+    path = tmp_path / "varredura.json"
+    path.write_text(json.dumps(spec))
+    return path
+
+
+def start_cli(work_dir, *args):
+    """Inicia ``omni_cli.py`` em outro processo, com ``work_dir`` como pasta de trabalho."""
+    Path(work_dir).mkdir(parents=True, exist_ok=True)
+    return subprocess.Popen([sys.executable, str(OMNI_CLI), "--work-dir", str(work_dir)] + [str(arg) for arg in args],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def finish_cli(process):
+    """Espera o processo e retorna ``(código de saída, log)``; mata-o se passar de ``CLI_TIMEOUT``."""
+    try:
+        output, _ = process.communicate(timeout=CLI_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        output, _ = process.communicate()
+        pytest.fail(f"omni_cli.py não terminou em {CLI_TIMEOUT} s:\n{output}")
+    return process.returncode, output
+
+
+def field_dirs(work_dir):
+    return sorted(Path(work_dir).glob("electric_field_calculations/E_*"))
+
+
+def run_counts(runs):
+    counts = {}
+    for name in runs.read_text().split():
+        counts[name] = counts.get(name, 0) + 1
+    return counts
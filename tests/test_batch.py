@@ -0,0 +1,65 @@
+"""Job array no gerenciador falso (``omni_fake_scheduler.py``) e consultas à fila que falham."""
+
+import sys
+import json
+import time
+
+import pytest
+
+from conftest import field_dirs, finish_cli, run_counts, start_cli
+from omni_batch import BatchRun
+from omni_engine import SweepEngine
+
+
+def test_fake_job_array_runs_each_field_once(tmp_path, fake_siesta, sweep_spec, monkeypatch):
+    spool = tmp_path / "spool"
+    monkeypatch.setenv("OMNI_FAKE_SPOOL", str(spool))
+    spec = json.loads(sweep_spec.read_text())
+    spec["batch"] = {"backend": "fake", "max_parallel": 2, "poll_interval": 1}
+    sweep_spec.write_text(json.dumps(spec))
+
+    work_dir = tmp_path / "varredura"
+    code, output = finish_cli(start_cli(work_dir, "run", sweep_spec, "--prepare"))
+    assert code == 0, output
+
+    dirs = field_dirs(work_dir)
+    assert len(dirs) == 6
+    assert run_counts(fake_siesta) == {field_dir.name: 1 for field_dir in dirs}
+    assert all((field_dir / "concluido.txt").exists() for field_dir in dirs)
+    jobs = [json.loads(path.read_text()) for path in spool.glob("*.json")]
+    assert len(jobs) == 1 and len(jobs[0]["tasks"]) == 6
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+FAILING = python_command("import sys; sys.exit('slurm_load_jobs error: Socket timed out')")
+EMPTY = python_command("pass")
+
+
+@pytest.mark.parametrize("status_command, accounting_command", [
+    (FAILING, FAILING),                          # controlador fora do ar
+    (EMPTY, python_command("print('RUNNING')")),  # squeue vazio, mas o job segue ativo
+    (EMPTY, FAILING),
+])
+def test_unconfirmed_empty_queue_finishes_no_task(tmp_path, status_command, accounting_command):
+    engine = SweepEngine(tmp_path)
+    engine.state.fields = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.1]]
+    engine.state.batch = {"backend": "slurm", "status_command": status_command,
+                          "accounting_command": accounting_command, "poll_interval": 0,
+                          "job_id": "42", "indices": [0, 1], "submitted_at": time.time()}
+    engine.is_running = True
+    batch = BatchRun(engine)
+    polls = []
+
+    def sleep(seconds):
+        polls.append(seconds)
+        if len(polls) == 3:
+            engine.is_running = False
+    batch.sleep = sleep
+
+    assert batch.track([0, 1], [tmp_path / "E_0", tmp_path / "E_1"]) is False
+    assert len(polls) == 3
+    assert not any(engine.state.is_completed(index) for index in (0, 1))
+    assert engine.state.batch["job_id"] == "42"
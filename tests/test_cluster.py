@@ -0,0 +1,47 @@
+"""Coordenador (``run --listen``) e dois agentes na mesma máquina, por TCP em 127.0.0.1."""
+
+import socket
+
+from conftest import field_dirs, finish_cli, run_counts, start_cli
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def test_coordinator_runs_each_field_once_on_loopback_agents(tmp_path, fake_siesta, sweep_spec):
+    address = f"127.0.0.1:{free_port()}"
+    coordinator_dir = tmp_path / "coordenador"
+    coordinator = start_cli(coordinator_dir, "run", sweep_spec, "--listen", address, "--token", "segredo")
+    agents = [start_cli(tmp_path / f"agente{n}", "agent", address, "--cores", 1,
+                        "--worker-id", f"agente{n}", "--token", "segredo")
+              for n in (1, 2)]
+
+    for agent in agents:
+        code, output = finish_cli(agent)
+        assert code == 0, output
+    code, output = finish_cli(coordinator)
+    assert code == 0, output
+
+    dirs = field_dirs(coordinator_dir)
+    assert len(dirs) == 6
+    assert run_counts(fake_siesta) == {field_dir.name: 1 for field_dir in dirs}
+    # As saídas voltam dos agentes para as pastas do coordenador.
+    for field_dir in dirs:
+        assert (field_dir / "concluido.txt").exists()
+        assert "End of run" in (field_dir / "Gr.out").read_text()
+    assert (coordinator_dir / "electric_field_calculations" / "results.sqlite").exists()
+
+
+def test_agent_with_wrong_token_is_refused(tmp_path, fake_siesta, sweep_spec):
+    address = f"127.0.0.1:{free_port()}"
+    coordinator = start_cli(tmp_path / "coordenador", "run", sweep_spec, "--listen", address, "--token", "segredo")
+    try:
+        code, output = finish_cli(start_cli(tmp_path / "intruso", "agent", address, "--token", "errado"))
+        assert code == 1
+        assert run_counts(fake_siesta) == {}
+    finally:
+        coordinator.kill()
+        coordinator.communicate()
@@ -0,0 +1,96 @@
+"""``FdfDocument``: leitura única, índice por rótulo e reescrita do FDF de exemplo."""
+
+from conftest import REPO_DIR
+from omni_fdf import FdfDocument, field_block_body, write_text_atomic
+
+GR_FDF = REPO_DIR / "teste" / "Gr.fdf"
+
+
+def gr_document():
+    return FdfDocument.from_file(GR_FDF)
+
+
+def test_unchanged_document_renders_byte_for_byte():
+    assert gr_document().render() == GR_FDF.read_text(encoding='utf-8')
+
+
+def test_labels_ignore_case_dots_and_underscores():
+    document = gr_document()
+    assert document.get("systemlabel") == "Gr"
+    assert document.get("dm.mixing_weight") == "0.10"
+    assert document.get("Spin") is None  # comentado no arquivo
+    assert len(document.get_block("latticevectors").data_lines()) == 3
+    assert document.get_block("KGRID.Monkhorst-Pack") is not None
+    assert document.get_block("MM.Potentials") is None  # bloco comentado não é ativo
+
+
+def test_set_block_reactivates_commented_block_in_place():
+    document = gr_document()
+    document.set_block("ExternalElectricField", field_block_body((0.0, 0.0, 0.25)))
+    text = document.render()
+
+    assert "#%block ExternalElectricField" not in text
+    assert "%block ExternalElectricField\n    0.000000 0.000000 0.250000 V/Ang\n%endblock ExternalElectricField\n" in text
+    assert text.index("# -- ELECTRIC FIELD --") < text.index("%block ExternalElectricField") < text.index("# -- BAND-STRUCTURE")
+    assert FdfDocument.from_text(text).get_block("externalelectricfield").data_lines() == \
+        ["    0.000000 0.000000 0.250000 V/Ang\n"]
+
+
+def test_set_block_replaces_only_the_body():
+    document = gr_document()
+    document.set_block("LatticeVectors", ["1 0 0", "0 1 0", "0 0 30"])
+    original = GR_FDF.read_text(encoding='utf-8').splitlines()
+    changed = document.render().splitlines()
+
+    assert len(changed) == len(original)
+    assert [i for i, (a, b) in enumerate(zip(original, changed)) if a != b] == \
+        [original.index("%block LatticeVectors") + n for n in (1, 2, 3)]
+
+
+def test_set_block_appends_missing_block_at_start_or_end():
+    text = "# cabeçalho\n\nSystemLabel Gr\nNumberOfAtoms 2"
+    at_end = FdfDocument.from_text(text)
+    at_end.set_block("ExternalElectricField", ["0 0 1 V/Ang"], comment="# campo")
+    assert at_end.render() == text + "\n\n# campo\n%block ExternalElectricField\n0 0 1 V/Ang\n%endblock ExternalElectricField\n"
+
+    at_start = FdfDocument.from_text(text)
+    at_start.set_block("ExternalElectricField", ["0 0 1 V/Ang"], at_start=True)
+    assert at_start.render().startswith("# cabeçalho\n\n%block ExternalElectricField\n0 0 1 V/Ang\n%endblock")
+
+
+def test_set_option_replaces_the_line_or_appends():
+    document = gr_document()
+    document.set("MD.NumCGsteps", 0)
+    document.set("Diag.ParallelOverK", "true")
+    reparsed = FdfDocument.from_text(document.render())
+    assert reparsed.get("md.numcgsteps") == "0"
+    assert reparsed.get("Diag.ParallelOverK") == "true"
+    assert document.render().count("MD.NumCGsteps") == 1
+
+
+def test_block_variants_match_set_block_and_leave_template_untouched():
+    document = gr_document()
+    bodies = [field_block_body((0.0, 0.0, ez)) for ez in (0.0, 0.1, -0.2)]
+    variants = list(document.block_variants("ExternalElectricField", bodies))
+
+    for body, variant in zip(bodies, variants):
+        expected = gr_document()
+        expected.set_block("ExternalElectricField", body)
+        assert variant == expected.render()
+    assert document.render() == GR_FDF.read_text(encoding='utf-8')
+
+
+def test_copy_is_independent():
+    document = gr_document()
+    clone = document.copy()
+    clone.get_block("LatticeVectors").body.append("   9 9 9\n")
+    clone.set("SystemLabel", "Outro")
+    assert document.render() == GR_FDF.read_text(encoding='utf-8')
+
+
+def test_write_text_atomic_leaves_no_temporary(tmp_path):
+    target = tmp_path / "Gr.fdf"
+    target.write_text("antigo")
+    write_text_atomic(target, "novo\n")
+    assert target.read_text() == "novo\n"
+    assert [path.name for path in tmp_path.iterdir()] == ["Gr.fdf"]
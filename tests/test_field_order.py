@@ -0,0 +1,56 @@
+"""Modos de ordenação dos campos e distância de cada salto entre execuções."""
+
+import math
+
+import pytest
+
+from omni_engine import ORDER_MODES, build_warm_start_parents, field_hop_distances, field_order_permutation, generate_fields
+
+GRID_4X4 = {"x": [0.0, 0.3, 0.1], "y": [0.0, 0.3, 0.1]}
+GRID_3X3X3 = {"x": [-0.1, 0.1, 0.1], "y": [-0.1, 0.1, 0.1], "z": [-0.1, 0.1, 0.1]}
+STEP = 0.1
+
+
+def consecutive_hops(fields):
+    return field_hop_distances(fields, build_warm_start_parents(fields, "serial"))[1:]
+
+
+def as_set(fields):
+    return {tuple(round(v, 6) for v in field) for field in fields}
+
+
+@pytest.mark.parametrize("mode", sorted(ORDER_MODES))
+@pytest.mark.parametrize("axes", [GRID_4X4, GRID_3X3X3, {"z": [0.0, 0.5, 0.1]}])
+def test_every_mode_is_a_permutation_of_the_grid(mode, axes):
+    cartesian = generate_fields(axes)
+    ordered = generate_fields(axes, order=mode)
+    assert len(ordered) == len(cartesian)
+    assert as_set(ordered) == as_set(cartesian)
+    assert sorted(field_order_permutation(cartesian, mode)) == list(range(len(cartesian)))
+
+
+def test_cartesian_jumps_back_at_each_row():
+    assert max(consecutive_hops(generate_fields(GRID_4X4))) > 3 * STEP
+
+
+@pytest.mark.parametrize("mode, axes", [("serpentine", GRID_4X4), ("serpentine", GRID_3X3X3), ("hilbert", GRID_4X4)])
+def test_space_filling_orders_move_one_grid_step_at_a_time(mode, axes):
+    hops = consecutive_hops(generate_fields(axes, order=mode))
+    assert all(math.isclose(hop, STEP, rel_tol=1e-6) for hop in hops)
+
+
+def test_nearest_starts_at_zero_field():
+    ordered = generate_fields(GRID_3X3X3, order="nearest")
+    assert as_set(ordered[:1]) == {(0.0, 0.0, 0.0)}
+    assert all(math.isclose(hop, STEP, rel_tol=1e-6) for hop in consecutive_hops(ordered)[:5])
+
+
+def test_hop_distances_follow_warm_start_parents():
+    fields = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.3], [0.0, 0.4, 0.0]]
+    assert field_hop_distances(fields, {0: None, 1: 0, 2: 1}) == pytest.approx([None, 0.3, 0.5])
+    assert field_hop_distances(fields, build_warm_start_parents(fields, "independent")) == [None, None, None]
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        field_order_permutation(generate_fields(GRID_4X4), "espiral")
@@ -0,0 +1,105 @@
+"""``read_last_structure`` contra o parser sequencial que ele substituiu."""
+
+import pytest
+
+from omni_engine import read_last_structure
+
+
+def sequential_parse(out_file_path, num_vectors):
+    """Parser linha a linha de antes (``readlines`` e máquina de estados), como referência."""
+    with open(out_file_path, 'r') as arquivo:
+        linhas = arquivo.readlines()
+
+    coordenadas_bloco_final = []
+    vetores_bloco_final = []
+    current_coor_block_lines = []
+    current_cell_block_lines = []
+    status = "unrelaxed"
+    state = 0
+    cell_vector_counter = 0
+
+    for linha in linhas:
+        if 'outcoor: Relaxed atomic coordinates (Ang):' in linha:
+            current_coor_block_lines = []
+            state = 1
+            status = "relaxed"
+        elif 'outcoor: Final atomic coordinates (unrelaxed) (Ang):' in linha:
+            current_coor_block_lines = []
+            state = 1
+            status = "unrelaxed"
+        elif state == 1:
+            if 'outcell: Unit cell vectors (Ang):' in linha:
+                processed_coor = []
+                for line in current_coor_block_lines:
+                    if 'outcoor:' not in line and line.strip():
+                        parts = line.split()
+                        if len(parts) >= 4:
+                            processed_coor.append(' '.join(parts[:4]))
+                coordenadas_bloco_final = processed_coor
+                current_cell_block_lines = []
+                cell_vector_counter = 0
+                state = 2
+            else:
+                current_coor_block_lines.append(linha)
+        elif state == 2:
+            if cell_vector_counter < num_vectors:
+                current_cell_block_lines.append(linha)
+                cell_vector_counter += 1
+            else:
+                vetores_bloco_final = [line.lstrip() for line in current_cell_block_lines
+                                       if 'outcell:' not in line and line.strip()]
+                state = 0
+
+    if state == 2:
+        vetores_bloco_final = [line.lstrip() for line in current_cell_block_lines
+                               if 'outcell:' not in line and line.strip()]
+    return vetores_bloco_final, coordenadas_bloco_final, status
+
+
+def structure_block(header, z, cell_z=20.0):
+    return (f"{header}\n"
+            f"    0.00000000    0.00000000    {z:.8f}   1       1  C_gga\n"
+            f"    1.42800000    0.00000000    {z:.8f}   1       2  C_gga\n"
+            "\noutcell: Unit cell vectors (Ang):\n"
+            "        2.130424    1.230000    0.000000\n"
+            "        2.130424   -1.230000    0.000000\n"
+            f"        0.000000    0.000000   {cell_z:.6f}\n\n")
+
+
+RELAXED = "outcoor: Relaxed atomic coordinates (Ang):"
+UNRELAXED = "outcoor: Final atomic coordinates (unrelaxed) (Ang):"
+SCF = "   scf:    1   -300.0\n   scf:    2   -300.1\n"
+
+OUT_FILES = {
+    "vazio": "",
+    "sem_estrutura": SCF + ">> End of run\n",
+    "um_bloco": SCF + structure_block(RELAXED, 0.1) + ">> End of run\n",
+    "varios_blocos": "".join(SCF + structure_block(RELAXED, 0.1 * step, 20.0 + step) for step in range(5)),
+    "ultimo_nao_relaxado": SCF + structure_block(RELAXED, 0.1) + SCF + structure_block(UNRELAXED, 0.2),
+    # Interrompido depois do cabeçalho: status do último, geometria do bloco completo anterior.
+    "truncado_antes_do_outcell": structure_block(RELAXED, 0.1) + UNRELAXED + "\n    0.0 0.0",
+    "truncado_nos_vetores": structure_block(RELAXED, 0.1) + RELAXED + "\n  0.0 0.0 0.3 1 1 C\n"
+                            "outcell: Unit cell vectors (Ang):\n        2.130424    1.230000    0.000000",
+    "sem_nova_linha_final": structure_block(RELAXED, 0.3).rstrip("\n"),
+}
+
+
+@pytest.mark.parametrize("name", sorted(OUT_FILES))
+def test_matches_sequential_parser(tmp_path, name):
+    out_file = tmp_path / "Gr.out"
+    out_file.write_text(OUT_FILES[name])
+    # Três vetores, como no bloco LatticeVectors de qualquer FDF.
+    assert read_last_structure(out_file, 3) == sequential_parse(out_file, 3)
+
+
+def test_last_block_is_returned(tmp_path):
+    out_file = tmp_path / "Gr.out"
+    out_file.write_text(OUT_FILES["varios_blocos"])
+    vetores, coordenadas, status = read_last_structure(out_file, 3)
+    assert status == "relaxed"
+    assert coordenadas == ["0.00000000 0.00000000 0.40000000 1", "1.42800000 0.00000000 0.40000000 1"]
+    assert vetores[-1] == "0.000000    0.000000   24.000000\n"
+
+
+def test_missing_file_is_unrelaxed(tmp_path):
+    assert read_last_structure(tmp_path / "ausente.out", 3) == (None, None, "unrelaxed")
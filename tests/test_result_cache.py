@@ -0,0 +1,74 @@
+"""Cache de resultados compartilhado entre varreduras (``OMNI_CACHE_DIR``)."""
+
+import json
+import shutil
+
+from conftest import REPO_DIR, field_dirs, finish_cli, run_counts, start_cli
+from omni_engine import SweepEngine
+
+
+def cached_spec(sweep_spec, path, **changes):
+    spec = json.loads(sweep_spec.read_text())
+    spec.update(result_cache=True, **changes)
+    path.write_text(json.dumps(spec))
+    return path
+
+
+def run_sweep(work_dir, spec):
+    code, output = finish_cli(start_cli(work_dir, "run", spec, "--prepare"))
+    assert code == 0, output
+    return output
+
+
+def total_runs(fake_siesta):
+    return sum(run_counts(fake_siesta).values())
+
+
+def test_overlapping_sweep_runs_only_new_fields(tmp_path, fake_siesta, sweep_spec, monkeypatch):
+    monkeypatch.setenv("OMNI_CACHE_DIR", str(tmp_path / "cache"))
+    run_sweep(tmp_path / "a", cached_spec(sweep_spec, tmp_path / "a.json"))
+    assert total_runs(fake_siesta) == 6
+
+    # Mesmos 6 campos e mais dois: só os novos chamam o SIESTA.
+    run_sweep(tmp_path / "b", cached_spec(sweep_spec, tmp_path / "b.json", axes={"z": [0.0, 0.7, 0.1]}))
+    assert total_runs(fake_siesta) == 8
+    assert sorted(run_counts(fake_siesta)) == sorted(path.name for path in field_dirs(tmp_path / "b"))
+
+    for field_dir in field_dirs(tmp_path / "b"):
+        assert (field_dir / "concluido.txt").exists()
+        assert "End of run" in (field_dir / "Gr.out").read_text()
+
+
+def test_changed_pseudopotential_misses_the_cache(tmp_path, fake_siesta, sweep_spec, monkeypatch):
+    monkeypatch.setenv("OMNI_CACHE_DIR", str(tmp_path / "cache"))
+    psf = tmp_path / "C_gga.psf"
+    shutil.copy(REPO_DIR / "teste" / "C_gga.psf", psf)
+    spec = cached_spec(sweep_spec, tmp_path / "spec.json", psf_files=[str(psf)])
+
+    run_sweep(tmp_path / "a", spec)
+    psf.write_text(psf.read_text() + "\n")
+    run_sweep(tmp_path / "b", spec)
+    assert total_runs(fake_siesta) == 12
+
+
+def test_cached_outputs_are_unlinked_before_a_rerun(tmp_path, fake_siesta, sweep_spec, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("OMNI_CACHE_DIR", str(cache_dir))
+    spec = cached_spec(sweep_spec, tmp_path / "spec.json")
+    run_sweep(tmp_path / "a", spec)
+    run_sweep(tmp_path / "b", spec)
+
+    field_dir = field_dirs(tmp_path / "b")[0]
+    restored = field_dir / "Gr.out"
+    assert restored.stat().st_nlink > 1  # hardlink da entrada do cache
+    cached_text = restored.read_text()
+
+    engine = SweepEngine(tmp_path / "b")
+    engine.state.psf_files = json.loads(spec.read_text())["psf_files"]
+    engine.state.siesta_python_path = str(REPO_DIR / "siesta.py")
+    engine.break_output_links(field_dir)
+    assert not restored.exists()
+    assert list(field_dir.glob("*.fdf")) and (field_dir / "C_gga.psf").exists()
+    # Reescrever a pasta não altera mais o cache.
+    restored.write_text("nova execução")
+    assert any(path.read_text() == cached_text for path in cache_dir.glob("*/Gr.out"))
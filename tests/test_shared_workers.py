@@ -0,0 +1,32 @@
+"""Dois workers (``run --worker``) dividindo a mesma pasta de varredura."""
+
+import os
+import json
+import time
+
+from conftest import field_dirs, finish_cli, run_counts, start_cli
+from omni_engine import CLAIM_FILE
+
+
+def test_workers_take_over_stale_claim_and_run_each_field_once(tmp_path, fake_siesta, sweep_spec):
+    work_dir = tmp_path / "varredura"
+    code, output = finish_cli(start_cli(work_dir, "prepare", sweep_spec))
+    assert code == 0, output
+    dirs = field_dirs(work_dir)
+    assert len(dirs) == 6
+
+    # Reserva de um worker que morreu há uma hora: sem heartbeat além do lease.
+    stale_claim = dirs[0] / CLAIM_FILE
+    stale_claim.write_text(json.dumps({"worker": "morto", "host": "no-morto", "pid": 1}))
+    an_hour_ago = time.time() - 3600
+    os.utime(stale_claim, (an_hour_ago, an_hour_ago))
+
+    workers = [start_cli(work_dir, "run", sweep_spec, "--worker", "--worker-id", worker_id, "--lease", 60)
+               for worker_id in ("A", "B")]
+    for worker in workers:
+        code, output = finish_cli(worker)
+        assert code == 0, output
+
+    assert run_counts(fake_siesta) == {field_dir.name: 1 for field_dir in dirs}
+    assert all((field_dir / "concluido.txt").exists() for field_dir in dirs)
+    assert not any((field_dir / CLAIM_FILE).exists() for field_dir in dirs)
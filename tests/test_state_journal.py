@@ -0,0 +1,97 @@
+"""Diário de eventos por campo: replay, linhas truncadas, compactação e retomada."""
+
+import json
+
+from omni_engine import StateJournal, SweepEngine
+
+FIELDS = [[0.0, 0.0, 0.0], [0.0, 0.0, 0.1], [0.0, 0.0, 0.2]]
+
+
+def journal_lines(path):
+    return path.read_text().splitlines()
+
+
+def test_replay_keeps_the_last_event_of_each_field(tmp_path):
+    journal = StateJournal(tmp_path / "journal.jsonl")
+    journal.record("start", 0, FIELDS[0])
+    journal.record("fail", 0, FIELDS[0], error="travou")
+    journal.record("start", 0, FIELDS[0])
+    journal.record("finish", 0, FIELDS[0], scf={"total": 12})
+    journal.record("start", 1, FIELDS[1])
+    # Um "start" atrasado (outro worker) não desfaz a conclusão.
+    journal.record("start", 0, FIELDS[0])
+
+    events = StateJournal(tmp_path / "journal.jsonl").replay()
+    assert {index: event["event"] for index, event in events.items()} == {0: "finish", 1: "start"}
+    assert events[0]["scf"] == {"total": 12}
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = StateJournal(path)
+    journal.record("finish", 0, FIELDS[0])
+    journal.record("start", 1, FIELDS[1])
+    with open(path, 'a') as f:
+        f.write('{"t": 1e12, "event": "finish", "index": 1, "fie')
+
+    events = StateJournal(path).replay()
+    assert events[1]["event"] == "start"
+
+
+def test_compaction_rewrites_one_line_per_field(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = StateJournal(path, compact_every=7)
+    for index, field in enumerate(FIELDS):
+        journal.record("start", index, field)
+        journal.record("finish", index, field)
+    assert len(journal_lines(path)) == 6
+    before = StateJournal(path).replay()
+
+    journal.record("start", 0, FIELDS[0])  # 7º evento: compacta
+    assert len(journal_lines(path)) == 3
+    assert StateJournal(path).replay() == before
+
+    journal.record("fail", 1, FIELDS[1])  # continua anexando depois da compactação
+    assert len(journal_lines(path)) == 4
+    assert StateJournal(path).replay()[1]["event"] == "fail"
+
+
+def test_read_new_returns_only_new_events_and_survives_compaction(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    writer = StateJournal(path, compact_every=None)
+    reader = StateJournal(path)
+    writer.record("start", 0, FIELDS[0])
+    assert [entry["event"] for entry in reader.read_new()] == ["start"]
+    writer.record("finish", 0, FIELDS[0])
+    assert [entry["event"] for entry in reader.read_new()] == ["finish"]
+    assert reader.read_new() == []
+
+    writer.compact()
+    writer.record("start", 1, FIELDS[1])
+    assert {entry["index"] for entry in reader.read_new()} == {0, 1}
+
+
+def test_shared_journals_of_all_workers_are_merged(tmp_path):
+    workers_dir = tmp_path / ".omni_workers"
+    workers_dir.mkdir()
+    StateJournal(workers_dir / "journal.A.jsonl", compact_every=None, shared_dir=workers_dir).record("finish", 0, FIELDS[0])
+    StateJournal(workers_dir / "journal.B.jsonl", compact_every=None, shared_dir=workers_dir).record("finish", 2, FIELDS[2])
+
+    events = StateJournal(workers_dir / "journal.C.jsonl", shared_dir=workers_dir).replay()
+    assert sorted(events) == [0, 2]
+
+
+def test_load_state_resumes_from_out_of_order_completions(tmp_path):
+    engine = SweepEngine(tmp_path)
+    engine.state.fields = [list(field) for field in FIELDS]
+    engine.save_state()
+    engine.journal.record("finish", 2, FIELDS[2])
+    engine.journal.record("finish", 1, [0.0, 0.0, 0.7])  # outro vetor: de uma varredura anterior
+    engine.journal.record("start", 0, FIELDS[0])
+
+    resumed = SweepEngine(tmp_path)
+    assert resumed.load_state()
+    assert [resumed.state.is_completed(index) for index in range(3)] == [False, False, True]
+    # O replay compacta o diário: um evento por campo.
+    assert len(journal_lines(resumed.journal.path)) == 3
+    assert json.loads(journal_lines(resumed.journal.path)[2])["event"] == "finish"